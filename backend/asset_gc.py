@@ -0,0 +1,152 @@
+"""Garbage collection of orphaned uploads and generated files.
+
+Project documents are the only owners of assets. A file is live while at least
+one project references it by URL; uploaded files are content addressed and
+can be shared, so deleting a project only releases files that no other project
+still references and that are older than a grace period (a deduplicated
+re-upload restarts it). A periodic sweep catches everything else (abandoned uploads, failed
+generations) once it is older than the grace period. Cached reference
+copies count as used while a project still lists the image they were made from.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from storage import ASSET_KINDS, StorageBackend, asset_key
+
+logger = logging.getLogger(__name__)
+
+GC_BATCH_SIZE = 100
+GC_BATCH_PAUSE = 0.5
+# Uploads happen before the project that references them is created
+GC_GRACE_SECONDS = 6 * 60 * 60
+
+ASSET_FIELDS = ['images', 'generated_images', 'generated_videos', 'platform_variants']
+
+
+def asset_refs(project: dict) -> List[Tuple[str, str]]:
+    """(kind, filename) for every local asset URL a project document references"""
+    urls = list(project.get('images') or [])
+    urls += project.get('generated_images') or []
+    urls += project.get('generated_videos') or []
+    for variant in project.get('platform_variants') or []:
+        urls.append(variant.get('master', ''))
+        urls += (variant.get('sizes') or {}).values()
+
+    refs = []
+    for url in urls:
+        if not isinstance(url, str):
+            continue
+        for kind in ASSET_KINDS:
+            prefix = f"/api/{kind}/"
+            if url.startswith(prefix):
+                refs.append((kind, url[len(prefix):].split('?', 1)[0]))
+    return refs
+
+
+def derived_refs(project: dict) -> List[Tuple[str, str]]:
+    """Normalized reference copies made from the project's images; no document links to them"""
+    from references import reference_name
+    return [('references', reference_name(url)) for url in project.get('images') or [] if isinstance(url, str)]
+
+
+async def count_references(db) -> Counter:
+    counts: Counter = Counter()
+    projection = {"_id": 0, **{field: 1 for field in ASSET_FIELDS}}
+    async for project in db.projects.find({}, projection):
+        counts.update(set(asset_refs(project)) | set(derived_refs(project)))
+    return counts
+
+
+async def _delete_batched(storage: StorageBackend, keys: Iterable[Tuple[str, int]],
+                          batch_size: int, pause: float) -> Tuple[int, int]:
+    deleted = reclaimed = 0
+    for i, (key, size) in enumerate(keys, 1):
+        try:
+            await storage.delete(key)
+            deleted += 1
+            reclaimed += size
+        except Exception as e:
+            logger.error(f"GC could not delete {key}: {e}")
+        if i % batch_size == 0:
+            await asyncio.sleep(pause)
+    return deleted, reclaimed
+
+
+async def release_project_assets(db, storage: StorageBackend, project: dict,
+                                 grace_seconds: int = GC_GRACE_SECONDS) -> Dict[str, int]:
+    """Delete the files of a removed project that no remaining project references"""
+    # A shared upload handed out again within the grace period may belong to a project not saved yet;
+    # the periodic sweep deletes it later if nothing picks it up
+    cutoff = time.time() - grace_seconds
+    orphaned = []
+    for kind, filename in set(asset_refs(project)):
+        url = f"/api/{kind}/{filename}"
+        still_used = await db.projects.find_one(
+            {"$or": [
+                {"images": url},
+                {"generated_images": url},
+                {"generated_videos": url},
+                {"platform_variants.master": url},
+            ]},
+            {"_id": 0, "id": 1},
+        )
+        if still_used:
+            continue
+        stat = await storage.stat(asset_key(kind, filename))
+        if stat and stat.mtime <= cutoff:
+            orphaned.append((stat.key, stat.size))
+
+    deleted, reclaimed = await _delete_batched(storage, orphaned, GC_BATCH_SIZE, GC_BATCH_PAUSE)
+    if deleted:
+        logger.info(f"Released {deleted} assets ({reclaimed} bytes) of project {project.get('id')}")
+    return {"deleted": deleted, "reclaimed_bytes": reclaimed}
+
+
+async def run_gc(db, storage: StorageBackend, grace_seconds: int = GC_GRACE_SECONDS,
+                 batch_size: int = GC_BATCH_SIZE, pause: float = GC_BATCH_PAUSE,
+                 dry_run: bool = False) -> Dict[str, int]:
+    """Sweep storage for files no project references and delete them in throttled batches"""
+    started = time.monotonic()
+    refs = await count_references(db)
+    cutoff = time.time() - grace_seconds
+
+    scanned = 0
+    orphaned = []
+    for kind in ASSET_KINDS:
+        for obj in await storage.list(f"{kind}/"):
+            scanned += 1
+            filename = obj.key.rsplit('/', 1)[-1]
+            if refs.get((kind, filename)) or obj.mtime > cutoff:
+                continue
+            orphaned.append((obj.key, obj.size))
+
+    if dry_run:
+        deleted, reclaimed = 0, sum(size for _, size in orphaned)
+    else:
+        deleted, reclaimed = await _delete_batched(storage, orphaned, batch_size, pause)
+
+    report = {
+        "scanned": scanned,
+        "referenced": len(refs),
+        "orphaned": len(orphaned),
+        "deleted": deleted,
+        "reclaimed_bytes": reclaimed,
+        "duration_ms": int((time.monotonic() - started) * 1000),
+    }
+    logger.info(f"Asset GC report: {report}")
+    return report
+
+
+async def gc_loop(db, storage: StorageBackend, interval_seconds: int, startup_delay: Optional[float] = 60.0):
+    """Run the sweep forever at a fixed interval"""
+    if startup_delay:
+        await asyncio.sleep(startup_delay)
+    while True:
+        try:
+            await run_gc(db, storage)
+        except Exception as e:
+            logger.error(f"Asset GC failed: {e}")
+        await asyncio.sleep(interval_seconds)
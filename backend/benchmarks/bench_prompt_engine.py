@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: build image/video prompts for a batch of projects.
+
+Measures the cold path (templates compiled, prompt cache empty) and the warm
+path (same project revisions again, served from the memoized prompts).
+
+    python benchmarks/bench_prompt_engine.py --projects 2000 --variations 3
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import PSYCHOLOGICAL_STRATEGIES, PLATFORM_SIZES  # noqa: E402
+import prompt_engine  # noqa: E402
+
+
+def make_projects(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    projects = []
+    for i in range(count):
+        projects.append({
+            "id": f"bench-{i}",
+            "updated_at": "2025-01-01T00:00:00+00:00",
+            "company_name": f"Brand {i}",
+            "company_description": "متجر إلكتروني للمنتجات الطبيعية " * rng.randint(1, 4),
+            "strengths": [f"Strength {j}" for j in range(rng.randint(1, 5))],
+            "psychological_strategy_id": rng.choice(PSYCHOLOGICAL_STRATEGIES)["id"],
+            "platform": rng.choice(PLATFORM_SIZES)["id"],
+            "brand_colors": {"primary": "#FF6B35", "secondary": "#F7931E", "accent": "#FFD23F"},
+            "language": rng.choice(["ar", "en"]),
+        })
+    return projects
+
+
+def run_batch(projects: list, variations: int) -> int:
+    built = 0
+    for project in projects:
+        for v in range(1, variations + 1):
+            prompt_engine.build_advanced_image_prompt(project, variation=v)
+            built += 1
+        prompt_engine.build_advanced_video_prompt(project)
+        built += 1
+    return built
+
+
+def report(label: str, built: int, elapsed: float, projects: int):
+    print(f"{label:<6} {built:>8} prompts in {elapsed * 1000:8.1f} ms  "
+          f"{built / elapsed:>12,.0f} prompts/s  {projects / elapsed:>10,.0f} projects/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=2000)
+    parser.add_argument("--variations", type=int, default=3)
+    args = parser.parse_args()
+
+    projects = make_projects(args.projects)
+    prompt_engine.clear_prompt_cache()
+
+    start = time.perf_counter()
+    built = run_batch(projects, args.variations)
+    report("cold", built, time.perf_counter() - start, len(projects))
+
+    start = time.perf_counter()
+    built = run_batch(projects, args.variations)
+    report("warm", built, time.perf_counter() - start, len(projects))
+
+    info = prompt_engine.compile_image_template.cache_info()
+    print(f"compiled image templates: {info.currsize}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: scraping, brand analysis and prompt building on saved pages.
+
+Runs every case against the HTML corpus in benchmarks/corpus (network mocked),
+reports ops/sec and peak traced memory per call, and compares the results
+with benchmarks/baseline.json. A case that is slower or uses more memory than
+the baseline by more than --tolerance fails the run with exit status 1.
+
+    python benchmarks/bench_suite.py                  # run and compare
+    python benchmarks/bench_suite.py -k parse         # only cases matching "parse"
+    python benchmarks/bench_suite.py --save-baseline  # record a new baseline
+
+Baselines are machine specific; record one on the machine that runs the check.
+Every timing run of a case is paired with a run of a fixed pure-Python
+reference workload, and cases are compared by the median of those paired
+ratios ("relative"): a machine that slows down for a while (CPU steal, thermal
+throttling) slows both halves of a pair alike, so the check does not flap.
+The garbage collector is off while timing, as in timeit.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import caption_engine  # noqa: E402
+import keywords  # noqa: E402
+import prompt_engine  # noqa: E402
+import scraper  # noqa: E402
+
+BENCH_DIR = Path(__file__).resolve().parent
+CORPUS_DIR = BENCH_DIR / 'corpus'
+BASELINE_PATH = BENCH_DIR / 'baseline.json'
+
+# Memory growth below this is noise from interpreter caches, not a regression
+MEMORY_SLACK_BYTES = 16 * 1024
+
+
+def load_corpus() -> Dict[str, str]:
+    return {path.stem: path.read_text(encoding='utf-8') for path in sorted(CORPUS_DIR.glob('*.html'))}
+
+
+def make_project(language: str, revision: bool) -> dict:
+    project = {
+        "company_name": "عطور الشرق" if language == 'ar' else "Oak & Hide",
+        "company_description": "متجر إلكتروني للعطور الشرقية الفاخرة " * 3,
+        "strengths": ["Hand-made", "Free repairs", "Fast delivery"],
+        "psychological_strategy_id": "scarcity",
+        "platform": "post_square",
+        "brand_colors": {"primary": "#7A1F3D", "secondary": "#D4AF37", "accent": "#1F7A5C"},
+        "language": language,
+    }
+    if revision:
+        project.update(id="bench", updated_at="2025-01-01T00:00:00+00:00")
+    return project
+
+
+def build_cases(corpus: Dict[str, str]) -> List[Tuple[str, Callable[[], object]]]:
+    cases = []
+    loop = asyncio.new_event_loop()
+
+    for name, html in corpus.items():
+        url = f"https://www.{name}-shop.example/"
+        cases.append((f"parse_website[{name}]", lambda html=html, url=url: scraper.parse_website(html, url)))
+
+        async def fake_fetch(_url, html=html):
+            return html
+
+        def scrape(url=url, fake_fetch=fake_fetch):
+            real_fetch = scraper.fetch_html
+            scraper.fetch_html = fake_fetch
+            try:
+                return loop.run_until_complete(scraper.scrape_website_advanced(url))
+            finally:
+                scraper.fetch_html = real_fetch
+        cases.append((f"scrape_website_advanced[{name}]", scrape))
+
+        soup = BeautifulSoup(html, 'html.parser')
+        title = soup.title.string if soup.title else ""
+        cases.append((f"extract_brand_name[{name}]", lambda soup=soup, title=title, url=url: scraper.extract_brand_name(soup, title, url)))
+
+    css = '\n'.join(tag.string or '' for tag in BeautifulSoup(corpus['large'], 'html.parser').find_all('style'))
+    cases.append(("extract_colors_from_css[large]", lambda: scraper.extract_colors_from_css(css)))
+
+    for name in ('small', 'arabic'):
+        text = BeautifulSoup(corpus[name], 'html.parser').get_text(separator=' ', strip=True)[:2000]
+        cases.append((f"analyze_brand_voice[{name}]", lambda text=text: scraper.analyze_brand_voice(text)))
+
+    palette = scraper.extract_colors_from_css(css) + ['#000', 'not-a-color']
+    cases.append(("get_color_tone[palette]", lambda: [scraper.get_color_tone(c) for c in palette]))
+
+    # Document frequencies as if every corpus page had been scraped once
+    index = keywords.KeywordIndex()
+    texts = {name: scraper.parse_website(html, f"https://www.{name}-shop.example/").text for name, html in corpus.items()}
+    for text in texts.values():
+        index._apply(set(keywords.analyze(text)[0]), (), new_doc=True)
+    for name in ('arabic', 'large'):
+        cases.append((f"keywords.analyze[{name}]", lambda text=texts[name]: keywords.analyze(text)))
+        counts, forms = keywords.analyze(texts[name])
+        cases.append((f"KeywordIndex.top_keywords[{name}]", lambda c=counts, f=forms: index.top_keywords(c, f)))
+
+    for language in ('ar', 'en'):
+        fresh = make_project(language, revision=False)
+        cached = make_project(language, revision=True)
+        cases.append((f"build_advanced_image_prompt[{language}]", lambda p=fresh: prompt_engine.build_advanced_image_prompt(p, variation=2)))
+        cases.append((f"build_advanced_image_prompt[{language},memoized]", lambda p=cached: prompt_engine.build_advanced_image_prompt(p, variation=2)))
+        cases.append((f"build_captions[{language}]", lambda p=fresh: caption_engine.build_captions(p, 3)))
+        cases.append((f"build_captions[{language},memoized]", lambda p=cached: caption_engine.build_captions(p, 3)))
+    cases.append(("build_advanced_video_prompt[ar]", lambda p=make_project('ar', False): prompt_engine.build_advanced_video_prompt(p)))
+    return cases
+
+
+def reference_workload():
+    """Fixed interpreter-bound work (string, dict and sort operations) the cases are measured against"""
+    words = {str(i * 7919 % 1000): i for i in range(300)}
+    return sorted(words, key=lambda w: (len(w), w))
+
+
+def measure_speed(func: Callable[[], object], min_time: float, repeats: int) -> Tuple[float, float, float]:
+    """(best, median) ops/sec and the median paired ratio to reference_workload over `repeats` runs"""
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _timed_runs(func, min_time, repeats)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _calibrate(func: Callable[[], object], min_time: float) -> int:
+    """Calls of func that take about min_time seconds"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 5:
+            break
+        number *= 2
+    return max(1, int(number * (min_time / max(elapsed, 1e-9))))
+
+
+def _rate(func: Callable[[], object], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return number / (time.perf_counter() - start)
+
+
+def _timed_runs(func: Callable[[], object], min_time: float, repeats: int) -> Tuple[float, float, float]:
+    number = _calibrate(func, min_time)
+    reference_number = _calibrate(reference_workload, min_time / 2)
+    rates, ratios = [], []
+    for _ in range(repeats):
+        reference_rate = _rate(reference_workload, reference_number)
+        rate = _rate(func, number)
+        rates.append(rate)
+        ratios.append(rate / reference_rate)
+    return max(rates), statistics.median(rates), statistics.median(ratios)
+
+
+def measure_memory(func: Callable[[], object]) -> int:
+    """Peak traced allocation of one call, in bytes"""
+    func()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    failures = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        # Baselines recorded before the reference pairing only have absolute rates
+        field = 'relative' if 'relative' in base else 'ops_per_sec'
+        if result[field] < base[field] * (1 - tolerance):
+            failures.append(f"{name}: {result[field] / base[field] - 1:+.0%} {field} "
+                            f"({result['ops_per_sec']:,.0f} ops/s vs baseline {base['ops_per_sec']:,.0f})")
+        if result['peak_bytes'] > base['peak_bytes'] * (1 + tolerance) + MEMORY_SLACK_BYTES:
+            failures.append(f"{name}: peak {result['peak_bytes'] / 1024:,.1f} KiB vs baseline {base['peak_bytes'] / 1024:,.1f} KiB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="pattern", default="", help="only run cases whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing run")
+    parser.add_argument("--repeats", type=int, default=9)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown / memory growth (0.25 = 25%%)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    cases = [(name, func) for name, func in build_cases(load_corpus()) if args.pattern in name]
+    baseline = json.loads(args.baseline.read_text()).get('results', {}) if args.baseline.exists() else {}
+
+    results = {}
+    print(f"{'case':<48} {'ops/s':>12} {'median':>12} {'peak KiB':>10} {'vs base':>8}")
+    for name, func in cases:
+        best, median, relative = measure_speed(func, args.min_time, args.repeats)
+        peak = measure_memory(func)
+        results[name] = {
+            "ops_per_sec": round(best, 1), "median_ops_per_sec": round(median, 1),
+            "relative": round(relative, 6), "peak_bytes": peak,
+        }
+        base = baseline.get(name)
+        if base:
+            field = 'relative' if 'relative' in base else 'ops_per_sec'
+            delta = f"{(results[name][field] / base[field] - 1) * 100:+7.1f}%"
+        else:
+            delta = "     new"
+        print(f"{name:<48} {best:>12,.0f} {median:>12,.0f} {peak / 1024:>10,.1f} {delta:>8}")
+
+    if args.save_baseline:
+        merged = {**baseline, **results}
+        args.baseline.write_text(json.dumps({
+            "machine": f"{platform.machine()} {platform.processor() or ''}".strip(),
+            "python": platform.python_version(),
+            "results": dict(sorted(merged.items())),
+        }, indent=2, ensure_ascii=False) + "\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    failures = compare(results, baseline, args.tolerance)
+    if failures:
+        print(f"\nREGRESSION (tolerance {args.tolerance:.0%}):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    if baseline:
+        print(f"\nNo regressions against {args.baseline.name} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Load harness: the FastAPI app in-process under concurrent, mixed traffic.
+
+The app runs against an in-memory Motor-compatible store (memory_store.py),
+a temporary local storage root, a fake website fetcher serving the benchmark
+corpus and a fake kie.ai (create/poll/download) behind httpx. Requests go
+through httpx's ASGI transport, so nothing leaves the process and no MongoDB
+or network access is needed.
+
+Workers replay a weighted mix of auth, list, get, create, scrape, generate and
+catalog calls and the run reports throughput, latency percentiles per
+operation and event-loop lag (how late a 10 ms timer fires).
+
+    python benchmarks/load_harness.py --concurrency 32 --duration 20
+    python benchmarks/load_harness.py --mix list=60,create=20,generate=20 --db-latency 0.002
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+DEFAULT_MIX = {
+    "auth": 5,
+    "list": 35,
+    "get": 20,
+    "create": 12,
+    "scrape": 10,
+    "generate": 8,
+    "catalog": 10,
+}
+
+FAKE_CDN = "https://fake-cdn.local"
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, int]:
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_images(count: int, size: int) -> List[bytes]:
+    """Distinct generator outputs, so perceptual dedup keeps them apart"""
+    import numpy as np
+    from PIL import Image, ImageFilter
+
+    images = []
+    for seed in range(count):
+        rng = np.random.default_rng(seed)
+        noise = (rng.random((64, 64, 3)) * 255).astype('uint8')
+        image = Image.fromarray(noise).resize((size, size), Image.BICUBIC).filter(ImageFilter.GaussianBlur(4))
+        buf = io.BytesIO()
+        image.save(buf, 'PNG')
+        images.append(buf.getvalue())
+    return images
+
+
+class FakeKie:
+    """createTask / recordInfo / result download, with a fixed render time"""
+
+    def __init__(self, images: List[bytes], render_seconds: float):
+        self.images = images
+        self.render_seconds = render_seconds
+        self.tasks: Dict[str, float] = {}
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    async def handle(self, request):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        path = request.url.path
+        if path.endswith('/jobs/createTask'):
+            self.counts['create'] += 1
+            task_id = f"task{len(self.tasks)}"
+            self.tasks[task_id] = loop.time() + self.render_seconds
+            return httpx.Response(200, json={"code": 200, "data": {"taskId": task_id}})
+        if path.endswith('/jobs/recordInfo'):
+            self.counts['poll'] += 1
+            task_id = request.url.params.get('taskId')
+            if loop.time() < self.tasks.get(task_id, 0):
+                return httpx.Response(200, json={"code": 200, "data": {"state": "generating"}})
+            index = int(task_id[4:]) % len(self.images)
+            result = json.dumps({"resultUrls": [f"{FAKE_CDN}/img/{index}.png"]})
+            return httpx.Response(200, json={"code": 200, "data": {"state": "success", "resultJson": result}})
+        if request.url.host == 'fake-cdn.local' or path.endswith(('.png', '.jpg')):
+            self.counts['download'] += 1
+            index = int(Path(path).stem) if Path(path).stem.isdigit() else 0
+            return httpx.Response(200, content=self.images[index % len(self.images)],
+                                  headers={'content-type': 'image/png'})
+        return httpx.Response(404)
+
+
+def install_fakes(args, tmp_root: Path):
+    """Configure the environment, import the app and swap in the fakes"""
+    os.environ.update({
+        'MONGO_URL': 'mongodb://load-harness.invalid:27017',
+        'DB_NAME': 'load_harness',
+        'KIE_AI_API_KEY': 'fake',
+        'KIE_POLL_INTERVAL_SECONDS': str(args.poll_interval),
+        'GC_INTERVAL_SECONDS': '0',
+        'STORAGE_BACKEND': 'local',
+        'PUBLIC_BASE_URL': 'http://load-harness.local',
+        # Every worker comes from one address; measure the server, not the limiter
+        'RATE_LIMIT_ENABLED': '0',
+    })
+
+    import httpx
+    import logging
+
+    import scraper
+    import server
+    from memory_store import MemoryClient
+    from storage import LocalStorage
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    server.db = MemoryClient(latency=args.db_latency)['load_harness']
+    server.storage = LocalStorage(tmp_root / 'storage')
+    server.TMP_DIR = tmp_root / 'tmp'
+    server.TMP_DIR.mkdir(parents=True, exist_ok=True)
+
+    corpus = [p.read_text(encoding='utf-8') for p in sorted((BENCH_DIR / 'corpus').glob('*.html'))]
+
+    async def fake_fetch_html(url: str) -> str:
+        await asyncio.sleep(args.scrape_latency)
+        return corpus[zlib.crc32(url.encode()) % len(corpus)]
+    scraper.fetch_html = fake_fetch_html
+
+    kie = FakeKie(make_images(16, args.image_size), args.render_seconds)
+    upstream = httpx.MockTransport(kie.handle)
+    real_client = httpx.AsyncClient
+
+    class UpstreamClient(real_client):
+        """httpx.AsyncClient whose default transport is the fake upstream"""
+
+        def __init__(self, *a, **kw):
+            kw.setdefault('transport', upstream)
+            super().__init__(*a, **kw)
+
+    httpx.AsyncClient = UpstreamClient
+    return server, kie, real_client
+
+
+class Worker:
+    def __init__(self, wid: int, client, rng: random.Random, shared: dict):
+        self.wid = wid
+        self.client = client
+        self.rng = rng
+        self.shared = shared
+
+    def _project_id(self) -> Optional[str]:
+        ids = self.shared['project_ids']
+        return self.rng.choice(ids) if ids else None
+
+    async def auth(self):
+        # Demo mode has one shared user and each login drops its other sessions,
+        # so concurrent logins can make /auth/me fail for the loser of the race
+        response = await self.client.post('/api/auth/session', json={})
+        if response.status_code == 200:
+            return await self.client.get('/api/auth/me')
+        return response
+
+    async def list(self):
+        return await self.client.get('/api/projects')
+
+    async def get(self):
+        project_id = self._project_id()
+        if not project_id:
+            return await self.create()
+        return await self.client.get(f'/api/projects/{project_id}')
+
+    async def create(self):
+        n = self.rng.randrange(10 ** 6)
+        response = await self.client.post('/api/projects', json={
+            "content_type": "image",
+            "company_name": f"Load Brand {n}",
+            "company_description": "متجر إلكتروني للعطور الشرقية الفاخرة والعود والبخور",
+            "strengths": ["Fast delivery", "Handmade"],
+            "images": [f"{FAKE_CDN}/img/{n % 16}.png"] if self.rng.random() < 0.3 else [],
+            "design_goal": "awareness",
+            "platform": self.rng.choice(["post_square", "ig_story", "fb_feed"]),
+            "psychological_strategy_id": self.rng.choice(["hook", "scarcity", "social_proof"]),
+            "language": self.rng.choice(["ar", "en"]),
+        })
+        if response.status_code == 200:
+            self.shared['project_ids'].append(response.json()['id'])
+        return response
+
+    async def scrape(self):
+        return await self.client.post('/api/scrape', json={"url": f"shop{self.rng.randrange(100)}.example"})
+
+    async def generate(self):
+        project_id = self._project_id()
+        if not project_id:
+            return await self.create()
+        return await self.client.post('/api/generate-content', json={
+            "project_id": project_id,
+            "variation_count": self.rng.choice([1, 2]),
+        })
+
+    async def catalog(self):
+        return await self.client.get(self.rng.choice(['/api/strategies', '/api/platforms', '/api/marketing-tips']))
+
+
+async def monitor_loop_lag(interval: float, samples: List[float], stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+async def run(args) -> dict:
+    tmp = tempfile.TemporaryDirectory(prefix='load-harness-')
+    server, kie, real_client = install_fakes(args, Path(tmp.name))
+    import httpx
+
+    mix = parse_mix(args.mix)
+    ops, weights = list(mix), list(mix.values())
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    shared = {'project_ids': []}
+    lag_samples: List[float] = []
+    stop = asyncio.Event()
+    remaining = [args.requests] if args.requests else None
+
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        deadline = time.perf_counter() + args.duration
+
+        async def work(wid: int):
+            rng = random.Random(args.seed + wid)
+            async with real_client(transport=transport, base_url='https://load-harness.local', timeout=None) as client:
+                worker = Worker(wid, client, rng, shared)
+                await worker.auth()
+                while not stop.is_set():
+                    if remaining is not None:
+                        if remaining[0] <= 0:
+                            break
+                        remaining[0] -= 1
+                    elif time.perf_counter() >= deadline:
+                        break
+                    op = rng.choices(ops, weights)[0]
+                    started = time.perf_counter()
+                    try:
+                        response = await getattr(worker, op)()
+                        failed = response.status_code >= 400
+                    except Exception:
+                        failed = True
+                    latencies[op].append(time.perf_counter() - started)
+                    if failed:
+                        errors[op] += 1
+
+        monitor = asyncio.create_task(monitor_loop_lag(0.01, lag_samples, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(work(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await monitor
+    tmp.cleanup()
+
+    total = sum(len(v) for v in latencies.values())
+    report = {
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "errors": sum(errors.values()),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "operations": {},
+        "loop_lag_ms": {},
+        "upstream_calls": dict(kie.counts),
+        "db_ops": server.db.op_counts(),
+    }
+    for op in ops:
+        values = sorted(latencies.get(op, []))
+        report["operations"][op] = {
+            "count": len(values),
+            "errors": errors.get(op, 0),
+            "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+            **{f"p{q}_ms": round(percentile(values, q) * 1000, 2) for q in (50, 90, 99)},
+            "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+        }
+    lag = sorted(lag_samples)
+    report["loop_lag_ms"] = {
+        **{f"p{q}": round(percentile(lag, q) * 1000, 2) for q in (50, 99)},
+        "max": round(lag[-1] * 1000, 2) if lag else 0.0,
+    }
+    return report
+
+
+def print_report(report: dict):
+    print(f"{report['requests']} requests in {report['elapsed_s']:.1f}s at concurrency {report['concurrency']}: "
+          f"{report['throughput_rps']:,.1f} req/s, {report['errors']} errors\n")
+    print(f"{'operation':<10} {'count':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for op, stats in report["operations"].items():
+        print(f"{op:<10} {stats['count']:>7} {stats['errors']:>7} {stats['rps']:>8.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p90_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    lag = report["loop_lag_ms"]
+    print(f"\nevent-loop lag: p50 {lag['p50']:.2f} ms  p99 {lag['p99']:.2f} ms  max {lag['max']:.2f} ms")
+    print(f"upstream calls: {report['upstream_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests")
+    parser.add_argument("--mix", help="weights, e.g. list=60,create=20,generate=20 (default: %s)" %
+                        ','.join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument("--db-latency", type=float, default=0.001, help="seconds added to every store operation")
+    parser.add_argument("--scrape-latency", type=float, default=0.05, help="seconds the fake website takes to respond")
+    parser.add_argument("--render-seconds", type=float, default=0.5, help="fake kie.ai render time per image")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="KIE_POLL_INTERVAL_SECONDS for the app")
+    parser.add_argument("--image-size", type=int, default=512, help="side of the fake generated PNGs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", type=Path, help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
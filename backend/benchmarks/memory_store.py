@@ -0,0 +1,463 @@
+"""
+In-memory stand-in for the slice of the Motor API the backend uses.
+
+Documents live in per-collection lists and are deep-copied in and out, like a
+real driver. Every operation awaits a configurable latency so the event loop
+interleaves requests the way it would against a network database. Supports the
+query operators and update modifiers server.py relies on plus bulk_write with
+pymongo's request classes.
+"""
+import asyncio
+import copy
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+
+_MISSING = object()
+
+
+def _get_path(doc: Any, path: str) -> List[Any]:
+    """All values at a dotted path, descending into arrays like MongoDB does"""
+    values = [doc]
+    for part in path.split('.'):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    next_values.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    next_values.append(value[int(part)])
+                else:
+                    next_values.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+        values = next_values
+    return values
+
+
+def _expand(values: List[Any]) -> List[Any]:
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def _compare(op: str, candidate: Any, operand: Any) -> bool:
+    try:
+        if op == '$gt':
+            return candidate > operand
+        if op == '$gte':
+            return candidate >= operand
+        if op == '$lt':
+            return candidate < operand
+        if op == '$lte':
+            return candidate <= operand
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported operator {op}")
+
+
+def _match_condition(values: List[Any], condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+        candidates = _expand(values)
+        for op, operand in condition.items():
+            if op == '$in':
+                if not any(c in operand for c in candidates) and not (None in operand and not values):
+                    return False
+            elif op == '$nin':
+                if any(c in operand for c in candidates):
+                    return False
+            elif op == '$ne':
+                if operand in candidates or (operand is None and not values):
+                    return False
+            elif op == '$exists':
+                if bool(values) != bool(operand):
+                    return False
+            elif op == '$regex':
+                pattern = re.compile(operand, re.I if 'i' in condition.get('$options', '') else 0)
+                if not any(isinstance(c, str) and pattern.search(c) for c in candidates):
+                    return False
+            elif op == '$options':
+                continue
+            elif op == '$elemMatch':
+                if not any(isinstance(c, dict) and matches(c, operand) for v in values if isinstance(v, list) for c in v):
+                    return False
+            elif op == '$size':
+                if not any(isinstance(v, list) and len(v) == operand for v in values):
+                    return False
+            else:
+                if not any(_compare(op, c, operand) for c in candidates):
+                    return False
+        return True
+    if condition is None:
+        return not values or None in _expand(values)
+    return condition in _expand(values)
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$nor':
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include = {k for k, v in projection.items() if v and k != '_id'}
+    if include:
+        projected = {}
+        for key in include:
+            value = _read_path(doc, key)
+            if value is not _MISSING:
+                _set_path(projected, key, value)
+        if projection.get('_id', 1) and '_id' in doc:
+            projected['_id'] = doc['_id']
+        return projected
+    for key, value in projection.items():
+        if not value:
+            doc.pop(key, None)
+    return doc
+
+
+def _set_path(doc: dict, path: str, value: Any):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _pop_path(doc: dict, path: str):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _read_path(doc: dict, path: str, default: Any = _MISSING) -> Any:
+    for part in path.split('.'):
+        if not isinstance(doc, dict) or part not in doc:
+            return default
+        doc = doc[part]
+    return doc
+
+
+def apply_update(doc: dict, update: dict):
+    if not any(k.startswith('$') for k in update):
+        preserved = doc.get('_id')
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        if preserved is not None:
+            doc['_id'] = preserved
+        return
+    for op, fields in update.items():
+        for path, value in fields.items():
+            value = copy.deepcopy(value)
+            if op == '$set':
+                _set_path(doc, path, value)
+            elif op == '$setOnInsert':
+                continue
+            elif op == '$unset':
+                _pop_path(doc, path)
+            elif op == '$inc':
+                _set_path(doc, path, _read_path(doc, path, 0) + value)
+            elif op in ('$push', '$addToSet'):
+                current = _read_path(doc, path, None)
+                if current is None:
+                    current = []
+                    _set_path(doc, path, current)
+                items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                for item in items:
+                    if op == '$push' or item not in current:
+                        current.append(item)
+                if isinstance(value, dict) and '$slice' in value:
+                    limit = value['$slice']
+                    current[:] = current[limit:] if limit < 0 else current[:limit]
+            elif op == '$pull':
+                current = _read_path(doc, path, None)
+                if isinstance(current, list):
+                    current[:] = [item for item in current if item != value]
+            else:
+                raise ValueError(f"Unsupported update operator {op}")
+
+
+def _upsert_document(query: dict, update: dict) -> dict:
+    doc = {k: copy.deepcopy(v) for k, v in query.items() if not k.startswith('$') and not isinstance(v, dict)}
+    for path, value in update.get('$setOnInsert', {}).items():
+        _set_path(doc, path, copy.deepcopy(value))
+    apply_update(doc, update)
+    return doc
+
+
+@dataclass
+class InsertOneResult:
+    inserted_id: Any
+    acknowledged: bool = True
+
+
+@dataclass
+class InsertManyResult:
+    inserted_ids: List[Any]
+    acknowledged: bool = True
+
+
+@dataclass
+class UpdateResult:
+    matched_count: int
+    modified_count: int
+    upserted_id: Any = None
+    acknowledged: bool = True
+
+
+@dataclass
+class DeleteResult:
+    deleted_count: int
+    acknowledged: bool = True
+
+
+@dataclass
+class BulkWriteResult:
+    inserted_count: int = 0
+    matched_count: int = 0
+    modified_count: int = 0
+    deleted_count: int = 0
+    upserted_count: int = 0
+    upserted_ids: Dict[int, Any] = field(default_factory=dict)
+    acknowledged: bool = True
+
+
+class MemoryCursor:
+    def __init__(self, collection: 'MemoryCollection', query: Optional[dict], projection: Optional[dict]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[tuple] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[dict]] = None
+
+    def sort(self, key, direction: int = 1) -> 'MemoryCursor':
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, count: int) -> 'MemoryCursor':
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> 'MemoryCursor':
+        self._limit = count
+        return self
+
+    def _evaluate(self) -> List[dict]:
+        docs = [doc for doc in self._collection._docs if matches(doc, self._query)]
+        for key, direction in reversed(self._sort):
+            present = [d for d in docs if _read_path(d, key) is not _MISSING]
+            missing = [d for d in docs if _read_path(d, key) is _MISSING]
+            present.sort(key=lambda d: _read_path(d, key), reverse=direction < 0)
+            # Missing fields sort like null: first ascending, last descending
+            docs = missing + present if direction > 0 else present + missing
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(doc, self._projection) for doc in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        await self._collection._delay()
+        results = self._evaluate()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        if self._results is None:
+            await self._collection._delay()
+            self._results = self._evaluate()
+        if not self._results:
+            raise StopAsyncIteration
+        return self._results.pop(0)
+
+
+class MemoryCollection:
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self._docs: List[dict] = []
+        self.op_counts: Dict[str, int] = {}
+
+    async def _delay(self, op: str = 'find'):
+        self.op_counts[op] = self.op_counts.get(op, 0) + 1
+        await asyncio.sleep(self.latency)
+
+    def _first(self, query: Optional[dict]) -> Optional[dict]:
+        return next((doc for doc in self._docs if matches(doc, query)), None)
+
+    def _insert(self, document: dict) -> Any:
+        document.setdefault('_id', ObjectId())
+        self._docs.append(copy.deepcopy(document))
+        return document['_id']
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool) -> UpdateResult:
+        targets = [doc for doc in self._docs if matches(doc, query)]
+        if not many:
+            targets = targets[:1]
+        for doc in targets:
+            apply_update(doc, update)
+        if not targets and upsert:
+            return UpdateResult(0, 0, upserted_id=self._insert(_upsert_document(query, update)))
+        return UpdateResult(len(targets), len(targets))
+
+    def _delete(self, query: Optional[dict], many: bool) -> int:
+        deleted = 0
+        kept = []
+        for doc in self._docs:
+            if (many or not deleted) and matches(doc, query):
+                deleted += 1
+            else:
+                kept.append(doc)
+        self._docs = kept
+        return deleted
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> MemoryCursor:
+        return MemoryCursor(self, query, projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> Optional[dict]:
+        await self._delay('find')
+        doc = self._first(query)
+        return _project(doc, projection) if doc is not None else None
+
+    async def count_documents(self, query: Optional[dict] = None) -> int:
+        await self._delay('count')
+        return sum(1 for doc in self._docs if matches(doc, query))
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        await self._delay('insert')
+        return InsertOneResult(self._insert(document))
+
+    async def insert_many(self, documents: Iterable[dict]) -> InsertManyResult:
+        await self._delay('insert')
+        return InsertManyResult([self._insert(doc) for doc in documents])
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        await self._delay('update')
+        return self._update(query, update, upsert, many=False)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        await self._delay('update')
+        return self._update(query, update, upsert, many=True)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False) -> UpdateResult:
+        await self._delay('update')
+        return self._update(query, replacement, upsert, many=False)
+
+    async def delete_one(self, query: dict) -> DeleteResult:
+        await self._delay('delete')
+        return DeleteResult(self._delete(query, many=False))
+
+    async def delete_many(self, query: dict) -> DeleteResult:
+        await self._delay('delete')
+        return DeleteResult(self._delete(query, many=True))
+
+    async def find_one_and_delete(self, query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        await self._delay('delete')
+        doc = self._first(query)
+        if doc is None:
+            return None
+        self._docs.remove(doc)
+        return _project(doc, projection)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection: Optional[dict] = None,
+                                  upsert: bool = False, return_document: bool = False) -> Optional[dict]:
+        await self._delay('update')
+        doc = self._first(query)
+        if doc is None:
+            if not upsert:
+                return None
+            self._insert(_upsert_document(query, update))
+            return _project(self._docs[-1], projection) if return_document else None
+        before = _project(doc, projection)
+        apply_update(doc, update)
+        return _project(doc, projection) if return_document else before
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True) -> BulkWriteResult:
+        await self._delay('bulk_write')
+        result = BulkWriteResult()
+        for index, request in enumerate(requests):
+            if isinstance(request, InsertOne):
+                self._insert(request._doc)
+                result.inserted_count += 1
+            elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                update = request._doc
+                outcome = self._update(request._filter, update, bool(request._upsert), many=isinstance(request, UpdateMany))
+                result.matched_count += outcome.matched_count
+                result.modified_count += outcome.modified_count
+                if outcome.upserted_id is not None:
+                    result.upserted_count += 1
+                    result.upserted_ids[index] = outcome.upserted_id
+            elif isinstance(request, (DeleteOne, DeleteMany)):
+                result.deleted_count += self._delete(request._filter, many=isinstance(request, DeleteMany))
+            else:
+                raise TypeError(f"Unsupported bulk request {request!r}")
+        return result
+
+    async def create_index(self, keys, **kwargs) -> str:
+        await self._delay('index')
+        return '_'.join(k if isinstance(k, str) else f"{k[0]}_{k[1]}" for k in (keys if isinstance(keys, list) else [keys]))
+
+
+class MemoryDatabase:
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name, self.latency)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, name: str, **kwargs) -> dict:
+        """Only what server.py issues: the warm-up ping"""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return {"ok": 1}
+
+    def op_counts(self) -> Dict[str, Dict[str, int]]:
+        return {name: dict(c.op_counts) for name, c in self._collections.items()}
+
+
+class MemoryClient:
+    """Drop-in for AsyncIOMotorClient(...)[db_name] in offline runs"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name, self.latency)
+        return self._databases[name]
+
+    def close(self):
+        pass
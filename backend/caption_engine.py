@@ -0,0 +1,147 @@
+"""Caption engine for generated ads.
+
+Every strategy has a few opening lines per language. They are compiled once at
+import into string.Templates keyed by (strategy, language), so a caption only
+substitutes the brand name and hashtags. Finished caption sets are memoized per
+project revision and variant, and ``build_captions_batch`` produces variants for
+many projects in one call for campaign refreshes.
+"""
+from string import Template
+from typing import Dict, Iterable, List, Tuple
+
+from cachetools import LRUCache
+
+from catalog import PSYCHOLOGICAL_STRATEGIES, get_strategy_by_id
+from prompt_engine import project_revision
+
+LANGUAGES = ('ar', 'en')
+
+# Opening lines per strategy; variant n uses line n (the first is the original copy)
+CAPTION_COPY = {
+    'hook': {
+        'ar': ['توقف! 🛑 هل رأيت هذا من قبل؟', 'لحظة واحدة 👀 هذا ليس ما تتوقعه', 'لن تصدق ما ستراه الآن 🤯'],
+        'en': ['Stop! 🛑 Have you seen this before?', 'Wait 👀 this is not what you expect', 'You won\'t believe what you\'re about to see 🤯'],
+    },
+    'shock_comparison': {
+        'ar': ['قبل ❌ وبعد ✅ الفرق واضح', 'الطريقة القديمة أم الطريقة الذكية؟ ⚖️', 'قارن بنفسك… الفرق صادم 😮'],
+        'en': ['Before ❌ and after ✅ the difference is clear', 'The old way or the smart way? ⚖️', 'Compare for yourself… the difference is shocking 😮'],
+    },
+    'bold_opinion': {
+        'ar': ['سنقولها بصراحة 📢 أنت تستحق الأفضل', 'رأي قد لا يعجب الجميع: الجودة لا تُساوم 💬', 'الحقيقة التي لا يقولها أحد 🔥'],
+        'en': ['Let\'s say it plainly 📢 you deserve better', 'Unpopular opinion: quality is non-negotiable 💬', 'The truth nobody tells you 🔥'],
+    },
+    'whisper_insight': {
+        'ar': ['🤫 سر صغير يعرفه القليلون فقط', 'بيننا فقط… هذا ما يصنع الفرق ✨', 'ما لا يخبرك به أحد 🔍'],
+        'en': ['🤫 A little secret only a few know', 'Just between us… this is what makes the difference ✨', 'What no one tells you 🔍'],
+    },
+    'pain_of_paying': {
+        'ar': ['💎 قيمة أكبر بكثير مما تدفع', 'كل ريال في مكانه الصحيح ✅', 'ادفع أقل واحصل على أكثر 💰'],
+        'en': ['💎 Far more value than you pay', 'Every penny well spent ✅', 'Pay less, get more 💰'],
+    },
+    'loss_aversion': {
+        'ar': ['😱 لا تفوّت الفرصة!', 'ستندم إن فاتتك هذه الفرصة ⏳', 'كل يوم بدونه خسارة لك 📉'],
+        'en': ['😱 Don\'t miss out!', 'You\'ll regret missing this ⏳', 'Every day without it is a loss 📉'],
+    },
+    'problem_solution': {
+        'ar': ['تعبت من نفس المشكلة؟ 😩 الحل هنا', 'من الفوضى إلى الراحة في خطوة واحدة ✅', 'المشكلة انتهت… وهذا هو الحل 💡'],
+        'en': ['Tired of the same problem? 😩 Here\'s the fix', 'From chaos to comfort in one step ✅', 'Problem solved… here\'s how 💡'],
+    },
+    'story_based': {
+        'ar': ['📖 كل قصة نجاح تبدأ بخطوة', 'هذه قصتنا… وقد تكون قصتك أيضاً ✨', 'بدأت الحكاية من هنا 👇'],
+        'en': ['📖 Every success story starts with one step', 'This is our story… it could be yours too ✨', 'The story starts here 👇'],
+    },
+    'human_touch': {
+        'ar': ['🤝 صُنع بأيدٍ تهتم بك', 'وراء كل منتج أشخاص حقيقيون ❤️', 'نحن هنا من أجلك 😊'],
+        'en': ['🤝 Made by people who care about you', 'Real people behind every product ❤️', 'We\'re here for you 😊'],
+    },
+    'engagement_cta': {
+        'ar': ['💬 أيهما تختار؟ أخبرنا في التعليقات', 'صوّت الآن 👇 أ أم ب؟', 'شاركنا رأيك 💭 نحن نقرأ كل تعليق'],
+        'en': ['💬 Which one would you pick? Tell us in the comments', 'Vote now 👇 A or B?', 'Share your thoughts 💭 we read every comment'],
+    },
+    'herd_mentality': {
+        'ar': ['👥 الجميع يتحدث عنه… هل جربته؟', 'انضم إلى الآلاف الذين اختاروا الأفضل 🚀', 'الكل سبقك إليه 🏃'],
+        'en': ['👥 Everyone is talking about it… have you tried it?', 'Join the thousands who chose better 🚀', 'Everyone got there before you 🏃'],
+    },
+    'social_proof': {
+        'ar': ['⭐⭐⭐⭐⭐ آلاف العملاء السعداء', 'عملاؤنا يقولون كل شيء 💬', 'تقييم ٥ نجوم من عملاء حقيقيين ✅'],
+        'en': ['⭐⭐⭐⭐⭐ Thousands of happy customers', 'Our customers say it all 💬', '5-star rated by real customers ✅'],
+    },
+    'reciprocity': {
+        'ar': ['🎁 هدية خاصة بانتظارك', 'لأنك تستحق… هديتك معنا 🎀', 'اطلب الآن واحصل على هدية مجانية 🎁'],
+        'en': ['🎁 A special gift is waiting for you', 'Because you deserve it… your gift is on us 🎀', 'Order now and get a free gift 🎁'],
+    },
+    'commitment': {
+        'ar': ['🏁 أنت على بُعد خطوة واحدة', 'اقتربت كثيراً… أكمل الطريق ✅', 'ابدأ اليوم وأكمل رحلتك معنا 🚀'],
+        'en': ['🏁 You\'re one step away', 'Almost there… finish what you started ✅', 'Start today and keep going with us 🚀'],
+    },
+    'scarcity': {
+        'ar': ['⏰ الكمية محدودة جداً!', 'آخر القطع المتبقية 🔥', 'العرض ينتهي قريباً ⌛'],
+        'en': ['⏰ Very limited quantity!', 'Last pieces left 🔥', 'Offer ends soon ⌛'],
+    },
+}
+FALLBACK_COPY = {'ar': ['عرض خاص ✨'], 'en': ['Special offer ✨']}
+CAPTION_VARIANTS = max(len(lines) for copy in CAPTION_COPY.values() for lines in copy.values())
+
+# Used when the project's site gave no keywords
+DEFAULT_HASHTAGS = ['#اعلان', '#تسويق', '#عرض_خاص']
+
+CAPTION_TEMPLATE = "{headline}\n\n$company_name\n\n$hashtags"
+
+
+def _compile(copy: Dict[str, List[str]]) -> Dict[str, Tuple[Template, ...]]:
+    return {
+        language: tuple(Template(CAPTION_TEMPLATE.format(headline=line.replace('$', '$$'))) for line in copy[language])
+        for language in LANGUAGES
+    }
+
+
+CAPTION_TEMPLATES = {s['id']: _compile(CAPTION_COPY.get(s['id'], FALLBACK_COPY)) for s in PSYCHOLOGICAL_STRATEGIES}
+
+# Memoized caption sets (every variant) keyed by (project revision, strategy)
+_caption_cache = LRUCache(maxsize=8192)
+caption_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def project_hashtags(project: dict) -> List[str]:
+    return list((project.get('scraped_data') or {}).get('hashtags') or DEFAULT_HASHTAGS)
+
+
+def _render(project: dict, strategy_id: str) -> List[Dict]:
+    templates = CAPTION_TEMPLATES[strategy_id]
+    hashtags = project_hashtags(project)
+    fields = {'company_name': project.get('company_name', ''), 'hashtags': ' '.join(hashtags)}
+    return [{
+        'caption_ar': templates['ar'][variant % len(templates['ar'])].substitute(fields),
+        'caption_en': templates['en'][variant % len(templates['en'])].substitute(fields),
+        'hashtags': hashtags,
+    } for variant in range(CAPTION_VARIANTS)]
+
+
+def build_captions(project: dict, count: int = 1) -> List[Dict]:
+    """count caption variants (at most CAPTION_VARIANTS) for the project's strategy"""
+    count = max(1, min(count, CAPTION_VARIANTS))
+    strategy_id = get_strategy_by_id(project.get('psychological_strategy_id', 'hook'))['id']
+    revision = project_revision(project)
+    if revision is None:
+        return _render(project, strategy_id)[:count]
+    key = (revision, strategy_id)
+    captions = _caption_cache.get(key)
+    if captions is not None:
+        caption_cache_stats['hits'] += 1
+    else:
+        caption_cache_stats['misses'] += 1
+        captions = _caption_cache[key] = _render(project, strategy_id)
+    return captions[:count]
+
+
+def build_caption(project: dict) -> Dict:
+    return build_captions(project, 1)[0]
+
+
+def build_captions_batch(projects: Iterable[dict], count: int = 1) -> Dict[str, List[Dict]]:
+    """Caption variants for many projects at once, keyed by project id"""
+    return {project['id']: build_captions(project, count) for project in projects}
+
+
+def clear_caption_cache():
+    _caption_cache.clear()
@@ -0,0 +1,73 @@
+import math
+
+# ============== Constants ==============
+
+PSYCHOLOGICAL_STRATEGIES = [
+    {"id": "hook", "name_ar": "الخطاف", "name_en": "Hook Strategy", "icon": "hook", "description_ar": "عنصر مفاجئ يوقف التصفح", "description_en": "Surprising element that stops scrolling", "visual_instructions": "Use HIGH CONTRAST colors, FISH-EYE angles, include ONE ILLOGICAL element. Text should be BOLD and off-center.", "video_instructions": "Start with unexpected visual. Quick cuts, dynamic movement."},
+    {"id": "shock_comparison", "name_ar": "المقارنة الصادمة", "name_en": "Shock Comparison", "icon": "scale", "description_ar": "تقسيم يبرز التباين الحاد", "description_en": "Split screen showing stark contrast", "visual_instructions": "SPLIT SCREEN - left dark/chaotic, right bright/organized. Sharp diagonal dividing line.", "video_instructions": "Wipe transition from problem to solution."},
+    {"id": "bold_opinion", "name_ar": "الرأي الجريء", "name_en": "Bold Opinion", "icon": "megaphone", "description_ar": "موقف قوي يثير النقاش", "description_en": "Strong stance that sparks discussion", "visual_instructions": "Extensive NEGATIVE SPACE (60%+). One powerful statement in large typography.", "video_instructions": "Static shot with slowly appearing text."},
+    {"id": "whisper_insight", "name_ar": "الهمس", "name_en": "Whisper Insight", "icon": "lightbulb", "description_ar": "جو غامض يوحي بالسرية", "description_en": "Mysterious atmosphere suggesting secrets", "visual_instructions": "DIM LIGHTING with spotlight. MACRO close-ups. Muted colors with one accent.", "video_instructions": "Slow motion, shallow depth of field."},
+    {"id": "pain_of_paying", "name_ar": "ألم الدفع", "name_en": "Pain of Paying", "icon": "credit-card", "description_ar": "إظهار القيمة أكبر من السعر", "description_en": "Show value larger than price", "visual_instructions": "VALUE in HUGE typography (200%+), price in small text. Green checkmarks.", "video_instructions": "Items appearing with cha-ching effect."},
+    {"id": "loss_aversion", "name_ar": "تجنب الخسارة", "name_en": "Loss Aversion", "icon": "shield-alert", "description_ar": "الخوف من فقدان الفرصة", "description_en": "Fear of missing out", "visual_instructions": "RED gradients. Product FADING effect. Countdown timer. Empty shelf imagery.", "video_instructions": "Product slowly fading. Clock ticking."},
+    {"id": "problem_solution", "name_ar": "المشكلة والحل", "name_en": "Problem-Solution", "icon": "puzzle", "description_ar": "من الفوضى إلى الراحة", "description_en": "From chaos to comfort", "visual_instructions": "Two-panel: Panel 1 GRAYSCALE showing frustration. Panel 2 FULL COLOR showing relief.", "video_instructions": "Start BLACK AND WHITE, transition to full color."},
+    {"id": "story_based", "name_ar": "القصة", "name_en": "Story-Based", "icon": "book-open", "description_ar": "سرد قصة بداية ووسط ونهاية", "description_en": "Narrative with beginning, middle, end", "visual_instructions": "CAROUSEL design (3-5 panels). Setup, Conflict, Resolution.", "video_instructions": "Three-act structure. Character-driven."},
+    {"id": "human_touch", "name_ar": "اللمسة البشرية", "name_en": "Human Touch", "icon": "heart-handshake", "description_ar": "تواصل بصري مباشر مع الكاميرا", "description_en": "Direct eye contact with camera", "visual_instructions": "DIRECT EYE CONTACT mandatory. Real human face. Genuine smile. Natural lighting.", "video_instructions": "Person looking at camera. Authentic testimonial."},
+    {"id": "engagement_cta", "name_ar": "السؤال التفاعلي", "name_en": "Engagement CTA", "icon": "message-circle", "description_ar": "عنصر تفاعلي يدعو للمشاركة", "description_en": "Interactive element inviting participation", "visual_instructions": "Include FAKE INTERACTIVE ELEMENTS: Poll buttons, A/B choices, quiz format.", "video_instructions": "Pause for viewer. Point to comment section."},
+    {"id": "herd_mentality", "name_ar": "القطيع", "name_en": "Herd Mentality", "icon": "users", "description_ar": "ازدحام يظهر الشعبية", "description_en": "Crowd showing popularity", "visual_instructions": "Show CROWD using the product. Queue imagery. 'Sold out' stamps.", "video_instructions": "Multiple people unboxing. Counter showing growing numbers."},
+    {"id": "social_proof", "name_ar": "الدليل الاجتماعي", "name_en": "Social Proof", "icon": "star", "description_ar": "تقييمات وآراء العملاء", "description_en": "Customer reviews and ratings", "visual_instructions": "STAR RATINGS prominently displayed. Chat bubble with testimonial. Trust badges.", "video_instructions": "Testimonial clips. Star rating animation."},
+    {"id": "reciprocity", "name_ar": "المقايضة", "name_en": "Reciprocity Principle", "icon": "gift", "description_ar": "الهدية تلمع أكثر من المنتج", "description_en": "Gift shines brighter than product", "visual_instructions": "FREE GIFT with GLOW effect - more prominent than main product.", "video_instructions": "Gift reveal with sparkle effects."},
+    {"id": "commitment", "name_ar": "الالتزام", "name_en": "Commitment & Consistency", "icon": "check-circle", "description_ar": "شريط تقدم يوحي بالإنجاز", "description_en": "Progress bar suggesting achievement", "visual_instructions": "PROGRESS BAR at 70-90%. Step indicators. 'Almost there!' messaging.", "video_instructions": "Progress bar filling up. Confetti at milestones."},
+    {"id": "scarcity", "name_ar": "الندرة", "name_en": "Scarcity Principle", "icon": "clock", "description_ar": "عناصر توحي بالنفاد", "description_en": "Elements suggesting running out", "visual_instructions": "EMPTY SHELVES with last item. COUNTDOWN TIMER. HOURGLASS. Red urgent colors.", "video_instructions": "Clock ticking. Items disappearing from shelf."},
+]
+
+PLATFORM_SIZES = [
+    {"id": "tiktok_reels", "name": "تيك توك / ريلز", "name_en": "TikTok / Reels", "width": 1080, "height": 1920, "aspect": "9:16", "platform": "vertical"},
+    {"id": "post_square", "name": "بوست مربع", "name_en": "Square Post", "width": 1080, "height": 1080, "aspect": "1:1", "platform": "square"},
+    {"id": "youtube_banner", "name": "يوتيوب / بنر", "name_en": "YouTube / Banner", "width": 1920, "height": 1080, "aspect": "16:9", "platform": "landscape"},
+    {"id": "ig_story", "name": "ستوري", "name_en": "Story", "width": 1080, "height": 1920, "aspect": "9:16", "platform": "vertical"},
+    {"id": "fb_feed", "name": "فيسبوك فيد", "name_en": "Facebook Feed", "width": 1200, "height": 628, "aspect": "1.91:1", "platform": "wide"},
+]
+
+MARKETING_TIPS = [
+    {"ar": "الإعلانات ذات الوجوه البشرية تحقق تفاعل أعلى بـ 38%", "en": "Ads with human faces get 38% higher engagement"},
+    {"ar": "اللون الأحمر يزيد الإحساس بالإلحاح", "en": "Red color increases sense of urgency"},
+    {"ar": "أول 3 ثوان تحدد 70% من نجاح الإعلان", "en": "First 3 seconds determine 70% of ad success"},
+    {"ar": "الأرقام الفردية (7, 9) أكثر إقناعاً", "en": "Odd numbers (7, 9) are more persuasive"},
+    {"ar": "التواصل البصري يزيد الثقة بـ 50%", "en": "Eye contact increases trust by 50%"},
+    {"ar": "الندرة تزيد القيمة المدركة بـ 200%", "en": "Scarcity increases perceived value by 200%"},
+    {"ar": "القصص تُذكر 22 مرة أكثر من الحقائق", "en": "Stories are remembered 22x more than facts"},
+    {"ar": "الألوان الدافئة تحفز القرار السريع", "en": "Warm colors encourage quick decisions"},
+]
+
+# ============== Indexed Lookups ==============
+
+STRATEGIES_BY_ID = {s['id']: s for s in PSYCHOLOGICAL_STRATEGIES}
+PLATFORMS_BY_ID = {p['id']: p for p in PLATFORM_SIZES}
+
+DEFAULT_STRATEGY = PSYCHOLOGICAL_STRATEGIES[0]
+DEFAULT_PLATFORM = PLATFORM_SIZES[1]
+
+# Aspect ratios accepted by the Nano Banana Pro createTask endpoint
+SUPPORTED_GENERATION_ASPECTS = ["1:1", "2:3", "3:2", "3:4", "4:3", "4:5", "5:4", "9:16", "16:9", "21:9"]
+
+def get_strategy_by_id(strategy_id: str) -> dict:
+    return STRATEGIES_BY_ID.get(strategy_id, DEFAULT_STRATEGY)
+
+def get_platform_by_id(platform_id: str) -> dict:
+    return PLATFORMS_BY_ID.get(platform_id, DEFAULT_PLATFORM)
+
+def _aspect_value(aspect: str) -> float:
+    w, h = aspect.split(':')
+    return float(w) / float(h)
+
+def nearest_generation_aspect(width: int, height: int) -> str:
+    """Closest upstream-supported ratio to a platform's pixel size (compared in log space)"""
+    target = math.log(width / height)
+    return min(SUPPORTED_GENERATION_ASPECTS, key=lambda a: abs(math.log(_aspect_value(a)) - target))
+
+# Derived from PLATFORM_SIZES so the catalog stays the single source of truth.
+# e.g. fb_feed is 1.91:1, which the generator cannot render, so it is requested as 16:9.
+GENERATION_ASPECTS = {p['id']: nearest_generation_aspect(p['width'], p['height']) for p in PLATFORM_SIZES}
+
+def get_generation_aspect(platform_id: str) -> str:
+    return GENERATION_ASPECTS.get(platform_id, GENERATION_ASPECTS[DEFAULT_PLATFORM['id']])
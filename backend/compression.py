@@ -0,0 +1,230 @@
+"""gzip/brotli response compression negotiated from Accept-Encoding.
+
+Only textual media types (JSON, text, SVG, ...) are compressed, so images,
+videos and ZIP exports pass through untouched, as do partial (206), HEAD and
+already-encoded responses and bodies under ``minimum_size``. Routes can be
+switched off by template (``COMPRESSION_DISABLED_ROUTES``).
+
+Whole bodies larger than ``offload_size`` are compressed in a worker thread so
+a large project list does not stall the event loop; streamed bodies are
+compressed chunk by chunk. Responses that carry an ETag (the catalog payloads)
+keep their compressed form in a small cache keyed by ETag and encoding, and
+the ETag of a compressed response is made weak because the bytes differ.
+
+Brotli needs the optional ``brotli`` package; without it only gzip is offered.
+"""
+import asyncio
+import gzip
+import zlib
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml',
+    'application/problem+json', 'image/svg+xml',
+)
+GZIP_LEVEL = 6
+# Quality 4-5 is about gzip's speed at a noticeably better ratio; 11 is far too slow per request
+BROTLI_QUALITY = 5
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """{coding: q} from an Accept-Encoding header"""
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """br when available and accepted, else gzip, else None"""
+    codings = parse_accept_encoding(header)
+    offered = (['br'] if brotli is not None else []) + ['gzip']
+    best, best_q = None, 0.0
+    for coding in offered:
+        q = codings.get(coding, codings.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._feed = self._compressor.process
+            self._finish = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._feed = self._compressor.compress
+            self._finish = self._compressor.flush
+
+    def feed(self, data: bytes, last: bool) -> bytes:
+        out = self._feed(data) if data else b''
+        return out + self._finish() if last else out
+
+
+def _header(headers: Iterable[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _replace_headers(headers: List[Tuple[bytes, bytes]], drop: Iterable[bytes], add: List[Tuple[bytes, bytes]]):
+    drop = set(drop)
+    return [(k, v) for k, v in headers if k.lower() not in drop] + add
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, offload_size: int = 256 * 1024,
+                 disabled_routes: Iterable[str] = (), cache_entries: int = 64):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.disabled_routes = set(disabled_routes)
+        self.cache_entries = cache_entries
+        self._cache: 'OrderedDict[Tuple[bytes, str], bytes]' = OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'HEAD':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding((_header(scope['headers'], b'accept-encoding') or b'').decode('latin-1'))
+        if encoding is None:
+            # The Vary header is still needed so shared caches don't serve this copy to other clients
+            await self.app(scope, receive, self._vary_only(send))
+            return
+        await self.app(scope, receive, _CompressingSend(self, scope, send, encoding))
+
+    def _vary_only(self, send):
+        async def wrapper(message):
+            if message['type'] == 'http.response.start' and self._eligible_type(message['headers']):
+                message['headers'] = _add_vary(list(message['headers']))
+            await send(message)
+        return wrapper
+
+    def _eligible_type(self, headers) -> bool:
+        content_type = (_header(headers, b'content-type') or b'').decode('latin-1').lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def eligible(self, scope, message) -> bool:
+        headers = message['headers']
+        if message['status'] in (204, 206, 304) or message['status'] < 200:
+            return False
+        if _header(headers, b'content-encoding') is not None or not self._eligible_type(headers):
+            return False
+        if b'no-transform' in (_header(headers, b'cache-control') or b''):
+            return False
+        route = scope.get('route')
+        return getattr(route, 'path', None) not in self.disabled_routes
+
+    async def compress_body(self, body: bytes, encoding: str, etag: Optional[bytes]) -> bytes:
+        key = (etag, encoding) if etag else None
+        if key is not None and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if len(body) >= self.offload_size:
+            compressed = await asyncio.to_thread(compress, body, encoding)
+        else:
+            compressed = compress(body, encoding)
+        if key is not None:
+            self._cache[key] = compressed
+            if len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return compressed
+
+
+def _add_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    vary = _header(headers, b'vary')
+    if vary is None:
+        return headers + [(b'vary', b'Accept-Encoding')]
+    if b'accept-encoding' in vary.lower() or vary.strip() == b'*':
+        return headers
+    return _replace_headers(headers, [b'vary'], [(b'vary', vary + b', Accept-Encoding')])
+
+
+def _weak(etag: Optional[bytes]) -> List[Tuple[bytes, bytes]]:
+    if etag is None:
+        return []
+    return [(b'etag', etag if etag.startswith(b'W/') else b'W/' + etag)]
+
+
+class _CompressingSend:
+    """send() wrapper holding back the response start until the first body chunk decides the path"""
+
+    def __init__(self, middleware: CompressionMiddleware, scope, send, encoding: str):
+        self.middleware = middleware
+        self.scope = scope
+        self.send = send
+        self.encoding = encoding
+        self.start = None
+        self.streamer: Optional[_StreamCompressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if self.passthrough:
+            await self.send(message)
+            return
+        if message['type'] == 'http.response.start':
+            if not self.middleware.eligible(self.scope, message):
+                self.passthrough = True
+                await self.send(message)
+                return
+            self.start = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.streamer is not None:
+            await self.send({'type': 'http.response.body', 'body': self.streamer.feed(body, not more_body), 'more_body': more_body})
+            return
+
+        headers = list(self.start['headers'])
+        etag = _header(headers, b'etag')
+        if not more_body:
+            if len(body) < self.middleware.minimum_size:
+                await self.send({**self.start, 'headers': _add_vary(headers)})
+                await self.send(message)
+                return
+            compressed = await self.middleware.compress_body(body, self.encoding, etag)
+            headers = _replace_headers(headers, [b'content-length', b'etag'], [
+                (b'content-encoding', self.encoding.encode()),
+                (b'content-length', str(len(compressed)).encode()),
+            ] + _weak(etag))
+            await self.send({**self.start, 'headers': _add_vary(headers)})
+            await self.send({'type': 'http.response.body', 'body': compressed})
+            return
+
+        # Streamed body of unknown total length: compress as it goes
+        self.streamer = _StreamCompressor(self.encoding)
+        headers = _replace_headers(headers, [b'content-length', b'etag'], [
+            (b'content-encoding', self.encoding.encode()),
+        ] + _weak(etag))
+        await self.send({**self.start, 'headers': _add_vary(headers)})
+        await self.send({'type': 'http.response.body', 'body': self.streamer.feed(body, False), 'more_body': True})
@@ -0,0 +1,217 @@
+"""On-demand image derivatives (thumbnails, WebP/AVIF variants).
+
+A derivative is keyed by (source file, width, format, quality), rendered once in
+the image worker pool and kept on disk. The cache directory is bounded by total
+size and evicts the least recently used files first.
+
+Every worker keeps its own LRU index over the shared directory, so a file one
+worker evicted may still be listed by another: a hit is only trusted once the
+file is seen on disk, and a file another worker rendered is adopted on a miss.
+The directory is scanned in a worker thread (``ensure_loaded``, run at warm-up).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps, features
+
+from image_pipeline import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+# Requested widths snap up to one of these so clients cannot fill the cache with one-off sizes
+WIDTH_BUCKETS = [64, 128, 256, 320, 480, 640, 768, 1024, 1280, 1600, 1920]
+
+FORMAT_MEDIA_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+FORMAT_ALIASES = {'jpg': 'jpeg'}
+
+DEFAULT_QUALITY = {'avif': 55, 'webp': 75, 'jpeg': 80, 'png': 0}
+
+AVIF_SUPPORTED = 'avif' in features.modules and features.check_module('avif')
+
+# Partial renders older than this were left by a crashed worker; younger ones may still be in progress
+STALE_TMP_SECONDS = 60 * 60
+
+
+def snap_width(width: int) -> int:
+    for bucket in WIDTH_BUCKETS:
+        if width <= bucket:
+            return bucket
+    return WIDTH_BUCKETS[-1]
+
+
+def negotiate_format(requested: Optional[str], accept: str) -> str:
+    """Explicit ?format= wins; 'auto' or no format picks the best type the client accepts"""
+    if requested:
+        requested = FORMAT_ALIASES.get(requested.lower(), requested.lower())
+        if requested in FORMAT_MEDIA_TYPES and (requested != 'avif' or AVIF_SUPPORTED):
+            return requested
+    accept = (accept or '').lower()
+    if AVIF_SUPPORTED and 'image/avif' in accept:
+        return 'avif'
+    if 'image/webp' in accept:
+        return 'webp'
+    return 'jpeg'
+
+
+def render_derivative(source: Path, dest: Path, width: int, fmt: str, quality: int) -> int:
+    """Resize and encode one derivative (blocking); returns the written size"""
+    with Image.open(source) as image:
+        if image.format == 'JPEG':
+            # Let libjpeg decode at a reduced scale instead of decoding full size first
+            image.draft('RGB', (width, width * 4))
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image.thumbnail((width, round(image.height * width / image.width) or 1), Image.LANCZOS, reducing_gap=3.0)
+
+        has_alpha = image.mode in ('RGBA', 'LA', 'P')
+        if fmt == 'jpeg' and has_alpha:
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+            image = background
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        options = {}
+        if fmt == 'jpeg':
+            options = {'quality': quality, 'optimize': True, 'progressive': True}
+        elif fmt == 'webp':
+            options = {'quality': quality, 'method': 4}
+        elif fmt == 'avif':
+            options = {'quality': quality, 'speed': 8}
+        elif fmt == 'png':
+            options = {'optimize': True}
+
+        # Per process, so workers rendering the same derivative do not write one file
+        tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+        image.save(tmp, format=fmt.upper(), **options)
+    os.replace(tmp, dest)
+    return dest.stat().st_size
+
+
+class DerivativeCache:
+    """Disk cache of rendered derivatives with LRU eviction by total size"""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._load_lock = asyncio.Lock()
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def _scan(self):
+        """Blocking: (name, size) of the cached files, least recently modified first"""
+        self.root.mkdir(exist_ok=True)
+        stale = time.time() - STALE_TMP_SECONDS
+        files = []
+        for path in self.root.iterdir():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.suffix == '.tmp':
+                if stat.st_mtime < stale:
+                    path.unlink(missing_ok=True)
+                continue
+            files.append((stat.st_mtime, path.name, stat.st_size))
+        return [(name, size) for _, name, size in sorted(files)]
+
+    async def ensure_loaded(self):
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if not self.loaded:
+                for name, size in await asyncio.to_thread(self._scan):
+                    self._entries[name] = size
+                    self._total += size
+                self.loaded = True
+
+    def _forget(self, name: str):
+        self._total -= self._entries.pop(name, 0)
+
+    @staticmethod
+    def cache_name(kind: str, filename: str, width: int, fmt: str, quality: int) -> str:
+        digest = hashlib.sha1(f"{kind}/{filename}".encode('utf-8')).hexdigest()[:16]
+        ext = 'jpg' if fmt == 'jpeg' else fmt
+        return f"{digest}_w{width}_q{quality}.{ext}"
+
+    async def get(self, kind: str, filename: str, open_source, width: int, fmt: str, quality: int) -> Path:
+        """Cached derivative path; open_source() is an async context manager yielding the source file"""
+        await self.ensure_loaded()
+        name = self.cache_name(kind, filename, width, fmt, quality)
+        path = self.root / name
+        if name not in self._inflight:
+            size = await asyncio.to_thread(_size_or_none, path)
+            if size is not None:
+                if name not in self._entries:
+                    # Rendered by another worker
+                    self._entries[name] = size
+                    self._total += size
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return path
+            # Never rendered, or evicted by another worker
+            self._forget(name)
+
+        # Concurrent requests for the same derivative share one render
+        inflight = self._inflight.get(name)
+        if inflight:
+            await asyncio.shield(inflight)
+            return path
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[name] = future
+        try:
+            async with open_source() as source:
+                size = await run_in_pool(render_derivative, source, path, width, fmt, quality)
+            self._forget(name)
+            self._entries[name] = size
+            self._total += size
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved so it is not logged when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[name]
+        await self._evict()
+        return path
+
+    async def _evict(self):
+        victims = []
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            victims.append(self.root / name)
+        if victims:
+            await run_in_pool(_unlink_all, victims)
+            logger.info(f"Evicted {len(victims)} derivatives, cache now {self._total} bytes")
+
+
+def _size_or_none(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return None
+
+
+def _unlink_all(paths):
+    for path in paths:
+        path.unlink(missing_ok=True)
@@ -0,0 +1,193 @@
+"""Streaming downloads of generated assets from upstream URLs.
+
+The body is written to a temp file chunk by chunk (hashing as it goes) instead of
+being buffered in memory. Interrupted transfers are retried and resumed with a
+Range request when the server supports it, otherwise restarted from scratch.
+With ``keep_partial`` a failed transfer leaves its bytes in place and the next
+call for the same dest picks up where it stopped, which lets long-running jobs
+resume large video downloads across retries and restarts.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import httpx
+
+from uploads import write_chunk
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_MAX_BYTES = 512 * 1024 * 1024
+
+# Leading bytes of the formats we accept from the generators
+MAGIC_PREFIXES = {
+    b'\x89PNG\r\n\x1a\n': 'image/png',
+    b'\xff\xd8\xff': 'image/jpeg',
+    b'GIF87a': 'image/gif',
+    b'GIF89a': 'image/gif',
+}
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadInterrupted(DownloadError):
+    """The transfer kept failing part-way; with keep_partial it can be resumed later"""
+
+
+@dataclass
+class DownloadResult:
+    path: Path
+    size: int
+    sha256: str
+    content_type: str
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    for prefix, content_type in MAGIC_PREFIXES.items():
+        if head.startswith(prefix):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp':
+        brand = head[8:12]
+        if brand in (b'avif', b'avis'):
+            return 'image/avif'
+        if brand == b'qt  ':
+            return 'video/quicktime'
+        return 'video/mp4'
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'video/webm'
+    return None
+
+
+def _check_type(declared: str, head: bytes, allowed_prefixes: Tuple[str, ...]) -> str:
+    sniffed = sniff_content_type(head)
+    content_type = sniffed or declared
+    if not content_type.startswith(allowed_prefixes):
+        raise DownloadError(f"Unexpected content type {declared or 'unknown'}")
+    return content_type
+
+
+def _hash_partial(path: Path) -> Tuple[object, int, bytes]:
+    """sha256 state, size and leading bytes of an earlier partial download"""
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    try:
+        with open(path, 'rb') as f:
+            while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+                if not size:
+                    head = chunk
+                digest.update(chunk)
+                size += len(chunk)
+    except FileNotFoundError:
+        pass
+    return digest, size, head
+
+
+def _open_for(path: Path, offset: int):
+    f = open(path, 'r+b' if offset else 'wb')
+    f.seek(offset)
+    f.truncate()
+    return f
+
+
+async def stream_download(client: httpx.AsyncClient, url: str, dest: Path,
+                          allowed_prefixes: Tuple[str, ...] = ('image/',),
+                          max_bytes: int = DOWNLOAD_MAX_BYTES,
+                          retries: int = DOWNLOAD_RETRIES,
+                          keep_partial: bool = False) -> DownloadResult:
+    """Download url into dest, resuming interrupted transfers.
+
+    dest is removed on failure, unless keep_partial is set: then a failed
+    download is left in place and continued by the next call.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    total: Optional[int] = None
+    content_type = ''
+
+    try:
+        if keep_partial:
+            digest, written, head = await asyncio.to_thread(_hash_partial, dest)
+            if written:
+                content_type = _check_type('', head, allowed_prefixes)
+                logger.info(f"Resuming download of {url} at {written} bytes")
+
+        for attempt in range(retries + 1):
+            headers = {'Range': f'bytes={written}-'} if written else {}
+            try:
+                async with client.stream('GET', url, headers=headers) as response:
+                    if response.status_code == 416 and written:
+                        # An earlier attempt got every byte but did not get to hand the file over
+                        if response.headers.get('content-range') != f"bytes */{written}":
+                            raise DownloadError("Upstream rejected the resume offset")
+                        return DownloadResult(path=dest, size=written, sha256=digest.hexdigest(), content_type=content_type)
+                    if response.status_code == 206 and written:
+                        match = CONTENT_RANGE_RE.match(response.headers.get('content-range', ''))
+                        if not match or int(match.group(1)) != written:
+                            raise DownloadError("Upstream returned a mismatched range")
+                        if match.group(3) != '*':
+                            total = int(match.group(3))
+                    elif response.status_code == 200:
+                        if written:
+                            # Server ignored the Range header; start over
+                            logger.info(f"Restarting download of {url} from the beginning")
+                            digest = hashlib.sha256()
+                            written = 0
+                        length = response.headers.get('content-length')
+                        total = int(length) if length and length.isdigit() else None
+                    elif response.status_code >= 500:
+                        raise DownloadInterrupted(f"Upstream returned {response.status_code}")
+                    else:
+                        raise DownloadError(f"Upstream returned {response.status_code}")
+
+                    if total is not None and total > max_bytes:
+                        raise DownloadError(f"Download exceeds {max_bytes} bytes")
+
+                    f = await asyncio.to_thread(_open_for, dest, written)
+                    try:
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            if written == 0:
+                                content_type = _check_type(response.headers.get('content-type', ''), chunk, allowed_prefixes)
+                            written += len(chunk)
+                            if written > max_bytes:
+                                raise DownloadError(f"Download exceeds {max_bytes} bytes")
+                            await asyncio.to_thread(write_chunk, f, digest, chunk)
+                    finally:
+                        await asyncio.to_thread(f.close)
+
+                if written == 0:
+                    raise DownloadError("Upstream returned an empty body")
+                if total is not None and written < total:
+                    raise httpx.ReadError(f"Connection closed after {written} of {total} bytes")
+                return DownloadResult(path=dest, size=written, sha256=digest.hexdigest(), content_type=content_type)
+
+            except (httpx.TransportError, httpx.StreamError) as e:
+                if attempt >= retries:
+                    raise DownloadInterrupted(f"Download failed after {retries + 1} attempts: {e}")
+                logger.info(f"Download of {url} interrupted at {written} bytes ({e}), retrying")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+    except DownloadInterrupted:
+        if not keep_partial:
+            await asyncio.to_thread(dest.unlink, True)
+        raise
+    except DownloadError:
+        # Mismatched ranges, wrong types and oversized bodies would fail again from the same offset
+        await asyncio.to_thread(dest.unlink, True)
+        raise
+    except BaseException:
+        if not keep_partial:
+            await asyncio.to_thread(dest.unlink, True)
+        raise
+    raise DownloadError("Download failed")
@@ -0,0 +1,176 @@
+"""Streaming ZIP export of a project's assets.
+
+The archive is written by ``zipfile`` in a worker thread to a file-like writer
+whose chunks reach the response through a small bounded queue, so the
+archive is never held in memory or written to disk and a slow client simply
+pauses the writer. Images and videos are already compressed and are stored
+as-is (ZIP_STORED); only the metadata JSON is deflated. zipfile writes data
+descriptors when the output cannot seek, and ZIP64 records when an entry's
+size needs them.
+
+Writers run in their own pool of ``EXPORT_MAX_CONCURRENT`` threads so exports
+cannot take over the default executor; when every slot is busy the endpoint
+refuses new exports (``exports_busy``).
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import AsyncIterator, List
+
+from asset_gc import asset_refs
+from storage import StorageBackend, resolve_asset_key
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 256 * 1024
+# Chunks buffered between the zip writer and the client: bounds memory per export
+EXPORT_QUEUE_CHUNKS = 8
+EXPORT_MAX_CONCURRENT = int(os.environ.get('EXPORT_MAX_CONCURRENT', 4))
+
+_executor = ThreadPoolExecutor(max_workers=EXPORT_MAX_CONCURRENT, thread_name_prefix='export')
+_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+
+STORED_SUFFIXES = {'.png', '.jpg', '.jpeg', '.webp', '.avif', '.gif', '.mp4', '.mov', '.webm'}
+ARCHIVE_DIRS = {'uploads': 'references', 'generated': 'generated'}
+METADATA_FIELDS = (
+    'id', 'company_name', 'company_description', 'strengths', 'design_goal', 'platform',
+    'psychological_strategy_id', 'brand_colors', 'language', 'generated_captions',
+    'platform_variants', 'created_at', 'updated_at',
+)
+
+
+@dataclass
+class ExportEntry:
+    arcname: str
+    key: str
+    size: int
+    url: str
+
+
+async def collect_entries(storage: StorageBackend, project: dict) -> List[ExportEntry]:
+    """Archive entries for every stored asset the project references, in reference order"""
+    entries = []
+    seen = set()
+    for kind, filename in asset_refs(project):
+        if (kind, filename) in seen:
+            continue
+        seen.add((kind, filename))
+        key = await resolve_asset_key(storage, kind, filename)
+        stored = await storage.stat(key) if key else None
+        if stored is None:
+            logger.warning(f"Export of project {project.get('id')}: {kind}/{filename} is missing, skipping it")
+            continue
+        folder = 'videos' if PurePosixPath(filename).suffix.lower() in ('.mp4', '.mov', '.webm') else ARCHIVE_DIRS[kind]
+        entries.append(ExportEntry(f"{folder}/{filename}", key, stored.size, f"/api/{kind}/{filename}"))
+    return entries
+
+
+def exports_busy() -> bool:
+    """True when every export slot is taken"""
+    return _slots.locked()
+
+
+def export_filename(project: dict) -> str:
+    base = re.sub(r'[^A-Za-z0-9._-]+', '-', project.get('company_name') or '').strip('-.') or 'project'
+    return f"{base[:60]}-{project['id'][:8]}.zip"
+
+
+def _metadata(project: dict, entries: List[ExportEntry]) -> bytes:
+    data = {field: project.get(field) for field in METADATA_FIELDS}
+    data['files'] = [{"path": e.arcname, "url": e.url, "size": e.size} for e in entries]
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+class _QueueWriter:
+    """Unseekable file object feeding fixed-size chunks into an asyncio queue from a worker thread"""
+
+    def __init__(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        self.queue = queue
+        self.loop = loop
+        self.buffer = bytearray()
+        self.position = 0
+        self.cancelled = False
+
+    def _put(self, item):
+        if self.cancelled:
+            raise OSError("Export cancelled by the client")
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+    def write(self, data) -> int:
+        if self.cancelled:
+            raise OSError("Export cancelled by the client")
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= EXPORT_CHUNK_SIZE:
+            self._put(bytes(self.buffer[:EXPORT_CHUNK_SIZE]))
+            del self.buffer[:EXPORT_CHUNK_SIZE]
+        return len(data)
+
+    def tell(self) -> int:
+        # zipfile asks for the offset of each entry; without seek() it never rewrites earlier bytes
+        return self.position
+
+    def flush(self):
+        if self.buffer:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def _write_archive(storage: StorageBackend, project: dict, entries: List[ExportEntry], out: _QueueWriter):
+    """Blocking: write the whole archive to out"""
+    with zipfile.ZipFile(out, 'w') as archive:
+        for entry in entries:
+            info = zipfile.ZipInfo(entry.arcname, time.localtime()[:6])
+            stored = PurePosixPath(entry.arcname).suffix.lower() in STORED_SUFFIXES
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            info.file_size = entry.size
+            with closing(storage.open_read(entry.key)) as src, archive.open(info, 'w') as dest:
+                while chunk := src.read(EXPORT_CHUNK_SIZE):
+                    dest.write(chunk)
+        archive.writestr(
+            zipfile.ZipInfo('metadata.json', time.localtime()[:6]),
+            _metadata(project, entries), compress_type=zipfile.ZIP_DEFLATED,
+        )
+    out.flush()
+
+
+async def stream_project_zip(storage: StorageBackend, project: dict, entries: List[ExportEntry]) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    out = _QueueWriter(queue, loop)
+    done = object()
+
+    def run():
+        try:
+            _write_archive(storage, project, entries, out)
+            out._put(done)
+        except BaseException as e:
+            if not out.cancelled:
+                out._put(e)
+
+    async with _slots:
+        writer = loop.run_in_executor(_executor, run)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    logger.error(f"Export of project {project.get('id')} failed: {item}")
+                    raise item
+                yield item
+        finally:
+            # Every later put raises, so emptying the queue once frees a writer blocked on a full one
+            out.cancelled = True
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.shield(writer)
+
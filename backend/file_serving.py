@@ -0,0 +1,173 @@
+"""Static asset responses with validators, byte ranges and zero-copy sends.
+
+Files are stat'ed off the event loop. Content-addressed names (anything carrying
+a UUID or a long hex digest) never change, so they are served as immutable.
+When the ASGI server offers the zerocopysend extension the body goes out via
+sendfile(); otherwise it is streamed in chunks read in a worker thread.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+import stat as stat_module
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from http_cache import etag_matches
+
+CHUNK_SIZE = 256 * 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+CONTENT_ADDRESSED_RE = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,}',
+    re.IGNORECASE,
+)
+
+
+def is_content_addressed(filename: str) -> bool:
+    return bool(CONTENT_ADDRESSED_RE.search(filename))
+
+
+async def stat_file(path: Path) -> Optional[os.stat_result]:
+    """stat() in a worker thread; None unless the path is a regular file"""
+    try:
+        st = await asyncio.to_thread(os.stat, path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return st if stat_module.S_ISREG(st.st_mode) else None
+
+
+def file_etag(path: Path, st: os.stat_result) -> str:
+    token = f"{path.name}:{st.st_size}:{st.st_mtime_ns}".encode('utf-8')
+    return '"' + hashlib.md5(token, usedforsecurity=False).hexdigest() + '"'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=' range into an inclusive (start, end).
+
+    Returns None when the header is absent, malformed or asks for several ranges
+    (the full body is served then); raises ValueError when it is unsatisfiable.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start_text, sep, end_text = header[6:].strip().partition('-')
+    if not sep:
+        return None
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None
+
+    if start is None:
+        if not end:
+            raise ValueError("empty suffix range")
+        return (max(0, size - end), size - 1)
+    if start >= size or (end is not None and end < start):
+        raise ValueError("range not satisfiable")
+    return (start, size - 1 if end is None else min(end, size - 1))
+
+
+def _not_modified(request: Request, etag: str, st: os.stat_result) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return int(st.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class FileRangeResponse(Response):
+    """Sends a byte span of a file, using zerocopysend when the server supports it"""
+
+    def __init__(self, path: Path, status_code: int, headers: Dict[str, str], media_type: str,
+                 offset: int = 0, count: int = 0, send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.send_body = send_body
+        self.headers['content-length'] = str(count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        f = await asyncio.to_thread(open, self.path, 'rb')
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            try:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False,
+                })
+            finally:
+                await asyncio.to_thread(f.close)
+            return
+
+        try:
+            await asyncio.to_thread(f.seek, self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await asyncio.to_thread(f.close)
+
+
+async def serve_file(request: Request, path: Path, st: os.stat_result,
+                     media_type: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Build a 200/206/304/416 response for an already stat'ed file"""
+    etag = file_etag(path, st)
+    response_headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if is_content_addressed(path.name) else DEFAULT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        **(headers or {}),
+    }
+    media_type = media_type or mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
+    if _not_modified(request, etag, st):
+        return Response(status_code=304, headers=response_headers)
+
+    size = st.st_size
+    send_body = request.method != 'HEAD'
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if range_header and if_range and if_range.strip() != etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response_headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=response_headers)
+
+    if byte_range is None:
+        return FileRangeResponse(path, 200, response_headers, media_type, 0, size, send_body)
+
+    start, end = byte_range
+    response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return FileRangeResponse(path, 206, response_headers, media_type, start, end - start + 1, send_body)
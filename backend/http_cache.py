@@ -0,0 +1,41 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+def make_etag(data: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CachedJSON:
+    """A JSON body serialized once, served with a strong ETag and 304 handling"""
+
+    def __init__(self, payload: Any, max_age: int = 3600):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.etag = make_etag(self.body)
+        self.cache_control = f"public, max-age={max_age}, stale-while-revalidate=86400"
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
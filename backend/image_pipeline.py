@@ -0,0 +1,125 @@
+"""Local image processing for generated assets.
+
+Pillow work is CPU bound, so it runs in a shared worker pool rather than on the
+event loop. Pillow releases the GIL while resampling and encoding, which is
+why a thread pool is enough here.
+"""
+import asyncio
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from catalog import SUPPORTED_GENERATION_ASPECTS, get_platform_by_id
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', min(4, os.cpu_count() or 1)))
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+
+# Longest side of the grayscale proxy used to score crop windows
+SALIENCY_SIZE = 256
+
+
+async def run_in_pool(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+
+def shutdown_pool():
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _aspect_value(aspect: str) -> float:
+    w, h = aspect.split(':')
+    return float(w) / float(h)
+
+
+def choose_master_aspect(platform_ids: List[str]) -> str:
+    """Supported ratio that loses the least area to the worst-fitting target crop"""
+    targets = [math.log(p['width'] / p['height']) for p in map(get_platform_by_id, platform_ids)]
+    if not targets:
+        return "1:1"
+    # Kept area of a crop is exp(-|log(master) - log(target)|), so minimise the largest distance
+    return min(
+        SUPPORTED_GENERATION_ASPECTS,
+        key=lambda a: max(abs(math.log(_aspect_value(a)) - t) for t in targets),
+    )
+
+
+def smart_crop_box(image: Image.Image, target_ratio: float) -> Tuple[int, int, int, int]:
+    """Crop box with the target ratio, slid along the free axis to keep the most detail.
+
+    Detail is gradient energy on a small grayscale proxy, with a mild centre bias
+    so flat images fall back to a centred crop.
+    """
+    width, height = image.size
+    if abs(width / height - target_ratio) < 1e-3:
+        return (0, 0, width, height)
+
+    scale = SALIENCY_SIZE / max(width, height)
+    proxy = image.convert('L').resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.BILINEAR)
+    gray = np.asarray(proxy, dtype=np.float32)
+    energy = np.abs(np.diff(gray, axis=0, append=gray[-1:, :])) + np.abs(np.diff(gray, axis=1, append=gray[:, -1:]))
+
+    crop_horizontal = width / height > target_ratio
+    profile = energy.sum(axis=0) if crop_horizontal else energy.sum(axis=1)
+    length = profile.shape[0]
+    window = max(1, min(length, round((height * target_ratio if crop_horizontal else width / target_ratio) * scale)))
+
+    sums = np.convolve(profile, np.ones(window, dtype=np.float32), mode='valid')
+    offsets = np.arange(sums.shape[0], dtype=np.float32)
+    centre = (length - window) / 2
+    spread = max(1.0, (length - window) / 2)
+    bias = 1.0 - 0.25 * ((offsets - centre) / spread) ** 2
+    best = int(np.argmax(sums * bias)) / scale
+
+    if crop_horizontal:
+        crop_w = round(height * target_ratio)
+        left = min(max(0, round(best)), width - crop_w)
+        return (left, 0, left + crop_w, height)
+    crop_h = round(width / target_ratio)
+    top = min(max(0, round(best)), height - crop_h)
+    return (0, top, width, top + crop_h)
+
+
+def render_platform_size(master_path: Path, dest_path: Path, width: int, height: int) -> Path:
+    """Crop and resample the master to an exact platform size (blocking, cached on disk)"""
+    if dest_path.exists():
+        return dest_path
+    with Image.open(master_path) as master:
+        master = master.convert('RGBA' if master.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        box = smart_crop_box(master, width / height)
+        derived = master.resize((width, height), Image.LANCZOS, box=box, reducing_gap=3.0)
+    tmp_path = dest_path.with_name(dest_path.name + '.tmp')
+    derived.save(tmp_path, format='PNG', compress_level=6)
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+
+def platform_derivative_name(master_name: str, platform_id: str) -> str:
+    return f"{Path(master_name).stem}_{platform_id}.png"
+
+
+async def fan_out_platform_sizes(master_path: Path, platform_ids: List[str], out_dir: Path) -> Dict[str, Path]:
+    """Render every requested platform size from one master into out_dir"""
+    results: Dict[str, Path] = {}
+    pending = {}
+    for platform_id in dict.fromkeys(platform_ids):
+        platform = get_platform_by_id(platform_id)
+        dest = out_dir / platform_derivative_name(master_path.name, platform['id'])
+        pending[platform['id']] = run_in_pool(render_platform_size, master_path, dest, platform['width'], platform['height'])
+
+    rendered = await asyncio.gather(*pending.values(), return_exceptions=True)
+    for platform_id, outcome in zip(pending.keys(), rendered):
+        if isinstance(outcome, Exception):
+            logger.error(f"Error deriving {platform_id} from {master_path.name}: {outcome}")
+            continue
+        results[platform_id] = outcome
+    return results
@@ -0,0 +1,227 @@
+"""Keyword and hashtag extraction from scraped site text, scored by TF-IDF.
+
+Text is split into Arabic and English words and normalized: Arabic loses its
+diacritics and tatweel, alef/yaa/taa marbuta variants are folded and the
+definite article and attached prepositions are stripped; English is
+lowercased. Stop words and site boilerplate are dropped.
+
+Document frequencies across every scraped site are kept in ``keyword_terms``
+(one document per term) and each site's term set in ``keyword_docs``.
+Re-scraping a site only ``$inc``s the terms that entered or left its set, so an
+update costs O(terms on that page) and nothing is recomputed in bulk. The term
+counts are written before the site's new term set, which is only stored if no
+other scrape of the site got there first (else the counts are undone), so a
+failure between the two writes can over-count a term but never loses one.
+
+In memory, terms map to slots of a NumPy document-frequency vector and a page
+is scored as a sparse (term ids, counts) vector against it in one vectorized
+pass. Other workers' additions are picked up when the server reloads the index
+every ``KEYWORD_INDEX_RELOAD_SECONDS``; IDF only needs to be roughly current.
+"""
+import asyncio
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+KEYWORDS_PER_SITE = 10
+HASHTAGS_PER_SITE = 5
+# Only a page's most frequent terms count towards document frequency
+MAX_DOC_TERMS = 500
+
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_ARABIC_FOLD = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي', 'ة': 'ه'})
+_ARABIC_CHAR = re.compile('[\u0600-\u06ff]')
+_WORD = re.compile(r'[^\W\d_]+')
+# Longest first; "لل" is "ل" + "ال" with the alef dropped
+_ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+
+ENGLISH_STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further get got had has have having he her
+here hers him his how i if in into is it its just let me more most my no nor not now of off on once only or other
+our ours out over own same she should so some such than that the their theirs them then there these they this
+those through to too under until up very was we were what when where which while who whom why will with would you
+your yours us via per new one two use used using make made may many much every within without across yet
+home page menu contact login sign register account cart checkout search cookie cookies privacy policy terms
+conditions copyright reserved rights skip content read learn click view email phone call follow subscribe
+newsletter site website welcome shop buy free
+""".split())
+
+ARABIC_STOP_WORDS = frozenset("""
+في من على الى إلى عن مع هذا هذه ذلك تلك التي الذي الذين اللذين اللتين هو هي هم هن انت أنت انتم نحن انا أنا كان كانت
+يكون تكون كل بعض غير قد لقد لا لم لن ما ماذا متى اين أين كيف هل او أو ثم حتى بين عند عندما منذ بعد قبل فوق تحت
+حيث لكن لكي كي اذا إذا ان أن إن كما ايضا أيضا جدا فقط هناك هنا به بها لها له لهم عليه عليها فيه فيها منه منها
+انه أنه انها أنها بكم لكم لنا عليكم منكم يا و ف ب ل ك
+الرئيسية اتصل اتصال تواصل معنا تسجيل الدخول دخول حساب السلة سلة بحث الخصوصية سياسة الشروط الأحكام الاحكام
+جميع الحقوق محفوظة اقرأ المزيد مزيد اشترك النشرة البريد الموقع موقع مرحبا
+""".split())
+
+
+def _fold_arabic(word: str) -> str:
+    return word.translate(_ARABIC_FOLD)
+
+
+def _strip_prefix(word: str) -> Tuple[str, str]:
+    """(stem, stripped prefix) of a folded Arabic word"""
+    for prefix in _ARABIC_PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+            return word[len(prefix):], prefix
+    return word, ''
+
+
+_ARABIC_STOP_STEMS = frozenset(_strip_prefix(_fold_arabic(w))[0] for w in ARABIC_STOP_WORDS)
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    """(term, display form) for every keyword candidate in text"""
+    tokens = []
+    for word in _WORD.findall(_ARABIC_MARKS.sub('', text)):
+        if _ARABIC_CHAR.match(word):
+            stem, prefix = _strip_prefix(_fold_arabic(word))
+            if len(stem) < 2 or stem in _ARABIC_STOP_STEMS:
+                continue
+            # Hashtags read "العطور", not "والعطور"/"للعطور"
+            surface = word[len(prefix):]
+            tokens.append((stem, 'ال' + surface if prefix else surface))
+        else:
+            word = word.lower()
+            if len(word) < 3 or word in ENGLISH_STOP_WORDS:
+                continue
+            tokens.append((word, word))
+    return tokens
+
+
+def analyze(text: str) -> Tuple[Counter, Dict[str, str]]:
+    """Term counts of a page (its MAX_DOC_TERMS most frequent terms) and each term's commonest display form"""
+    tokens = tokenize(text)
+    counts = Counter(term for term, _ in tokens)
+    if len(counts) > MAX_DOC_TERMS:
+        counts = Counter(dict(counts.most_common(MAX_DOC_TERMS)))
+    forms: Dict[str, Counter] = {}
+    for term, display in tokens:
+        if term in counts:
+            forms.setdefault(term, Counter())[display] += 1
+    return counts, {term: c.most_common(1)[0][0] for term, c in forms.items()}
+
+
+def to_hashtags(keywords: Iterable[str], limit: int = HASHTAGS_PER_SITE) -> List[str]:
+    return [f"#{keyword}" for keyword in list(keywords)[:limit]]
+
+
+class KeywordIndex:
+    """In-memory document frequencies backed by the keyword_terms/keyword_docs collections"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._df = np.zeros(1024, dtype=np.int64)
+        self.n_docs = 0
+        self._load_lock = asyncio.Lock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._ids)
+
+    async def load(self, db):
+        await db.keyword_terms.create_index('term', unique=True)
+        await db.keyword_docs.create_index('doc_id', unique=True)
+        terms, counts = [], []
+        async for doc in db.keyword_terms.find({"df": {"$gt": 0}}, {"_id": 0, "term": 1, "df": 1}):
+            terms.append(doc['term'])
+            counts.append(doc['df'])
+        n_docs = await db.keyword_docs.count_documents({})
+        df = np.zeros(max(1024, 1 << len(terms).bit_length()), dtype=np.int64)
+        df[:len(counts)] = counts
+        # Swapped in without an await in between, so scoring never sees a half-loaded index
+        self._ids, self._df, self.n_docs = {term: i for i, term in enumerate(terms)}, df, n_docs
+        self.loaded = True
+        logger.info(f"Loaded {len(self)} keyword terms over {self.n_docs} sites")
+
+    async def ensure_loaded(self, db):
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if not self.loaded:
+                await self.load(db)
+
+    def _slot(self, term: str) -> int:
+        slot = self._ids.get(term)
+        if slot is None:
+            slot = self._ids[term] = len(self._ids)
+            if slot >= len(self._df):
+                self._df = np.concatenate([self._df, np.zeros(len(self._df), dtype=np.int64)])
+        return slot
+
+    def _apply(self, added: Iterable[str], removed: Iterable[str], new_doc: bool):
+        for term in added:
+            self._df[self._slot(term)] += 1
+        for term in removed:
+            slot = self._ids.get(term)
+            if slot is not None and self._df[slot] > 0:
+                self._df[slot] -= 1
+        if new_doc:
+            self.n_docs += 1
+
+    async def add_document(self, db, doc_id: str, text: str, limit: int = KEYWORDS_PER_SITE) -> List[str]:
+        """Record a site's terms (replacing an earlier scrape of it) and return its top keywords"""
+        # Tokenizing a page's text is CPU bound; keep it off the event loop
+        counts, forms = await asyncio.to_thread(analyze, text)
+        terms = set(counts)
+        try:
+            await self.ensure_loaded(db)
+            before = await db.keyword_docs.find_one({"doc_id": doc_id}, {"_id": 0, "terms": 1, "updated_at": 1})
+            previous = set(before['terms']) if before else set()
+            added, removed = terms - previous, previous - terms
+            await self._write_counts(db, added, removed)
+            if await self._store_terms(db, doc_id, terms, before):
+                self._apply(added, removed, new_doc=before is None)
+            else:
+                logger.info(f"Keyword index: {doc_id} was re-scraped concurrently, keeping the other scrape's terms")
+                await self._write_counts(db, removed, added)
+        except PyMongoError as e:
+            logger.warning(f"Keyword index not updated for {doc_id}: {e}")
+        return self.top_keywords(counts, forms, limit)
+
+    @staticmethod
+    async def _write_counts(db, added: Iterable[str], removed: Iterable[str]):
+        operations = [UpdateOne({"term": t}, {"$inc": {"df": 1}}, upsert=True) for t in added]
+        operations += [UpdateOne({"term": t}, {"$inc": {"df": -1}}) for t in removed]
+        if operations:
+            await db.keyword_terms.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    async def _store_terms(db, doc_id: str, terms: set, before: Optional[dict]) -> bool:
+        """Replace the site's term set unless another scrape changed it since before was read"""
+        fields = {"terms": sorted(terms), "updated_at": datetime.now(timezone.utc).isoformat()}
+        if before is None:
+            try:
+                await db.keyword_docs.insert_one({"doc_id": doc_id, **fields})
+            except DuplicateKeyError:
+                return False
+            return True
+        result = await db.keyword_docs.update_one(
+            {"doc_id": doc_id, "updated_at": before.get('updated_at')}, {"$set": fields},
+        )
+        return result.matched_count == 1
+
+    def top_keywords(self, counts: Counter, forms: Dict[str, str], limit: int = KEYWORDS_PER_SITE) -> List[str]:
+        """Display forms of the highest TF-IDF terms of one page"""
+        if not counts or limit <= 0:
+            return []
+        terms = list(counts)
+        slots = np.fromiter((self._ids.get(t, -1) for t in terms), dtype=np.int64, count=len(terms))
+        df = np.where(slots >= 0, self._df[np.maximum(slots, 0)], 0)
+        tf = 1 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(terms)))
+        idf = np.log((1 + self.n_docs) / (1 + df)) + 1
+        scores = tf * idf
+        k = min(limit, len(terms))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [forms[terms[i]] for i in top]
@@ -0,0 +1,307 @@
+"""In-process metrics exposed in the Prometheus text format at /metrics.
+
+Counters, gauges and histograms are plain Python objects guarded by a lock, so
+recording a sample is a dict lookup and a few additions; nothing is exported
+until Prometheus scrapes. Route latency is recorded by an ASGI middleware keyed
+by the matched route template, MongoDB timings by a pymongo command listener,
+and cache statistics are read from the caches themselves at scrape time.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers cache hits through multi-minute generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_text(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(counts), total[0]) for k, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+            labels = _label_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._callbacks: List[Tuple[Gauge, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name: str, documentation: str, labelnames: Sequence[str],
+                       read: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        """A gauge whose samples are read from read() at scrape time"""
+        self._callbacks.append((Gauge(name, documentation, labelnames), read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.header()
+            lines += metric.collect()
+        for gauge, read in self._callbacks:
+            for labels, value in read():
+                gauge.set(value, **labels)
+            lines += gauge.header()
+            lines += gauge.collect()
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template',
+    ('method', 'route', 'status'))
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    'http_requests_in_flight', 'HTTP requests currently being served')
+MONGO_COMMAND_DURATION = REGISTRY.histogram(
+    'mongodb_command_duration_seconds', 'MongoDB command latency by collection and command',
+    ('collection', 'command', 'outcome'), DB_BUCKETS)
+SCRAPER_DURATION = REGISTRY.histogram(
+    'scraper_duration_seconds', 'Website scraping time by phase', ('phase',))
+KIE_REQUEST_DURATION = REGISTRY.histogram(
+    'kie_request_duration_seconds', 'kie.ai call latency by operation', ('operation', 'outcome'))
+KIE_TASKS = REGISTRY.counter(
+    'kie_tasks_total', 'kie.ai generation tasks by final state', ('outcome',))
+GENERATIONS_IN_FLIGHT = REGISTRY.gauge(
+    'generations_in_flight', 'Generation requests currently running', ('kind',))
+GENERATION_STAGE_DURATION = REGISTRY.histogram(
+    'generation_stage_duration_seconds', 'Time spent per traced generation stage', ('stage',))
+RATE_LIMITED = REGISTRY.counter(
+    'rate_limited_requests_total', 'Requests rejected with 429 by route and bucket scope', ('route', 'scope'))
+SCHEDULER_WAIT = REGISTRY.histogram(
+    'scheduler_wait_seconds', 'Time generation calls waited for an upstream slot', ('priority',))
+COALESCED_UPDATES = REGISTRY.counter(
+    'coalesced_updates_total', 'Project updates queued for write-behind batching')
+COALESCER_FLUSHES = REGISTRY.counter(
+    'coalescer_bulk_writes_total', 'bulk_write calls issued by the write coalescer')
+
+
+_caches: Dict[str, Tuple[Callable[[], int], Callable[[], int]]] = {}
+
+
+def observe_cache(name: str, hits: Callable[[], int], misses: Callable[[], int]):
+    """Expose hit/miss counts and the hit ratio of a cache that counts its own lookups"""
+    _caches[name] = (hits, misses)
+
+
+def _cache_samples(which: str):
+    for name, (hits, misses) in _caches.items():
+        h, m = hits(), misses()
+        if which == 'hits':
+            yield {'cache': name}, h
+        elif which == 'misses':
+            yield {'cache': name}, m
+        else:
+            yield {'cache': name}, (h / (h + m)) if h + m else 0.0
+
+
+REGISTRY.gauge_callback('cache_hits', 'Cache hits since start', ('cache',), lambda: _cache_samples('hits'))
+REGISTRY.gauge_callback('cache_misses', 'Cache misses since start', ('cache',), lambda: _cache_samples('misses'))
+REGISTRY.gauge_callback('cache_hit_ratio', 'Cache hit ratio since start', ('cache',), lambda: _cache_samples('ratio'))
+
+
+def observe_scheduler(queue_depths: Callable[[], Dict[str, int]], active: Callable[[], int]):
+    """Expose queue depth per priority class and busy upstream slots of the generation scheduler"""
+    REGISTRY.gauge_callback('scheduler_queue_depth', 'Generation calls waiting for an upstream slot', ('priority',),
+                            lambda: (({'priority': p}, n) for p, n in queue_depths().items()))
+    REGISTRY.gauge_callback('scheduler_active_slots', 'Upstream slots in use', (), lambda: [({}, active())])
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo listener recording per-collection command latency"""
+
+    def __init__(self, histogram: Histogram = MONGO_COMMAND_DURATION):
+        self.histogram = histogram
+        self._collections: Dict[Tuple[object, int], str] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ''
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), '')
+        self.histogram.observe(event.duration_micros / 1e6, collection=collection,
+                               command=event.command_name, outcome=outcome)
+
+    def succeeded(self, event):
+        self._finish(event, 'success')
+
+    def failed(self, event):
+        self._finish(event, 'failure')
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """Time a block, labelling it outcome="success" or "error" """
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'success'
+    finally:
+        histogram.observe(time.perf_counter() - started, outcome=outcome, **labels)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency per matched route template"""
+
+    def __init__(self, app, skip_paths: Sequence[str] = ('/metrics',)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get('route')
+            # Unmatched paths share one label so scanners cannot blow up cardinality
+            template = getattr(route, 'path', None) or 'unmatched'
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method=scope['method'],
+                                          route=template, status=str(status))
+
+
+def render_latest(registry: Optional[Registry] = None) -> str:
+    return (registry or REGISTRY).render()
@@ -0,0 +1,152 @@
+"""Perceptual hashes of saved images and a Hamming-distance index over them.
+
+Every saved asset gets a 64-bit DCT perceptual hash (pHash). The index keeps
+all hashes in one NumPy uint64 array, so a lookup is one vectorized XOR and
+popcount over the whole collection, optionally narrowed to a project or brand.
+Hashes are persisted in the ``asset_hashes`` collection and loaded on first use.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+HIGHFREQ_FACTOR = 4
+IMG_SIZE = HASH_SIZE * HIGHFREQ_FACTOR
+
+# Hashes this close (out of 64 bits) are treated as the same picture
+NEAR_DUPLICATE_DISTANCE = 6
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0, :] = np.sqrt(1 / n)
+    return matrix
+
+
+_DCT = _dct_matrix(IMG_SIZE)
+_BIT_WEIGHTS = (np.uint64(1) << np.arange(63, -1, -1, dtype=np.uint64))
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int(np.bitwise_or.reduce(bits.astype(np.uint64).ravel() * _BIT_WEIGHTS))
+
+
+def phash_image(image: Image.Image) -> int:
+    gray = image.convert('L').resize((IMG_SIZE, IMG_SIZE), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    coeffs = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only encodes overall brightness, so leave it out of the median
+    median = np.median(coeffs.ravel()[1:])
+    return _pack(coeffs > median)
+
+
+def compute_phash(path: Path) -> int:
+    """pHash of an image file (blocking; run in the image worker pool)"""
+    with Image.open(path) as image:
+        image.draft('L', (IMG_SIZE * 4, IMG_SIZE * 4))
+        return phash_image(image)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_int64(value: int) -> int:
+    """MongoDB stores signed 64-bit integers"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def from_int64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def brand_key(project: dict) -> str:
+    return ' '.join((project.get('company_name') or '').lower().split())
+
+
+class PerceptualIndex:
+    """In-memory hash index backed by the asset_hashes collection"""
+
+    def __init__(self):
+        self._hashes: List[int] = []
+        self._meta: List[dict] = []
+        self._array: Optional[np.ndarray] = None
+        self._load_lock = asyncio.Lock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._hashes)
+
+    async def load(self, db):
+        self._hashes, self._meta = [], []
+        async for doc in db.asset_hashes.find({}, {"_id": 0}):
+            self._append(from_int64(doc['phash']), doc)
+        self.loaded = True
+        logger.info(f"Loaded {len(self)} perceptual hashes")
+
+    async def ensure_loaded(self, db):
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if not self.loaded:
+                await self.load(db)
+
+    def project_hashes(self, project_id: str) -> List[Dict]:
+        return [{**meta, "phash": value} for value, meta in zip(self._hashes, self._meta) if meta['project_id'] == project_id]
+
+    def _append(self, value: int, meta: dict):
+        self._hashes.append(value)
+        self._meta.append({k: meta.get(k) for k in ('url', 'project_id', 'brand_key')})
+        self._array = None
+
+    async def add(self, db, value: int, url: str, project: dict):
+        doc = {
+            "url": url,
+            "project_id": project.get('id'),
+            "brand_key": brand_key(project),
+            "phash": to_int64(value),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await db.asset_hashes.insert_one(dict(doc))
+        self._append(value, doc)
+
+    async def remove_project(self, db, project_id: str):
+        await db.asset_hashes.delete_many({"project_id": project_id})
+        keep = [i for i, meta in enumerate(self._meta) if meta['project_id'] != project_id]
+        self._hashes = [self._hashes[i] for i in keep]
+        self._meta = [self._meta[i] for i in keep]
+        self._array = None
+
+    def _as_array(self) -> np.ndarray:
+        if self._array is None:
+            self._array = np.array(self._hashes, dtype=np.uint64)
+        return self._array
+
+    def search(self, value: int, max_distance: int = NEAR_DUPLICATE_DISTANCE,
+               project_id: Optional[str] = None, brand: Optional[str] = None,
+               limit: int = 20) -> List[Dict]:
+        """Indexed assets within max_distance bits of value, nearest first"""
+        if not self._hashes:
+            return []
+        distances = np.bitwise_count(self._as_array() ^ np.uint64(value))
+        candidates = np.nonzero(distances <= max_distance)[0]
+        matches = []
+        for i in candidates[np.argsort(distances[candidates], kind='stable')]:
+            meta = self._meta[i]
+            if project_id is not None and meta['project_id'] != project_id:
+                continue
+            if brand is not None and meta['brand_key'] != brand:
+                continue
+            matches.append({**meta, "distance": int(distances[i])})
+            if len(matches) >= limit:
+                break
+        return matches
@@ -0,0 +1,123 @@
+"""Opt-in cProfile capture of single requests.
+
+A request is profiled only when it carries ``X-Profile: 1`` (or ``?profile=1``)
+together with the ``X-Admin-Token`` that guards the other maintenance routes.
+Everything else passes straight through after a cheap header check. Profiles
+are written as pstats files to a directory capped at PROFILE_MAX_FILES and
+their id is returned in the ``X-Profile-Id`` response header.
+
+cProfile observes the whole event-loop thread, so other requests running at
+the same time show up in the profile too; one profile is captured at a time.
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 50))
+PROFILE_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_FLAG_HEADER = b'x-profile'
+_TOKEN_HEADER = b'x-admin-token'
+_FLAG_VALUES = ('1', 'true')
+
+
+def profile_path(profile_dir: Path, profile_id: str) -> Optional[Path]:
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = profile_dir / f"{profile_id}.pstats"
+    return path if path.is_file() else None
+
+
+def list_profiles(profile_dir: Path) -> List[dict]:
+    profiles = []
+    for path in sorted(profile_dir.glob('*.pstats'), key=lambda p: p.stat().st_mtime, reverse=True):
+        st = path.stat()
+        profiles.append({"id": path.stem, "size": st.st_size, "created_at": st.st_mtime})
+    return profiles
+
+
+def render_stats(path: Path, sort: str = 'cumulative', limit: int = 60) -> str:
+    """Plain-text pstats summary of a saved profile"""
+    out = io.StringIO()
+    stats = pstats.Stats(str(path), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def _prune(profile_dir: Path, keep: int):
+    files = sorted(profile_dir.glob('*.pstats'), key=lambda p: p.stat().st_mtime)
+    for path in files[:max(0, len(files) - keep)]:
+        path.unlink(missing_ok=True)
+
+
+def _save(profiler: cProfile.Profile, path: Path, keep: int):
+    profiler.dump_stats(str(path))
+    _prune(path.parent, keep)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware running opted-in requests under cProfile"""
+
+    def __init__(self, app, profile_dir: Path, max_files: int = PROFILE_MAX_FILES):
+        self.app = app
+        self.profile_dir = Path(profile_dir)
+        self.max_files = max_files
+        self._lock = asyncio.Lock()
+
+    def _wants_profile(self, scope) -> bool:
+        flag = token = None
+        for name, value in scope['headers']:
+            if name == _FLAG_HEADER:
+                flag = value
+            elif name == _TOKEN_HEADER:
+                token = value
+        if flag is None and not self._query_flag(scope):
+            return False
+        admin_token = os.environ.get('ADMIN_TOKEN')
+        return bool(admin_token) and token == admin_token.encode() and (flag is None or flag.decode('latin-1') in _FLAG_VALUES)
+
+    @staticmethod
+    def _query_flag(scope) -> bool:
+        query = scope.get('query_string', b'')
+        # Substring test first so ordinary requests skip parsing
+        if b'profile' not in query:
+            return False
+        return parse_qs(query.decode('latin-1')).get('profile', [''])[-1] in _FLAG_VALUES
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._wants_profile(scope) or self._lock.locked():
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                message.setdefault('headers', [])
+                message['headers'] = list(message['headers']) + [(b'x-profile-id', profile_id.encode())]
+            await send(message)
+
+        async with self._lock:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - started
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                path = self.profile_dir / f"{profile_id}.pstats"
+                await asyncio.to_thread(_save, profiler, path, self.max_files)
+                logger.info(f"Profiled {scope['method']} {scope['path']} in {elapsed * 1000:.0f} ms as {profile_id}")
@@ -0,0 +1,173 @@
+"""Prompt engine for image and video generation.
+
+Static parts of a prompt (strategy instructions, platform specs, language rules)
+are compiled once per (strategy, platform, language) into a string.Template, so
+building a prompt only substitutes the project fields. Finished prompts are
+memoized per project revision and variation.
+"""
+from functools import lru_cache
+from string import Template
+from typing import List, Optional
+
+from cachetools import LRUCache
+
+from catalog import get_strategy_by_id, get_platform_by_id
+
+# Site keywords passed to the image/video model
+KEYWORDS_IN_PROMPT = 8
+
+VARIATION_STYLES = ["Clean and minimalist", "Bold and dynamic", "Elegant and sophisticated"]
+
+LANGUAGE_REQUIREMENTS = {
+    'ar': "Arabic text, RTL flow",
+    'en': "English text, LTR flow",
+}
+
+IMAGE_TEMPLATE = """Create a HIGH-CONVERTING advertisement image:
+
+BRAND: $company_name
+Description: $company_description
+Strengths: $strengths$keywords
+
+COLORS: Primary $primary, Secondary $secondary, Accent $accent
+
+PLATFORM: {platform_name} ({width}x{height})
+
+NEUROMARKETING STRATEGY: {strategy_name}
+{visual_instructions}
+
+STYLE: $style
+
+REQUIREMENTS:
+- {language_requirement}
+- Mobile-optimized, readable on small screens
+- Modern professional aesthetic
+- Apply psychological strategy exactly"""
+
+VIDEO_TEMPLATE = """Create SHORT-FORM VIDEO AD (5-10 seconds loop):
+
+BRAND: $company_name
+Product: $company_description$keywords
+
+STRATEGY: {strategy_name}
+{video_instructions}
+
+SPECS: Modern, cinematic, high-energy. Capture attention in FIRST FRAME. Smooth transitions."""
+
+# Memoized prompts keyed by (kind, project revision, variation)
+_prompt_cache = LRUCache(maxsize=8192)
+prompt_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _escape(value: str) -> str:
+    """Catalog text is baked into a Template, so a literal $ must not become a placeholder"""
+    return str(value).replace('$', '$$')
+
+
+def _canonical_ids(project: dict):
+    """Catalog ids the project resolves to, so unknown values share the default's cache entry"""
+    language = project.get('language', 'ar')
+    return (
+        get_strategy_by_id(project.get('psychological_strategy_id', 'hook'))['id'],
+        get_platform_by_id(project.get('platform', 'post_square'))['id'],
+        language if language in LANGUAGE_REQUIREMENTS else 'ar',
+    )
+
+
+# Keys are canonical catalog ids (a few hundred combinations); the bound only guards direct callers
+@lru_cache(maxsize=512)
+def compile_image_template(strategy_id: str, platform_id: str, language: str) -> Template:
+    strategy = get_strategy_by_id(strategy_id)
+    platform = get_platform_by_id(platform_id)
+    return Template(IMAGE_TEMPLATE.format(
+        platform_name=_escape(platform['name_en']),
+        width=platform['width'],
+        height=platform['height'],
+        strategy_name=_escape(strategy['name_en']),
+        visual_instructions=_escape(strategy['visual_instructions']),
+        language_requirement=LANGUAGE_REQUIREMENTS.get(language, LANGUAGE_REQUIREMENTS['ar']),
+    ))
+
+
+@lru_cache(maxsize=64)
+def compile_video_template(strategy_id: str) -> Template:
+    strategy = get_strategy_by_id(strategy_id)
+    return Template(VIDEO_TEMPLATE.format(
+        strategy_name=_escape(strategy['name_en']),
+        video_instructions=_escape(strategy.get('video_instructions', strategy['visual_instructions'])),
+    ))
+
+
+def _keywords_line(project: dict) -> str:
+    """Top keywords of the project's scraped site, if it was scraped"""
+    keywords = (project.get('scraped_data') or {}).get('keywords') or []
+    return f"\nKeywords: {', '.join(keywords[:KEYWORDS_IN_PROMPT])}" if keywords else ''
+
+
+def project_revision(project: dict) -> Optional[str]:
+    """Identify a stored project version; ad-hoc dicts without an id are not memoized"""
+    if not project.get('id'):
+        return None
+    return f"{project['id']}@{project.get('updated_at', '')}"
+
+
+def build_advanced_image_prompt(project: dict, variation: int = 1) -> str:
+    revision = project_revision(project)
+    key = ('image', revision, variation)
+    if revision is not None:
+        cached = _prompt_cache.get(key)
+        if cached is not None:
+            prompt_cache_stats['hits'] += 1
+            return cached
+        prompt_cache_stats['misses'] += 1
+
+    template = compile_image_template(*_canonical_ids(project))
+    brand_colors = project.get('brand_colors', {}) or {}
+    style = VARIATION_STYLES[variation - 1] if 1 <= variation <= len(VARIATION_STYLES) else VARIATION_STYLES[0]
+    prompt = template.substitute(
+        company_name=project.get('company_name', 'Brand'),
+        company_description=project.get('company_description', ''),
+        strengths=', '.join(project.get('strengths', [])),
+        keywords=_keywords_line(project),
+        primary=brand_colors.get('primary', '#000000'),
+        secondary=brand_colors.get('secondary', '#FFFFFF'),
+        accent=brand_colors.get('accent', '#3B82F6'),
+        style=style,
+    )
+
+    if revision is not None:
+        _prompt_cache[key] = prompt
+    return prompt
+
+
+def build_advanced_video_prompt(project: dict) -> str:
+    revision = project_revision(project)
+    key = ('video', revision, 0)
+    if revision is not None:
+        cached = _prompt_cache.get(key)
+        if cached is not None:
+            prompt_cache_stats['hits'] += 1
+            return cached
+        prompt_cache_stats['misses'] += 1
+
+    template = compile_video_template(_canonical_ids(project)[0])
+    prompt = template.substitute(
+        company_name=project.get('company_name', 'Brand'),
+        company_description=project.get('company_description', ''),
+        keywords=_keywords_line(project),
+    )
+
+    if revision is not None:
+        _prompt_cache[key] = prompt
+    return prompt
+
+
+def clear_prompt_cache():
+    _prompt_cache.clear()
+
+
+def fan_out_composition_note(platform_ids: List[str]) -> str:
+    """Extra instructions for a master image that will be cropped to several platform sizes"""
+    aspects = ', '.join(dict.fromkeys(get_platform_by_id(p)['aspect'] for p in platform_ids))
+    return (f"\n\nCOMPOSITION: This master image will be cropped to {aspects}. "
+            "Keep the subject, logo and all text inside the central safe area, away from the edges.")
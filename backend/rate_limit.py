@@ -0,0 +1,215 @@
+"""Token-bucket rate limits for the expensive routes.
+
+Each limited route has a bucket per signed-in user and a bucket per client IP;
+a request spends one token from every bucket that applies and is rejected with
+429 and ``Retry-After`` when any of them is empty (the tokens it already took
+from the other buckets are given back). Buckets refill continuously
+at ``capacity / period`` tokens per second, so short bursts up to the capacity
+are allowed while the long-run rate stays bounded.
+
+Limits come from ``DEFAULT_LIMITS`` and can be overridden per route with
+``RATE_LIMIT_<ROUTE>`` (e.g. ``RATE_LIMIT_GENERATE_CONTENT="user=5/60,ip=10/60"``).
+Buckets live in process memory by default; with ``RATE_LIMIT_BACKEND=mongo``
+they are kept in the ``rate_limits`` collection so every worker shares them.
+
+The client IP is taken from the ASGI scope, so behind a proxy run uvicorn with
+``--proxy-headers`` and ``FORWARDED_ALLOW_IPS`` set to the proxy's address.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from metrics import RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Bucket:
+    capacity: int
+    period: float  # seconds to refill from empty to full
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+@dataclass(frozen=True)
+class RouteLimit:
+    user: Optional[Bucket] = None
+    ip: Optional[Bucket] = None
+
+
+DEFAULT_LIMITS: Dict[str, RouteLimit] = {
+    'generate-content': RouteLimit(user=Bucket(5, 60), ip=Bucket(10, 60)),
+    'generate-video': RouteLimit(user=Bucket(2, 300), ip=Bucket(4, 300)),
+    'scrape': RouteLimit(user=Bucket(10, 60), ip=Bucket(20, 60)),
+}
+
+
+def parse_limit(value: str) -> RouteLimit:
+    """``"user=5/60,ip=10/60"`` -> RouteLimit; ``"off"`` disables the route's limits"""
+    buckets = {}
+    if value.strip().lower() not in ('', 'off', 'none'):
+        for part in value.split(','):
+            scope, _, spec = part.strip().partition('=')
+            capacity, _, period = spec.partition('/')
+            if scope not in ('user', 'ip') or not capacity or not period:
+                raise ValueError(f"Invalid rate limit {part!r}, expected e.g. user=5/60")
+            buckets[scope] = Bucket(int(capacity), float(period))
+    return RouteLimit(**buckets)
+
+
+def load_limits() -> Dict[str, RouteLimit]:
+    limits = dict(DEFAULT_LIMITS)
+    for name in limits:
+        override = os.environ.get(f"RATE_LIMIT_{name.upper().replace('-', '_')}")
+        if override is not None:
+            limits[name] = parse_limit(override)
+    return limits
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    retry_after: float  # seconds until a token is available (0 when allowed)
+
+
+def _refill(tokens: float, updated_at: float, now: float, bucket: Bucket) -> float:
+    return min(bucket.capacity, tokens + max(0.0, now - updated_at) * bucket.rate)
+
+
+def _decide(tokens: float, bucket: Bucket, cost: float) -> Decision:
+    if tokens >= cost:
+        return Decision(True, 0.0)
+    return Decision(False, (cost - tokens) / bucket.rate)
+
+
+class MemoryBucketStore:
+    """Buckets of this process only; each worker enforces the limits on its own"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at), least recently used first
+        self._buckets: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    async def take(self, key: str, bucket: Bucket, cost: float = 1.0) -> Decision:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (bucket.capacity, now))
+        tokens = _refill(tokens, updated_at, now, bucket)
+        decision = _decide(tokens, bucket, cost)
+        self._buckets[key] = (tokens - cost if decision.allowed else tokens, now)
+        if len(self._buckets) > self.max_keys:
+            # Least recently used buckets have had the longest to refill, so dropping them costs nothing
+            self._buckets.popitem(last=False)
+        return decision
+
+
+class MongoBucketStore:
+    """Buckets shared by all workers, one document per key in ``rate_limits``.
+
+    Updates are compare-and-swap on ``updated_at``; a bucket that keeps losing
+    the race is under a burst from its own client, so the request is refused.
+    If MongoDB itself fails the request is let through rather than failing the route.
+    """
+
+    ATTEMPTS = 4
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    async def ensure_indexes(self):
+        if not self._indexed:
+            await self.collection.create_index('expires_at', expireAfterSeconds=0)
+            self._indexed = True
+
+    async def take(self, key: str, bucket: Bucket, cost: float = 1.0) -> Decision:
+        try:
+            await self.ensure_indexes()
+            for _ in range(self.ATTEMPTS):
+                doc = await self.collection.find_one({"_id": key})
+                now = time.time()
+                tokens = bucket.capacity if doc is None else _refill(doc['tokens'], doc['updated_at'], now, bucket)
+                decision = _decide(tokens, bucket, cost)
+                if not decision.allowed:
+                    return decision
+                fields = {
+                    "tokens": tokens - cost,
+                    "updated_at": now,
+                    # Once full again the bucket is indistinguishable from a missing one
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=bucket.period),
+                }
+                if doc is None:
+                    try:
+                        await self.collection.insert_one({"_id": key, **fields})
+                        return decision
+                    except DuplicateKeyError:
+                        continue
+                result = await self.collection.update_one({"_id": key, "updated_at": doc['updated_at']}, {"$set": fields})
+                if result.modified_count:
+                    return decision
+                await asyncio.sleep(0)
+            return Decision(False, 1.0)
+        except PyMongoError as e:
+            logger.warning(f"Rate limit check for {key} skipped: {e}")
+            return Decision(True, 0.0)
+
+
+def create_bucket_store(db):
+    if os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower() == 'mongo':
+        logger.info("Using shared MongoDB rate limit buckets")
+        return MongoBucketStore(db.rate_limits)
+    return MemoryBucketStore()
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, RouteLimit], store=None):
+        self.limits = limits
+        self.store = store or MemoryBucketStore()
+        self.enabled = os.environ.get('RATE_LIMIT_ENABLED', '1') not in ('0', 'false')
+
+    async def check(self, route: str, user_id: Optional[str], ip: Optional[str]):
+        """Spend a token from each applicable bucket; raises 429 if one is empty"""
+        limit = self.limits.get(route)
+        if not self.enabled or limit is None:
+            return
+        checks = []
+        if limit.user and user_id:
+            checks.append(('user', f"{route}:user:{user_id}", limit.user))
+        if limit.ip and ip:
+            checks.append(('ip', f"{route}:ip:{ip}", limit.ip))
+        taken = []
+        for scope, key, bucket in checks:
+            decision = await self.store.take(key, bucket)
+            if decision.allowed:
+                taken.append((key, bucket))
+            else:
+                # A negative cost returns the token; refill caps the bucket at capacity on its next read
+                for taken_key, taken_bucket in taken:
+                    await self.store.take(taken_key, taken_bucket, -1.0)
+                RATE_LIMITED.inc(route=route, scope=scope)
+                retry_after = max(1, math.ceil(decision.retry_after))
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Too many requests, retry in {retry_after}s",
+                    headers={"Retry-After": str(retry_after)},
+                )
+
+    def dependency(self, route: str, identify):
+        """FastAPI dependency for a route; ``identify(request)`` returns the user id or None"""
+        async def enforce(request: Request):
+            limit = self.limits.get(route)
+            if not self.enabled or limit is None:
+                return
+            user_id = await identify(request) if limit.user else None
+            await self.check(route, user_id, request.client.host if request.client else None)
+        return enforce
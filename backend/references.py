@@ -0,0 +1,110 @@
+"""Reference images sent to the generator alongside the prompt.
+
+Project images (user uploads or scraped URLs) are downscaled and recompressed
+to what the model needs before the generator fetches them. The normalized copy
+is cached in storage per source, so each original is only processed once.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+from PIL import Image, ImageOps
+
+from downloads import stream_download
+from image_pipeline import run_in_pool
+from storage import StorageBackend, asset_key, resolve_asset_key
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_MAX_SIDE = int(os.environ.get('REFERENCE_MAX_SIDE', 1024))
+REFERENCE_QUALITY = 85
+# Nano Banana Pro accepts at most 8 input images
+MAX_REFERENCE_IMAGES = 8
+
+UPLOAD_URL_PREFIX = "/api/uploads/"
+
+
+def normalize_reference(src: Path, dest: Path, max_side: int = REFERENCE_MAX_SIDE) -> Path:
+    """Downscale to max_side and re-encode as a metadata-free JPEG (blocking)"""
+    with Image.open(src) as image:
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            rgba = image.convert('RGBA')
+            flattened = Image.new('RGB', rgba.size, (255, 255, 255))
+            flattened.paste(rgba, mask=rgba.split()[-1])
+            image = flattened
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(dest, format='JPEG', quality=REFERENCE_QUALITY, optimize=True, progressive=True)
+    return dest
+
+
+def reference_name(source: str) -> str:
+    digest = hashlib.sha1(source.encode('utf-8')).hexdigest()[:24]
+    return f"{digest}_r{REFERENCE_MAX_SIDE}.jpg"
+
+
+async def _normalize_into_storage(storage: StorageBackend, src: Path, key: str, tmp_dir: Path):
+    dest = tmp_dir / f"{uuid.uuid4().hex}.jpg"
+    try:
+        await run_in_pool(normalize_reference, src, dest)
+        await storage.put_file(key, dest, 'image/jpeg')
+    finally:
+        dest.unlink(missing_ok=True)
+
+
+async def prepare_reference(storage: StorageBackend, image_url: str, tmp_dir: Path) -> Optional[str]:
+    """Storage key of the normalized copy of one project image, creating it if needed"""
+    name = reference_name(image_url)
+    key = asset_key('references', name)
+    if await storage.exists(key):
+        return key
+
+    if image_url.startswith(UPLOAD_URL_PREFIX):
+        source_key = await resolve_asset_key(storage, 'uploads', image_url[len(UPLOAD_URL_PREFIX):].split('?', 1)[0])
+        if source_key is None:
+            return None
+        async with storage.materialized(source_key, tmp_dir) as src:
+            await _normalize_into_storage(storage, src, key, tmp_dir)
+    elif image_url.startswith(('http://', 'https://')):
+        src = tmp_dir / f"{uuid.uuid4().hex}.part"
+        try:
+            async with httpx.AsyncClient(timeout=httpx.Timeout(15.0, read=30.0), follow_redirects=True) as client:
+                await stream_download(client, image_url, src, max_bytes=25 * 1024 * 1024, retries=1)
+            await _normalize_into_storage(storage, src, key, tmp_dir)
+        finally:
+            src.unlink(missing_ok=True)
+    else:
+        return None
+    return key
+
+
+async def prepare_reference_images(storage: StorageBackend, images: List[str], tmp_dir: Path,
+                                   public_base_url: Optional[str]) -> List[str]:
+    """Publicly fetchable URLs of normalized reference images for the generator"""
+    sources = list(dict.fromkeys(images))[:MAX_REFERENCE_IMAGES]
+    keys = await asyncio.gather(*(prepare_reference(storage, url, tmp_dir) for url in sources), return_exceptions=True)
+
+    urls = []
+    for image_url, key in zip(sources, keys):
+        if isinstance(key, Exception):
+            logger.error(f"Error preparing reference image {image_url}: {key}")
+            continue
+        if key is None:
+            continue
+        direct_url = await storage.url_for(key)
+        if direct_url:
+            urls.append(direct_url)
+        elif public_base_url:
+            urls.append(f"{public_base_url.rstrip('/')}/api/references/{key.rsplit('/', 1)[-1]}")
+        else:
+            logger.warning("PUBLIC_BASE_URL is not set; reference images cannot be sent to the generator")
+            break
+    return urls
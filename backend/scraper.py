@@ -0,0 +1,227 @@
+"""Website scraping and brand analysis for new projects.
+
+Fetching and parsing are separate steps: ``fetch_html`` does the network I/O and
+``parse_website`` turns a page into ``WebsiteData`` without touching the network,
+so the parser can be benchmarked and reused on saved pages. Parsing is CPU
+bound and runs in a worker thread so a large page does not stall the event
+loop. BeautifulSoup is imported on first parse to keep it off the server's
+cold-start path.
+"""
+import asyncio
+import colorsys
+import logging
+import re
+from typing import List, Optional
+
+import httpx
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+
+from metrics import SCRAPER_DURATION
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+# Page text kept for keyword extraction
+KEYWORD_TEXT_CHARS = 20000
+
+
+class BrandAnalysis(BaseModel):
+    brand_voice: str = ""
+    color_palette: List[str] = []
+    primary_color: str = ""
+    secondary_color: str = ""
+    accent_color: str = ""
+    tone: str = ""
+    industry: str = ""
+
+
+class WebsiteData(BaseModel):
+    title: str = ""
+    description: str = ""
+    services: List[str] = []
+    images: List[str] = []
+    keywords: List[str] = []
+    hashtags: List[str] = []
+    brand_analysis: Optional[BrandAnalysis] = None
+    # Visible page text for the keyword index; not sent to clients
+    text: str = Field("", exclude=True)
+
+
+def extract_colors_from_css(css_text: str) -> List[str]:
+    hex_pattern = r'#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})'
+    colors = re.findall(hex_pattern, css_text)
+    colors = ['#' + (c*2 if len(c) == 3 else c) for c in colors]
+    return list(set(colors))[:10]
+
+
+def analyze_brand_voice(text: str) -> str:
+    text_lower = text.lower()
+    if any(word in text_lower for word in ['luxury', 'premium', 'فاخر', 'حصري']):
+        return 'luxury'
+    elif any(word in text_lower for word in ['fun', 'exciting', 'مرح', 'ممتع']):
+        return 'playful'
+    elif any(word in text_lower for word in ['professional', 'trusted', 'موثوق']):
+        return 'formal'
+    return 'friendly'
+
+
+def get_color_tone(hex_color: str) -> str:
+    try:
+        hex_color = hex_color.lstrip('#')
+        r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+        h, s, v = colorsys.rgb_to_hsv(r/255, g/255, b/255)
+        hue = h * 360
+        if 0 <= hue < 60 or 300 <= hue <= 360:
+            return 'warm'
+        elif 180 <= hue < 300:
+            return 'cool'
+        return 'neutral'
+    except Exception:
+        return 'neutral'
+        return 'neutral'
+
+
+def extract_brand_name(soup, default_title: str, url: str = "") -> str:
+    # 1. Try Open Graph Site Name
+    og_site_name = soup.find('meta', property='og:site_name')
+    if og_site_name and og_site_name.get('content'):
+        return og_site_name.get('content').strip()
+    
+    # 2. Try JSON-LD (Search for Organization)
+    import json
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            if not script.string: continue
+            data = json.loads(script.string)
+            
+            def check_org(d):
+                if isinstance(d, dict) and d.get('@type') == 'Organization' and d.get('name'):
+                    return d.get('name')
+                return None
+
+            if isinstance(data, dict):
+                res = check_org(data)
+                if res: return res
+                if '@graph' in data:
+                    for item in data['@graph']:
+                        res = check_org(item)
+                        if res: return res
+        except:
+            pass
+
+    # 3. Clean Title Heuristic
+    if default_title:
+        # Common separators in page titles
+        separators = ['|', '-', '—', ':', '•', '–', '«', '»']
+        
+        for sep in separators:
+            if sep in default_title:
+                parts = [p.strip() for p in default_title.split(sep) if p.strip()]
+                if not parts: continue
+                # Usually the brand name is the shortest part, often at the end or beginning
+                candidates = [p for p in parts if len(p) < 40] 
+                if candidates:
+                    # Pick the shortest one as likely brand name
+                    return min(candidates, key=len)
+    
+    # 4. Fallback: Domain name
+    if url:
+        try:
+            from urllib.parse import urlparse
+            domain = urlparse(url).netloc
+            if not domain: domain = url
+            if domain.startswith('www.'):
+                domain = domain[4:]
+            if '.' in domain:
+                name = domain.rsplit('.', 1)[0]
+                return name.replace('-', ' ').title()
+        except:
+            pass
+                    
+    return default_title
+
+
+def normalize_url(url: str) -> str:
+    if url.startswith('/'):
+        url = url.lstrip('/')
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    return url
+
+
+def site_key(url: str) -> str:
+    """Host a page belongs to, so re-scraping any page of a site replaces its keyword document"""
+    from urllib.parse import urlparse
+    host = urlparse(normalize_url(url)).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+async def fetch_html(url: str) -> str:
+    headers = {'User-Agent': USER_AGENT}
+    async with httpx.AsyncClient(verify=False, follow_redirects=True, timeout=30.0) as client:
+        response = await client.get(url, headers=headers)
+        if response.status_code != 200:
+            raise HTTPException(status_code=400, detail=f"Could not fetch website: {response.status_code}")
+        return response.text
+
+
+def parse_website(html: str, url: str) -> WebsiteData:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    raw_title = soup.title.string if soup.title else ""
+    title = extract_brand_name(soup, raw_title, url)
+    description = ""
+    meta_desc = soup.find('meta', attrs={'name': 'description'})
+    if meta_desc:
+        description = meta_desc.get('content', '')
+    
+    page_text = soup.get_text(separator=' ', strip=True)
+    all_text = page_text[:2000]
+    colors = []
+    for style_tag in soup.find_all('style'):
+        colors.extend(extract_colors_from_css(style_tag.string or ''))
+    for elem in soup.find_all(style=True):
+        colors.extend(extract_colors_from_css(elem.get('style', '')))
+    colors = list(set(colors))[:10]
+    
+    services = [tag.get_text(strip=True) for tag in soup.find_all(['h1', 'h2', 'h3']) if 5 < len(tag.get_text(strip=True)) < 100][:10]
+    
+    images = []
+    for img in soup.find_all('img'):
+        src = img.get('src', '')
+        if src and not src.startswith('data:'):
+            if src.startswith('//'):
+                src = 'https:' + src
+            elif src.startswith('/'):
+                from urllib.parse import urljoin
+                src = urljoin(url, src)
+            if src.startswith('http'):
+                images.append(src)
+    images = images[:8]
+    
+    brand_analysis = BrandAnalysis(
+        brand_voice=analyze_brand_voice(all_text),
+        color_palette=colors,
+        primary_color=colors[0] if colors else "#000000",
+        secondary_color=colors[1] if len(colors) > 1 else "#666666",
+        accent_color=colors[2] if len(colors) > 2 else "#3B82F6",
+        tone=get_color_tone(colors[0]) if colors else 'neutral'
+    )
+    
+    # Title, description and headings also appear in the page text; repeating them weights them up
+    text = ' '.join([title or '', description, *services, page_text[:KEYWORD_TEXT_CHARS]])
+    return WebsiteData(title=title, description=description, services=services, images=images,
+                       brand_analysis=brand_analysis, text=text)
+
+
+async def scrape_website_advanced(url: str) -> WebsiteData:
+    try:
+        url = normalize_url(url)
+        with SCRAPER_DURATION.time(phase='fetch'):
+            html = await fetch_html(url)
+        with SCRAPER_DURATION.time(phase='parse'):
+            return await asyncio.to_thread(parse_website, html, url)
+    except Exception as e:
+        logger.error(f"Error scraping website: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
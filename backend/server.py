@@ -1,5 +1,8 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks, Request, Response, Depends
-from fastapi.responses import FileResponse, JSONResponse
+from startup_report import FirstRequestTimer, startup_report
+startup_report.start_import_tracking()
+
+from fastapi import FastAPI, APIRouter, HTTPException, Form, BackgroundTasks, Request, Response, Depends, Query
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -7,35 +10,198 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any, Tuple
 import uuid
+from collections import Counter
 from datetime import datetime, timezone, timedelta
 import base64
-import aiohttp
-from bs4 import BeautifulSoup
 import asyncio
-import re
-import colorsys
+import importlib
+import sys
+from contextlib import asynccontextmanager
 import httpx
+from http_cache import CachedJSON
+from compression import CompressionMiddleware
+from catalog import (
+    PSYCHOLOGICAL_STRATEGIES, PLATFORM_SIZES, MARKETING_TIPS,
+    PLATFORMS_BY_ID, get_generation_aspect,
+)
+from prompt_engine import (
+    build_advanced_image_prompt, build_advanced_video_prompt, fan_out_composition_note,
+    compile_image_template, prompt_cache_stats,
+)
+from caption_engine import CAPTION_VARIANTS, build_caption, build_captions_batch, caption_cache_stats
+from storage import asset_key, create_storage, migrate_flat_layout, resolve_asset_key
+from asset_gc import gc_loop, release_project_assets, run_gc
+from file_serving import serve_file, stat_file
+from uploads import InvalidUpload, UploadTooLarge, receive_upload, upload_content_type, upload_extension
+from downloads import stream_download
+from exports import collect_entries, export_filename, exports_busy, stream_project_zip
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, GENERATIONS_IN_FLIGHT, KIE_REQUEST_DURATION, KIE_TASKS,
+    MetricsMiddleware, MongoCommandMetrics, observe_cache, observe_scheduler, render_latest, timed,
+)
+from tracing import Trace, save_trace, span
+from profiling import ProfilerMiddleware, list_profiles, profile_path, render_stats
+from rate_limit import RateLimiter, create_bucket_store, load_limits
+from scheduler import PRIORITIES, GenerationScheduler, parse_weights
+from video_jobs import ACTIVE_STATES, VideoJobRunner, public_job
+from video_providers import create_video_provider
+from write_coalescer import WriteCoalescer
+import certifi
+
+startup_report.stop_import_tracking()
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-import certifi
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-# Use certifi CA bundle to fix SSL handshake errors on Render
-client = AsyncIOMotorClient(mongo_url, tlsCAFile=certifi.where())
-db = client[os.environ['DB_NAME']]
-
-# Create directories
 UPLOAD_DIR = ROOT_DIR / 'uploads'
 GENERATED_DIR = ROOT_DIR / 'generated'
-UPLOAD_DIR.mkdir(exist_ok=True)
-GENERATED_DIR.mkdir(exist_ok=True)
+TMP_DIR = ROOT_DIR / 'tmp'
+
+# Thumbnails and WebP/AVIF variants rendered on demand from uploads and generated images
+DERIVATIVE_DIR = ROOT_DIR / 'derivatives'
+
+# cProfile output of requests sent with X-Profile: 1 and the admin token
+PROFILE_DIR = ROOT_DIR / 'profiles'
+
+# Set up by the lifespan handler unless already provided (e.g. by the load harness)
+client = None
+db = None
+# Asset storage: keys are "uploads/<name>" and "generated/<name>" (local dirs above, or S3)
+storage = None
+
+# Write-behind batching of project updates made while generating (set up in the lifespan)
+project_writes = None
+
+# Background video renders; None when no provider is configured
+video_jobs = None
+
+# Image modules pull in NumPy and Pillow, so these are created on first use
+_perceptual_index = None
+_derivative_cache = None
+_keyword_index = None
+
+# Per-user and per-IP token buckets on the scrape and generation routes (memory until the lifespan picks the backend)
+rate_limiter = RateLimiter(load_limits())
+
+# Upstream render slots, shared by priority class and user with weighted fair queueing
+generation_scheduler = GenerationScheduler(
+    int(os.environ.get('KIE_MAX_CONCURRENCY', 8)), parse_weights(os.environ.get('SCHEDULER_WEIGHTS', ''))
+)
+# A user's first few generations in flight run as "interactive"; more at once is bulk work and queues as "batch"
+INTERACTIVE_GENERATIONS = int(os.environ.get('INTERACTIVE_GENERATIONS', 2))
+image_generations_in_flight: Counter = Counter()
+
+def get_perceptual_index():
+    global _perceptual_index
+    if _perceptual_index is None:
+        from phash import PerceptualIndex
+        _perceptual_index = PerceptualIndex()
+    return _perceptual_index
+
+def get_keyword_index():
+    global _keyword_index
+    if _keyword_index is None:
+        from keywords import KeywordIndex
+        _keyword_index = KeywordIndex()
+    return _keyword_index
+
+async def reload_keyword_index(interval_seconds: int):
+    """Pick up the keyword statistics other workers recorded; the first load happens in warm-up"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await get_keyword_index().load(db)
+        except Exception as e:
+            logger.error(f"Keyword index reload failed: {e}")
+
+def get_derivative_cache():
+    global _derivative_cache
+    if _derivative_cache is None:
+        from derivatives import DerivativeCache
+        _derivative_cache = DerivativeCache(DERIVATIVE_DIR, int(os.environ.get('DERIVATIVE_CACHE_MAX_BYTES', 512 * 1024 * 1024)))
+    return _derivative_cache
+
+observe_cache('derivatives', lambda: _derivative_cache.hits if _derivative_cache else 0, lambda: _derivative_cache.misses if _derivative_cache else 0)
+observe_cache('prompts', lambda: prompt_cache_stats['hits'], lambda: prompt_cache_stats['misses'])
+observe_cache('captions', lambda: caption_cache_stats['hits'], lambda: caption_cache_stats['misses'])
+observe_cache('prompt_templates', lambda: compile_image_template.cache_info().hits, lambda: compile_image_template.cache_info().misses)
+observe_scheduler(generation_scheduler.queue_depths, lambda: generation_scheduler.active)
+
+# ============== Lifecycle ==============
+
+# Imported in the background after startup so the first scrape/generation does not pay for them
+WARMUP_MODULES = ['scraper', 'bs4', 'keywords', 'image_pipeline', 'phash', 'references', 'derivatives']
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, storage, video_jobs, project_writes
+    with startup_report.phase('directories'):
+        for directory in (UPLOAD_DIR, GENERATED_DIR, TMP_DIR):
+            directory.mkdir(exist_ok=True)
+    with startup_report.phase('mongo_client'):
+        if db is None:
+            # Use certifi CA bundle to fix SSL handshake errors on Render
+            client = AsyncIOMotorClient(os.environ['MONGO_URL'], tlsCAFile=certifi.where(), event_listeners=[MongoCommandMetrics()])
+            db = client[os.environ['DB_NAME']]
+    with startup_report.phase('storage'):
+        if storage is None:
+            storage = create_storage(ROOT_DIR)
+    rate_limiter.store = create_bucket_store(db)
+    project_writes = WriteCoalescer(db.projects, window=float(os.environ.get('WRITE_COALESCE_WINDOW_MS', 200)) / 1000)
+    provider = create_video_provider()
+    if provider is not None:
+        video_jobs = VideoJobRunner(db, storage, provider, TMP_DIR, generation_scheduler)
+    
+    app.state.ready = False
+    app.state.warmup = asyncio.create_task(warm_up(app))
+    app.state.background_jobs = [asyncio.create_task(migrate_flat_layout(db, storage))]
+    gc_interval = int(os.environ.get('GC_INTERVAL_SECONDS', 6 * 60 * 60))
+    if gc_interval > 0:
+        app.state.background_jobs.append(asyncio.create_task(gc_loop(db, storage, gc_interval)))
+    if video_jobs is not None:
+        app.state.background_jobs.append(asyncio.create_task(video_jobs.resume_loop()))
+    keyword_reload = int(os.environ.get('KEYWORD_INDEX_RELOAD_SECONDS', 15 * 60))
+    if keyword_reload > 0:
+        app.state.background_jobs.append(asyncio.create_task(reload_keyword_index(keyword_reload)))
+    startup_report.mark('lifespan_ready')
+    logger.info(startup_report.summary())
+    
+    yield
+    
+    for job in [app.state.warmup, *app.state.background_jobs]:
+        job.cancel()
+    if video_jobs is not None:
+        await video_jobs.shutdown()
+    await project_writes.close()
+    if client is not None:
+        client.close()
+    # Warm-up may still be importing it in a thread, so only trust a fully loaded module
+    shutdown_pool = getattr(sys.modules.get('image_pipeline'), 'shutdown_pool', None)
+    if shutdown_pool is not None:
+        shutdown_pool()
+
+async def warm_up(app: FastAPI):
+    """Open the Mongo connection pool and import the heavy modules off the request path"""
+    try:
+        with startup_report.warm('mongo_ping'):
+            await db.command('ping')
+        for module in WARMUP_MODULES:
+            with startup_report.warm(f'import {module}'):
+                await asyncio.to_thread(importlib.import_module, module)
+        with startup_report.warm('phash_index'):
+            await get_perceptual_index().ensure_loaded(db)
+        with startup_report.warm('keyword_index'):
+            await get_keyword_index().ensure_loaded(db)
+        with startup_report.warm('derivative_cache'):
+            await get_derivative_cache().ensure_loaded()
+        app.state.ready = True
+        startup_report.mark('warm')
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -59,23 +225,6 @@ class UserSession(BaseModel):
 
 # ============== Project Models ==============
 
-class BrandAnalysis(BaseModel):
-    brand_voice: str = ""
-    color_palette: List[str] = []
-    primary_color: str = ""
-    secondary_color: str = ""
-    accent_color: str = ""
-    tone: str = ""
-    industry: str = ""
-
-class WebsiteData(BaseModel):
-    title: str = ""
-    description: str = ""
-    services: List[str] = []
-    images: List[str] = []
-    keywords: List[str] = []
-    brand_analysis: Optional[BrandAnalysis] = None
-
 class ScrapeRequest(BaseModel):
     url: str
 
@@ -110,6 +259,7 @@ class ProjectResponse(BaseModel):
     generated_images: List[str] = []
     generated_videos: List[str] = []
     generated_captions: List[Dict[str, Any]] = []
+    platform_variants: List[Dict[str, Any]] = []
     status: str
     created_at: str
     updated_at: str
@@ -118,51 +268,54 @@ class GenerateContentRequest(BaseModel):
     project_id: str
     variation_count: int = 3
     custom_instructions: Optional[str] = None
+    # Fan-out mode: render one master per variation and derive these platform sizes locally
+    platforms: Optional[List[str]] = None
+    # Drop variations that are perceptually near-identical to an existing project image (else only flag them)
+    collapse_duplicates: bool = True
+    # Callers may only lower the class the server derives (campaign refreshes "batch", automatic
+    # re-generation "background"); maintenance callers with X-Admin-Token may pick any
+    priority: Optional[Literal['interactive', 'batch', 'background']] = None
 
 class GenerateVideoRequest(BaseModel):
     project_id: str
     duration: int = 8
     video_size: str = "portrait"
     custom_instructions: Optional[str] = None
+    priority: Optional[Literal['interactive', 'batch', 'background']] = None
+
+class CaptionBatchRequest(BaseModel):
+    project_ids: List[str] = Field(..., min_length=1, max_length=500)
+    variants: int = Field(1, ge=1, le=CAPTION_VARIANTS)
+
+# ============== Catalog Payloads ==============
+
+# Keys belonging to the *other* language, dropped when a client asks for ?lang=ar|en
+CATALOG_LANGUAGE_KEYS = {
+    'strategies': {'ar': ['name_en', 'description_en'], 'en': ['name_ar', 'description_ar']},
+    'platforms': {'ar': ['name_en'], 'en': ['name']},
+    'marketing_tips': {'ar': ['en'], 'en': ['ar']},
+}
+
+def build_catalog_payloads() -> Dict[tuple, CachedJSON]:
+    """Serialize the constant catalogs once, in full and per language"""
+    catalogs = {
+        'strategies': PSYCHOLOGICAL_STRATEGIES,
+        'platforms': PLATFORM_SIZES,
+        'marketing_tips': MARKETING_TIPS,
+    }
+    payloads = {}
+    for name, items in catalogs.items():
+        payloads[(name, None)] = CachedJSON(items)
+        for lang, drop_keys in CATALOG_LANGUAGE_KEYS[name].items():
+            localized = [{k: v for k, v in item.items() if k not in drop_keys} for item in items]
+            payloads[(name, lang)] = CachedJSON(localized)
+    return payloads
 
-# ============== Constants ==============
-
-PSYCHOLOGICAL_STRATEGIES = [
-    {"id": "hook", "name_ar": "الخطاف", "name_en": "Hook Strategy", "icon": "hook", "description_ar": "عنصر مفاجئ يوقف التصفح", "description_en": "Surprising element that stops scrolling", "visual_instructions": "Use HIGH CONTRAST colors, FISH-EYE angles, include ONE ILLOGICAL element. Text should be BOLD and off-center.", "video_instructions": "Start with unexpected visual. Quick cuts, dynamic movement."},
-    {"id": "shock_comparison", "name_ar": "المقارنة الصادمة", "name_en": "Shock Comparison", "icon": "scale", "description_ar": "تقسيم يبرز التباين الحاد", "description_en": "Split screen showing stark contrast", "visual_instructions": "SPLIT SCREEN - left dark/chaotic, right bright/organized. Sharp diagonal dividing line.", "video_instructions": "Wipe transition from problem to solution."},
-    {"id": "bold_opinion", "name_ar": "الرأي الجريء", "name_en": "Bold Opinion", "icon": "megaphone", "description_ar": "موقف قوي يثير النقاش", "description_en": "Strong stance that sparks discussion", "visual_instructions": "Extensive NEGATIVE SPACE (60%+). One powerful statement in large typography.", "video_instructions": "Static shot with slowly appearing text."},
-    {"id": "whisper_insight", "name_ar": "الهمس", "name_en": "Whisper Insight", "icon": "lightbulb", "description_ar": "جو غامض يوحي بالسرية", "description_en": "Mysterious atmosphere suggesting secrets", "visual_instructions": "DIM LIGHTING with spotlight. MACRO close-ups. Muted colors with one accent.", "video_instructions": "Slow motion, shallow depth of field."},
-    {"id": "pain_of_paying", "name_ar": "ألم الدفع", "name_en": "Pain of Paying", "icon": "credit-card", "description_ar": "إظهار القيمة أكبر من السعر", "description_en": "Show value larger than price", "visual_instructions": "VALUE in HUGE typography (200%+), price in small text. Green checkmarks.", "video_instructions": "Items appearing with cha-ching effect."},
-    {"id": "loss_aversion", "name_ar": "تجنب الخسارة", "name_en": "Loss Aversion", "icon": "shield-alert", "description_ar": "الخوف من فقدان الفرصة", "description_en": "Fear of missing out", "visual_instructions": "RED gradients. Product FADING effect. Countdown timer. Empty shelf imagery.", "video_instructions": "Product slowly fading. Clock ticking."},
-    {"id": "problem_solution", "name_ar": "المشكلة والحل", "name_en": "Problem-Solution", "icon": "puzzle", "description_ar": "من الفوضى إلى الراحة", "description_en": "From chaos to comfort", "visual_instructions": "Two-panel: Panel 1 GRAYSCALE showing frustration. Panel 2 FULL COLOR showing relief.", "video_instructions": "Start BLACK AND WHITE, transition to full color."},
-    {"id": "story_based", "name_ar": "القصة", "name_en": "Story-Based", "icon": "book-open", "description_ar": "سرد قصة بداية ووسط ونهاية", "description_en": "Narrative with beginning, middle, end", "visual_instructions": "CAROUSEL design (3-5 panels). Setup, Conflict, Resolution.", "video_instructions": "Three-act structure. Character-driven."},
-    {"id": "human_touch", "name_ar": "اللمسة البشرية", "name_en": "Human Touch", "icon": "heart-handshake", "description_ar": "تواصل بصري مباشر مع الكاميرا", "description_en": "Direct eye contact with camera", "visual_instructions": "DIRECT EYE CONTACT mandatory. Real human face. Genuine smile. Natural lighting.", "video_instructions": "Person looking at camera. Authentic testimonial."},
-    {"id": "engagement_cta", "name_ar": "السؤال التفاعلي", "name_en": "Engagement CTA", "icon": "message-circle", "description_ar": "عنصر تفاعلي يدعو للمشاركة", "description_en": "Interactive element inviting participation", "visual_instructions": "Include FAKE INTERACTIVE ELEMENTS: Poll buttons, A/B choices, quiz format.", "video_instructions": "Pause for viewer. Point to comment section."},
-    {"id": "herd_mentality", "name_ar": "القطيع", "name_en": "Herd Mentality", "icon": "users", "description_ar": "ازدحام يظهر الشعبية", "description_en": "Crowd showing popularity", "visual_instructions": "Show CROWD using the product. Queue imagery. 'Sold out' stamps.", "video_instructions": "Multiple people unboxing. Counter showing growing numbers."},
-    {"id": "social_proof", "name_ar": "الدليل الاجتماعي", "name_en": "Social Proof", "icon": "star", "description_ar": "تقييمات وآراء العملاء", "description_en": "Customer reviews and ratings", "visual_instructions": "STAR RATINGS prominently displayed. Chat bubble with testimonial. Trust badges.", "video_instructions": "Testimonial clips. Star rating animation."},
-    {"id": "reciprocity", "name_ar": "المقايضة", "name_en": "Reciprocity Principle", "icon": "gift", "description_ar": "الهدية تلمع أكثر من المنتج", "description_en": "Gift shines brighter than product", "visual_instructions": "FREE GIFT with GLOW effect - more prominent than main product.", "video_instructions": "Gift reveal with sparkle effects."},
-    {"id": "commitment", "name_ar": "الالتزام", "name_en": "Commitment & Consistency", "icon": "check-circle", "description_ar": "شريط تقدم يوحي بالإنجاز", "description_en": "Progress bar suggesting achievement", "visual_instructions": "PROGRESS BAR at 70-90%. Step indicators. 'Almost there!' messaging.", "video_instructions": "Progress bar filling up. Confetti at milestones."},
-    {"id": "scarcity", "name_ar": "الندرة", "name_en": "Scarcity Principle", "icon": "clock", "description_ar": "عناصر توحي بالنفاد", "description_en": "Elements suggesting running out", "visual_instructions": "EMPTY SHELVES with last item. COUNTDOWN TIMER. HOURGLASS. Red urgent colors.", "video_instructions": "Clock ticking. Items disappearing from shelf."},
-]
-
-PLATFORM_SIZES = [
-    {"id": "tiktok_reels", "name": "تيك توك / ريلز", "name_en": "TikTok / Reels", "width": 1080, "height": 1920, "aspect": "9:16", "platform": "vertical"},
-    {"id": "post_square", "name": "بوست مربع", "name_en": "Square Post", "width": 1080, "height": 1080, "aspect": "1:1", "platform": "square"},
-    {"id": "youtube_banner", "name": "يوتيوب / بنر", "name_en": "YouTube / Banner", "width": 1920, "height": 1080, "aspect": "16:9", "platform": "landscape"},
-    {"id": "ig_story", "name": "ستوري", "name_en": "Story", "width": 1080, "height": 1920, "aspect": "9:16", "platform": "vertical"},
-    {"id": "fb_feed", "name": "فيسبوك فيد", "name_en": "Facebook Feed", "width": 1200, "height": 628, "aspect": "1.91:1", "platform": "wide"},
-]
-
-MARKETING_TIPS = [
-    {"ar": "الإعلانات ذات الوجوه البشرية تحقق تفاعل أعلى بـ 38%", "en": "Ads with human faces get 38% higher engagement"},
-    {"ar": "اللون الأحمر يزيد الإحساس بالإلحاح", "en": "Red color increases sense of urgency"},
-    {"ar": "أول 3 ثوان تحدد 70% من نجاح الإعلان", "en": "First 3 seconds determine 70% of ad success"},
-    {"ar": "الأرقام الفردية (7, 9) أكثر إقناعاً", "en": "Odd numbers (7, 9) are more persuasive"},
-    {"ar": "التواصل البصري يزيد الثقة بـ 50%", "en": "Eye contact increases trust by 50%"},
-    {"ar": "الندرة تزيد القيمة المدركة بـ 200%", "en": "Scarcity increases perceived value by 200%"},
-    {"ar": "القصص تُذكر 22 مرة أكثر من الحقائق", "en": "Stories are remembered 22x more than facts"},
-    {"ar": "الألوان الدافئة تحفز القرار السريع", "en": "Warm colors encourage quick decisions"},
-]
+CATALOG_PAYLOADS = build_catalog_payloads()
+
+def catalog_response(request: Request, name: str, lang: Optional[str]) -> Response:
+    payload = CATALOG_PAYLOADS.get((name, lang)) or CATALOG_PAYLOADS[(name, None)]
+    return payload.response(request)
 
 # ============== Auth Helper Functions ==============
 
@@ -202,224 +355,12 @@ async def get_optional_user(request: Request) -> Optional[User]:
     except Exception:
         return None
 
-# ============== Helper Functions ==============
-
-def extract_colors_from_css(css_text: str) -> List[str]:
-    hex_pattern = r'#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})'
-    colors = re.findall(hex_pattern, css_text)
-    colors = ['#' + (c*2 if len(c) == 3 else c) for c in colors]
-    return list(set(colors))[:10]
-
-def analyze_brand_voice(text: str) -> str:
-    text_lower = text.lower()
-    if any(word in text_lower for word in ['luxury', 'premium', 'فاخر', 'حصري']):
-        return 'luxury'
-    elif any(word in text_lower for word in ['fun', 'exciting', 'مرح', 'ممتع']):
-        return 'playful'
-    elif any(word in text_lower for word in ['professional', 'trusted', 'موثوق']):
-        return 'formal'
-    return 'friendly'
-
-def get_color_tone(hex_color: str) -> str:
-    try:
-        hex_color = hex_color.lstrip('#')
-        r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-        h, s, v = colorsys.rgb_to_hsv(r/255, g/255, b/255)
-        hue = h * 360
-        if 0 <= hue < 60 or 300 <= hue <= 360:
-            return 'warm'
-        elif 180 <= hue < 300:
-            return 'cool'
-        return 'neutral'
-    except Exception:
-        return 'neutral'
-        return 'neutral'
-
-def extract_brand_name(soup, default_title: str, url: str = "") -> str:
-    # 1. Try Open Graph Site Name
-    og_site_name = soup.find('meta', property='og:site_name')
-    if og_site_name and og_site_name.get('content'):
-        return og_site_name.get('content').strip()
-    
-    # 2. Try JSON-LD (Search for Organization)
-    import json
-    for script in soup.find_all('script', type='application/ld+json'):
-        try:
-            if not script.string: continue
-            data = json.loads(script.string)
-            
-            def check_org(d):
-                if isinstance(d, dict) and d.get('@type') == 'Organization' and d.get('name'):
-                    return d.get('name')
-                return None
-
-            if isinstance(data, dict):
-                res = check_org(data)
-                if res: return res
-                if '@graph' in data:
-                    for item in data['@graph']:
-                        res = check_org(item)
-                        if res: return res
-        except:
-            pass
-
-    # 3. Clean Title Heuristic
-    if default_title:
-        # Common separators in page titles
-        separators = ['|', '-', '—', ':', '•', '–', '«', '»']
-        
-        for sep in separators:
-            if sep in default_title:
-                parts = [p.strip() for p in default_title.split(sep) if p.strip()]
-                if not parts: continue
-                # Usually the brand name is the shortest part, often at the end or beginning
-                candidates = [p for p in parts if len(p) < 40] 
-                if candidates:
-                    # Pick the shortest one as likely brand name
-                    return min(candidates, key=len)
-    
-    # 4. Fallback: Domain name
-    if url:
-        try:
-            from urllib.parse import urlparse
-            domain = urlparse(url).netloc
-            if not domain: domain = url
-            if domain.startswith('www.'):
-                domain = domain[4:]
-            if '.' in domain:
-                name = domain.rsplit('.', 1)[0]
-                return name.replace('-', ' ').title()
-        except:
-            pass
-                    
-    return default_title
-async def scrape_website_advanced(url: str) -> WebsiteData:
-    try:
-        if url.startswith('/'):
-            url = url.lstrip('/')
-        
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-            
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-        connector = aiohttp.TCPConnector(ssl=False)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.get(url, headers=headers, timeout=30) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=400, detail=f"Could not fetch website: {response.status}")
-                html = await response.text()
-        
-        soup = BeautifulSoup(html, 'html.parser')
-        raw_title = soup.title.string if soup.title else ""
-        title = extract_brand_name(soup, raw_title, url)
-        description = ""
-        meta_desc = soup.find('meta', attrs={'name': 'description'})
-        if meta_desc:
-            description = meta_desc.get('content', '')
-        
-        all_text = soup.get_text(separator=' ', strip=True)[:2000]
-        colors = []
-        for style_tag in soup.find_all('style'):
-            colors.extend(extract_colors_from_css(style_tag.string or ''))
-        for elem in soup.find_all(style=True):
-            colors.extend(extract_colors_from_css(elem.get('style', '')))
-        colors = list(set(colors))[:10]
-        
-        services = [tag.get_text(strip=True) for tag in soup.find_all(['h1', 'h2', 'h3']) if 5 < len(tag.get_text(strip=True)) < 100][:10]
-        
-        images = []
-        for img in soup.find_all('img'):
-            src = img.get('src', '')
-            if src and not src.startswith('data:'):
-                if src.startswith('//'):
-                    src = 'https:' + src
-                elif src.startswith('/'):
-                    from urllib.parse import urljoin
-                    src = urljoin(url, src)
-                if src.startswith('http'):
-                    images.append(src)
-        images = images[:8]
-        
-        brand_analysis = BrandAnalysis(
-            brand_voice=analyze_brand_voice(all_text),
-            color_palette=colors,
-            primary_color=colors[0] if colors else "#000000",
-            secondary_color=colors[1] if len(colors) > 1 else "#666666",
-            accent_color=colors[2] if len(colors) > 2 else "#3B82F6",
-            tone=get_color_tone(colors[0]) if colors else 'neutral'
-        )
-        
-        return WebsiteData(title=title, description=description, services=services, images=images, brand_analysis=brand_analysis)
-    except Exception as e:
-        logger.error(f"Error scraping website: {e}")
-        raise HTTPException(status_code=400, detail=str(e))
-
-def get_strategy_by_id(strategy_id: str) -> dict:
-    for strategy in PSYCHOLOGICAL_STRATEGIES:
-        if strategy['id'] == strategy_id:
-            return strategy
-    return PSYCHOLOGICAL_STRATEGIES[0]
-
-def get_platform_by_id(platform_id: str) -> dict:
-    for p in PLATFORM_SIZES:
-        if p['id'] == platform_id:
-            return p
-    return PLATFORM_SIZES[1]
-
-def build_advanced_image_prompt(project: dict, variation: int = 1) -> str:
-    strategy = get_strategy_by_id(project.get('psychological_strategy_id', 'hook'))
-    platform = get_platform_by_id(project.get('platform', 'post_square'))
-    brand_colors = project.get('brand_colors', {}) or {}
-    
-    variation_styles = ["Clean and minimalist", "Bold and dynamic", "Elegant and sophisticated"]
-    
-    return f"""Create a HIGH-CONVERTING advertisement image:
-
-BRAND: {project.get('company_name', 'Brand')}
-Description: {project.get('company_description', '')}
-Strengths: {', '.join(project.get('strengths', []))}
-
-COLORS: Primary {brand_colors.get('primary', '#000000')}, Secondary {brand_colors.get('secondary', '#FFFFFF')}, Accent {brand_colors.get('accent', '#3B82F6')}
-
-PLATFORM: {platform['name_en']} ({platform['width']}x{platform['height']})
-
-NEUROMARKETING STRATEGY: {strategy['name_en']}
-{strategy['visual_instructions']}
-
-STYLE: {variation_styles[variation-1] if variation <= len(variation_styles) else variation_styles[0]}
-
-REQUIREMENTS:
-- Arabic text, RTL flow
-- Mobile-optimized, readable on small screens
-- Modern professional aesthetic
-- Apply psychological strategy exactly"""
-
-def build_advanced_video_prompt(project: dict) -> str:
-    strategy = get_strategy_by_id(project.get('psychological_strategy_id', 'hook'))
-    return f"""Create SHORT-FORM VIDEO AD (5-10 seconds loop):
-
-BRAND: {project.get('company_name', 'Brand')}
-Product: {project.get('company_description', '')}
-
-STRATEGY: {strategy['name_en']}
-{strategy.get('video_instructions', strategy['visual_instructions'])}
+async def get_optional_user_id(request: Request) -> Optional[str]:
+    user = await get_optional_user(request)
+    return user.user_id if user else None
 
-SPECS: Modern, cinematic, high-energy. Capture attention in FIRST FRAME. Smooth transitions."""
-
-def generate_caption(project: dict, strategy: dict) -> Dict[str, Any]:
-    captions = {
-        'hook': {'ar': 'توقف! 🛑 هل رأيت هذا من قبل؟', 'en': 'Stop! 🛑 Have you seen this before?'},
-        'scarcity': {'ar': '⏰ الكمية محدودة جداً!', 'en': '⏰ Very limited quantity!'},
-        'social_proof': {'ar': '⭐⭐⭐⭐⭐ آلاف العملاء السعداء', 'en': '⭐⭐⭐⭐⭐ Thousands of happy customers'},
-        'loss_aversion': {'ar': '😱 لا تفوّت الفرصة!', 'en': '😱 Don\'t miss out!'},
-    }
-    base = captions.get(strategy['id'], {'ar': 'عرض خاص ✨', 'en': 'Special offer ✨'})
-    hashtags = ['#اعلان', '#تسويق', '#عرض_خاص']
-    return {
-        'caption_ar': f"{base['ar']}\n\n{project.get('company_name', '')}\n\n{' '.join(hashtags)}",
-        'caption_en': f"{base['en']}\n\n{project.get('company_name', '')}\n\n{' '.join(hashtags)}",
-        'hashtags': hashtags
-    }
+def rate_limited(route: str):
+    return Depends(rate_limiter.dependency(route, get_optional_user_id))
 
 # ============== Auth API Endpoints ==============
 
@@ -494,48 +435,131 @@ async def logout(request: Request, response: Response):
 async def root():
     return {"message": "NeuroAd API - AI-Powered Neuromarketing Content Generator"}
 
+@api_router.get("/ready")
+async def readiness():
+    """200 once Mongo answers and the heavy modules are imported, 503 while warm-up is still running"""
+    if getattr(app.state, 'ready', False):
+        return {"ready": True}
+    warmup = getattr(app.state, 'warmup', None)
+    if warmup is not None and warmup.done():
+        # The last attempt failed (e.g. Mongo was not reachable yet): try again in the background
+        app.state.warmup = asyncio.create_task(warm_up(app))
+    return JSONResponse({"ready": False, "warmup": startup_report.warmup}, status_code=503)
+
+@api_router.get("/health/startup")
+async def startup_timings():
+    """Import times per module, lifespan phases, warm-up steps and time to first request"""
+    return startup_report.as_dict()
+
 @api_router.get("/strategies")
-async def get_strategies():
-    return PSYCHOLOGICAL_STRATEGIES
+async def get_strategies(request: Request, lang: Optional[str] = None):
+    return catalog_response(request, 'strategies', lang)
 
 @api_router.get("/platforms")
-async def get_platforms():
-    return PLATFORM_SIZES
+async def get_platforms(request: Request, lang: Optional[str] = None):
+    return catalog_response(request, 'platforms', lang)
 
 @api_router.get("/marketing-tips")
-async def get_marketing_tips():
-    return MARKETING_TIPS
+async def get_marketing_tips(request: Request, lang: Optional[str] = None):
+    return catalog_response(request, 'marketing_tips', lang)
 
-@api_router.post("/scrape")
+@api_router.post("/scrape", dependencies=[rate_limited("scrape")])
 async def scrape_url(request: ScrapeRequest):
-    return await scrape_website_advanced(request.url)
+    from scraper import scrape_website_advanced, site_key
+    from keywords import to_hashtags
+    data = await scrape_website_advanced(request.url)
+    data.keywords = await get_keyword_index().add_document(db, site_key(request.url), data.text)
+    data.hashtags = to_hashtags(data.keywords)
+    return data
 
 @api_router.post("/upload")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(request: Request):
+    """Store the multipart "file" field; the body is streamed, never spooled whole"""
     try:
-        ext = Path(file.filename).suffix or '.jpg'
-        filename = f"{uuid.uuid4()}{ext}"
-        filepath = UPLOAD_DIR / filename
-        content = await file.read()
-        with open(filepath, 'wb') as f:
-            f.write(content)
-        return {"url": f"/api/uploads/{filename}", "filename": filename}
+        tmp_path, sha256, size, original_name = await receive_upload(request, TMP_DIR)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error receiving upload: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    try:
+        # Content-addressed name: repeated uploads of the same file resolve to one blob
+        filename = f"{sha256}{upload_extension(original_name)}"
+        created = await storage.put_file(asset_key('uploads', filename), tmp_path, upload_content_type(filename))
+        return {"url": f"/api/uploads/{filename}", "filename": filename, "size": size, "deduplicated": not created}
     except Exception as e:
+        logger.error(f"Error storing upload: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/uploads/{filename}")
-async def get_upload(filename: str):
-    filepath = UPLOAD_DIR / filename
-    if not filepath.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(filepath)
+def asset_path(key: str) -> Optional[Path]:
+    try:
+        return storage.local_path(key)
+    except ValueError:
+        return None
 
-@api_router.get("/generated/{filename}")
-async def get_generated(filename: str):
-    filepath = GENERATED_DIR / filename
-    if not filepath.exists():
+async def serve_image(request: Request, kind: str, filename: str, width: Optional[int], fmt: Optional[str], quality: Optional[int]):
+    """Serve the original file, or a resized/re-encoded derivative when w or format is given"""
+    key = await resolve_asset_key(storage, kind, filename)
+    if key is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if width is None and fmt is None:
+        direct_url = await storage.url_for(key)
+        if direct_url:
+            return RedirectResponse(direct_url, status_code=307, headers={"Cache-Control": "private, max-age=300"})
+        path = asset_path(key)
+        st = await stat_file(path) if path else None
+        if st is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return await serve_file(request, path, st)
+    
+    from derivatives import DEFAULT_QUALITY, FORMAT_MEDIA_TYPES, negotiate_format, snap_width
+    target_format = negotiate_format(fmt, request.headers.get("accept", ""))
+    target_width = snap_width(width or 1920)
+    target_quality = DEFAULT_QUALITY[target_format] if quality is None else max(30, min(95, quality))
+    try:
+        derivative = await get_derivative_cache().get(
+            kind, filename, lambda: storage.materialized(key, TMP_DIR),
+            target_width, target_format, target_quality,
+        )
+    except Exception as e:
+        logger.error(f"Error rendering derivative of {filename}: {e}")
+        raise HTTPException(status_code=415, detail="Could not process image")
+    
+    headers = {}
+    if fmt is None or fmt == "auto":
+        headers["Vary"] = "Accept"
+    derivative_st = await stat_file(derivative)
+    if derivative_st is None:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(filepath)
+    return await serve_file(request, derivative, derivative_st, FORMAT_MEDIA_TYPES[target_format], headers)
+
+@api_router.api_route("/uploads/{filename}", methods=["GET", "HEAD"])
+async def get_upload(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096),
+    fmt: Optional[str] = Query(None, alias="format"),
+    q: Optional[int] = None,
+):
+    return await serve_image(request, 'uploads', filename, w, fmt, q)
+
+@api_router.api_route("/references/{filename}", methods=["GET", "HEAD"])
+async def get_reference(filename: str, request: Request):
+    """Normalized reference images, fetched by the generator"""
+    return await serve_image(request, 'references', filename, None, None, None)
+
+@api_router.api_route("/generated/{filename}", methods=["GET", "HEAD"])
+async def get_generated(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096),
+    fmt: Optional[str] = Query(None, alias="format"),
+    q: Optional[int] = None,
+):
+    return await serve_image(request, 'generated', filename, w, fmt, q)
 
 @api_router.post("/projects", response_model=ProjectResponse)
 async def create_project(project: ProjectCreate, request: Request):
@@ -569,6 +593,18 @@ async def get_projects(request: Request):
     projects = await db.projects.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
     return [ProjectResponse(**p) for p in projects]
 
+@api_router.post("/captions/batch")
+async def batch_captions(body: CaptionBatchRequest, request: Request):
+    """Caption variants for many projects in one call (campaign refreshes); nothing is saved"""
+    user = await get_optional_user(request)
+    query = {"id": {"$in": body.project_ids}}
+    if user:
+        query["user_id"] = user.user_id
+    fields = {"_id": 0, "id": 1, "updated_at": 1, "company_name": 1, "psychological_strategy_id": 1, "scraped_data.hashtags": 1}
+    projects = await db.projects.find(query, fields).to_list(len(body.project_ids))
+    captions = build_captions_batch(projects, body.variants)
+    return {"captions": captions, "missing": [pid for pid in body.project_ids if pid not in captions]}
+
 @api_router.get("/projects/{project_id}", response_model=ProjectResponse)
 async def get_project(project_id: str):
     project = await db.projects.find_one({"id": project_id}, {"_id": 0})
@@ -577,15 +613,109 @@ async def get_project(project_id: str):
     return ProjectResponse(**project)
 
 @api_router.delete("/projects/{project_id}")
-async def delete_project(project_id: str):
-    result = await db.projects.delete_one({"id": project_id})
-    if result.deleted_count == 0:
+async def delete_project(project_id: str, background_tasks: BackgroundTasks):
+    project = await db.projects.find_one_and_delete({"id": project_id}, {"_id": 0})
+    if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    background_tasks.add_task(release_project_assets, db, storage, project)
+    background_tasks.add_task(get_perceptual_index().remove_project, db, project_id)
     return {"message": "Project deleted"}
 
+@api_router.get("/projects/{project_id}/similar-assets")
+async def get_similar_assets(project_id: str, max_distance: int = Query(10, ge=0, le=32)):
+    """Images from other projects of the same brand that look like this project's images"""
+    project = await db.projects.find_one({"id": project_id}, {"_id": 0, "id": 1, "company_name": 1})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    from phash import brand_key
+    perceptual_index = get_perceptual_index()
+    await perceptual_index.ensure_loaded(db)
+    
+    brand = brand_key(project)
+    similar = {}
+    for asset in perceptual_index.project_hashes(project_id):
+        for match in perceptual_index.search(asset['phash'], max_distance, brand=brand, limit=50):
+            if match['project_id'] == project_id:
+                continue
+            best = similar.get(match['url'])
+            if best is None or match['distance'] < best['distance']:
+                similar[match['url']] = {**match, "similar_to": asset['url']}
+    return sorted(similar.values(), key=lambda m: m['distance'])
+
+@api_router.get("/projects/{project_id}/export")
+async def export_project(project_id: str):
+    """ZIP of the project's references, generated images and videos plus a metadata.json, streamed as it is built"""
+    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if exports_busy():
+        raise HTTPException(status_code=503, detail="Too many exports in progress, try again shortly",
+                            headers={"Retry-After": "5"})
+    entries = await collect_entries(storage, project)
+    filename = export_filename(project)
+    return StreamingResponse(
+        stream_project_zip(storage, project, entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+@api_router.get("/projects/{project_id}/traces")
+async def get_generation_traces(project_id: str, limit: int = Query(10, ge=1, le=100)):
+    """Span traces of the project's most recent generation runs, newest first"""
+    cursor = db.generation_traces.find({"project_id": project_id}, {"_id": 0}).sort("started_at", -1).limit(limit)
+    return await cursor.to_list(limit)
+
+# ============== Maintenance Endpoints ==============
+
+def is_admin(request: Request) -> bool:
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    return bool(admin_token) and request.headers.get("X-Admin-Token") == admin_token
+
+async def require_admin(request: Request):
+    """Maintenance routes are only enabled when ADMIN_TOKEN is set and sent as X-Admin-Token"""
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@api_router.post("/admin/gc", dependencies=[Depends(require_admin)])
+async def collect_garbage(dry_run: bool = False, grace_seconds: int = 6 * 60 * 60):
+    """Delete uploads and generated files no project references"""
+    return await run_gc(db, storage, grace_seconds=grace_seconds, dry_run=dry_run)
+
+@api_router.get("/admin/scheduler", dependencies=[Depends(require_admin)])
+async def get_scheduler_state():
+    """Upstream slots in use and waiting generation calls per priority class"""
+    return {
+        "max_concurrency": generation_scheduler.max_concurrency,
+        "active": generation_scheduler.active,
+        "queued": generation_scheduler.queue_depths(),
+        "weights": generation_scheduler.weights,
+    }
+
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def get_profiles():
+    """Saved request profiles, newest first"""
+    return await asyncio.to_thread(list_profiles, PROFILE_DIR)
+
+@api_router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str, format: str = Query("pstats", pattern="^(pstats|text)$"), sort: str = "cumulative"):
+    """A saved profile as a pstats file (for snakeviz etc.) or a text summary"""
+    path = profile_path(PROFILE_DIR, profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        try:
+            text = await asyncio.to_thread(render_stats, path, sort)
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Unknown sort key: {sort}")
+        return Response(text, media_type="text/plain; charset=utf-8")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.pstats")
+
 # ============== Nano Banana Pro Image Generation ==============
 
-async def generate_image_with_nano_banana(prompt: str, aspect_ratio: str = "1:1") -> Optional[str]:
+# Floored so a zero or negative setting cannot busy-poll kie.ai (or divide by zero below)
+KIE_POLL_INTERVAL = max(0.1, float(os.environ.get('KIE_POLL_INTERVAL_SECONDS', 2)))
+
+async def generate_image_with_nano_banana(prompt: str, aspect_ratio: str = "1:1", resolution: str = "1K", image_input: Optional[List[str]] = None) -> Optional[str]:
     """Generate image using Nano Banana Pro API from kie.ai"""
     kie_api_key = os.environ.get('KIE_AI_API_KEY')
     if not kie_api_key:
@@ -602,23 +732,26 @@ async def generate_image_with_nano_banana(prompt: str, aspect_ratio: str = "1:1"
         "model": "nano-banana-pro",
         "input": {
             "prompt": prompt,
-            "image_input": [],
+            "image_input": image_input or [],
             "aspect_ratio": aspect_ratio,
-            "resolution": "1K",
+            "resolution": resolution,
             "output_format": "png"
         }
     }
     
     async with httpx.AsyncClient(timeout=30.0) as client:
         # Create the task
-        response = await client.post(create_url, json=payload, headers=headers)
+        with span('kie.create', resolution=resolution, aspect_ratio=aspect_ratio), timed(KIE_REQUEST_DURATION, operation='create'):
+            response = await client.post(create_url, json=payload, headers=headers)
         if response.status_code != 200:
             logger.error(f"Nano Banana Pro create task failed: {response.text}")
+            KIE_TASKS.inc(outcome='rejected')
             return None
         
         result = response.json()
         if result.get("code") != 200:
             logger.error(f"Nano Banana Pro error: {result.get('msg')}")
+            KIE_TASKS.inc(outcome='rejected')
             return None
         
         task_id = result.get("data", {}).get("taskId")
@@ -628,203 +761,297 @@ async def generate_image_with_nano_banana(prompt: str, aspect_ratio: str = "1:1"
         
         # Poll for result
         check_url = f"https://api.kie.ai/api/v1/jobs/recordInfo?taskId={task_id}"
-        max_attempts = 60  # Wait up to 2 minutes
+        max_attempts = int(120 / KIE_POLL_INTERVAL)  # Wait up to 2 minutes
         
-        for attempt in range(max_attempts):
-            await asyncio.sleep(2)  # Wait 2 seconds between polls
+        # Time between polls shows up as the gap between kie.poll spans
+        with span('kie.render', task_id=task_id):
+            for attempt in range(max_attempts):
+                await asyncio.sleep(KIE_POLL_INTERVAL)
             
-            check_response = await client.get(check_url, headers=headers)
-            if check_response.status_code != 200:
-                continue
+                with span('kie.poll', attempt=attempt + 1) as poll_span, timed(KIE_REQUEST_DURATION, operation='poll'):
+                    check_response = await client.get(check_url, headers=headers)
+                if check_response.status_code != 200:
+                    continue
             
-            check_result = check_response.json()
-            if check_result.get("code") != 200:
-                continue
+                check_result = check_response.json()
+                if check_result.get("code") != 200:
+                    continue
             
-            data = check_result.get("data", {})
-            state = data.get("state")
+                data = check_result.get("data", {})
+                state = data.get("state")
+                if poll_span:
+                    poll_span.set(state=state)
             
-            if state == "success":
-                result_json = data.get("resultJson", "{}")
-                try:
-                    import json
-                    result_data = json.loads(result_json)
-                    result_urls = result_data.get("resultUrls", [])
-                    if result_urls:
-                        return result_urls[0]
-                except Exception as e:
-                    logger.error(f"Error parsing result: {e}")
-                return None
-            elif state == "failed":
-                logger.error(f"Nano Banana Pro task failed: {data.get('failMsg')}")
-                return None
+                if state == "success":
+                    KIE_TASKS.inc(outcome='success')
+                    result_json = data.get("resultJson", "{}")
+                    try:
+                        import json
+                        result_data = json.loads(result_json)
+                        result_urls = result_data.get("resultUrls", [])
+                        if result_urls:
+                            return result_urls[0]
+                    except Exception as e:
+                        logger.error(f"Error parsing result: {e}")
+                    return None
+                elif state == "failed":
+                    KIE_TASKS.inc(outcome='failed')
+                    logger.error(f"Nano Banana Pro task failed: {data.get('failMsg')}")
+                    return None
         
         logger.error("Nano Banana Pro task timed out")
+        KIE_TASKS.inc(outcome='timeout')
         return None
 
-async def download_and_save_image(image_url: str, project_id: str, variation: int) -> Optional[str]:
-    """Download image from URL and save locally"""
+IMAGE_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/webp': '.webp', 'image/avif': '.avif', 'image/gif': '.gif'}
+
+async def download_and_save_image(image_url: str, project_id: str, variation: int) -> Optional[Tuple[str, Optional[int]]]:
+    """Stream an image from URL into storage; returns its URL and perceptual hash"""
+    from image_pipeline import run_in_pool
+    from phash import compute_phash
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(image_url)
-            if response.status_code != 200:
-                return None
-            
-            filename = f"{project_id}_v{variation}_{uuid.uuid4()}.png"
-            filepath = GENERATED_DIR / filename
-            
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            
-            return f"/api/generated/{filename}"
+        tmp_path = TMP_DIR / f"{uuid.uuid4().hex}.part"
+        with span('download') as download_span, timed(KIE_REQUEST_DURATION, operation='download'):
+            async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=60.0)) as client:
+                result = await stream_download(client, image_url, tmp_path)
+            if download_span:
+                download_span.set(bytes=result.size, content_type=result.content_type)
+        
+        try:
+            with span('phash'):
+                image_hash = await run_in_pool(compute_phash, tmp_path)
+        except Exception as e:
+            logger.error(f"Error hashing downloaded image: {e}")
+            image_hash = None
+        
+        ext = IMAGE_EXTENSIONS.get(result.content_type, '.png')
+        filename = f"{project_id}_v{variation}_{uuid.uuid4()}{ext}"
+        with span('storage.put'):
+            await storage.put_file(asset_key('generated', filename), tmp_path, result.content_type)
+        logger.info(f"Saved {filename} ({result.size} bytes, sha256 {result.sha256[:12]})")
+        return f"/api/generated/{filename}", image_hash
     except Exception as e:
         logger.error(f"Error downloading image: {e}")
         return None
 
-@api_router.post("/generate-content")
-async def generate_content(request: GenerateContentRequest):
+async def derive_platform_sizes(master_filename: str, platform_ids: List[str]) -> Dict[str, str]:
+    """Platform-sized crops of a stored master, rendering only the ones not already stored"""
+    from image_pipeline import fan_out_platform_sizes, platform_derivative_name
+    sizes = {}
+    missing = []
+    for platform_id in platform_ids:
+        name = platform_derivative_name(master_filename, platform_id)
+        if await storage.exists(asset_key('generated', name)):
+            sizes[platform_id] = f"/api/generated/{name}"
+        else:
+            missing.append(platform_id)
+    
+    if missing:
+        async with storage.materialized(asset_key('generated', master_filename), TMP_DIR) as master_path:
+            derived = await fan_out_platform_sizes(master_path, missing, TMP_DIR)
+        for platform_id, path in derived.items():
+            await storage.put_file(asset_key('generated', path.name), path, "image/png")
+            sizes[platform_id] = f"/api/generated/{path.name}"
+    return {pid: sizes[pid] for pid in platform_ids if pid in sizes}
+
+def generation_priority(request: Request, requested: Optional[str], in_flight: int) -> str:
+    """Scheduler class of a generation, derived from how many the user already has in flight"""
+    derived = 'interactive' if in_flight < INTERACTIVE_GENERATIONS else 'batch'
+    if requested is None:
+        return derived
+    if is_admin(request) or PRIORITIES.index(requested) >= PRIORITIES.index(derived):
+        return requested
+    return derived
+
+@api_router.post("/generate-content", dependencies=[rate_limited("generate-content")])
+async def generate_content(request: GenerateContentRequest, http_request: Request):
     """Generate images using Nano Banana Pro API"""
+    owner = await db.projects.find_one({"id": request.project_id}, {"_id": 0, "user_id": 1})
+    flow = (owner or {}).get('user_id') or request.project_id
+    priority = generation_priority(http_request, request.priority, image_generations_in_flight[flow])
+    trace = Trace('generate_content', project_id=request.project_id, kind='image', priority=priority)
+    image_generations_in_flight[flow] += 1
+    with GENERATIONS_IN_FLIGHT.track_inprogress(kind='image'):
+        try:
+            with trace:
+                result = await run_image_generation(request, priority)
+            result['trace_id'] = trace.id
+            return result
+        finally:
+            image_generations_in_flight[flow] -= 1
+            if not image_generations_in_flight[flow]:
+                del image_generations_in_flight[flow]
+            await save_trace(db, trace)
+
+async def run_image_generation(request: GenerateContentRequest, priority: str = 'interactive'):
+    from image_pipeline import choose_master_aspect
+    from references import prepare_reference_images
+    
+    fan_out_platforms = list(dict.fromkeys(request.platforms or []))
+    unknown = [p for p in fan_out_platforms if p not in PLATFORMS_BY_ID]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown platforms: {', '.join(unknown)}")
+    
     try:
-        project = await db.projects.find_one({"id": request.project_id}, {"_id": 0})
+        with span('mongo.find_project'):
+            project = await db.projects.find_one({"id": request.project_id}, {"_id": 0})
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        await db.projects.update_one(
-            {"id": request.project_id},
-            {"$set": {"status": "generating", "updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
+        variation_total = min(request.variation_count, 3)
+        await project_writes.update(request.project_id, {"$set": {
+            "status": "generating",
+            "generation_progress": {"completed": 0, "total": variation_total},
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }})
+        
+        def record_variation(i: int, urls: List[str], variants: List[dict]):
+            # Write-behind: lands with the next batch, or at the final flush
+            return project_writes.update(request.project_id, {
+                "$push": {"generated_images": {"$each": urls}, "platform_variants": {"$each": variants}},
+                "$set": {
+                    "generation_progress": {"completed": i, "total": variation_total},
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                },
+            })
         
         generated_urls = []
+        platform_variants = []
+        duplicates = []
+        perceptual_index = get_perceptual_index()
+        with span('phash.load_index'):
+            await perceptual_index.ensure_loaded(db)
         
-        # Map platform to aspect ratio
-        platform = project.get('platform', 'post_square')
-        aspect_map = {
-            'tiktok_reels': '9:16',
-            'post_square': '1:1',
-            'youtube_banner': '16:9',
-            'ig_story': '9:16',
-            'fb_feed': '16:9'
-        }
-        aspect_ratio = aspect_map.get(platform, '1:1')
+        if fan_out_platforms:
+            # One high-resolution master per variation, cropped locally to every platform
+            aspect_ratio = choose_master_aspect(fan_out_platforms)
+            resolution = "2K"
+        else:
+            aspect_ratio = get_generation_aspect(project.get('platform', 'post_square'))
+            resolution = "1K"
+        
+        # Project images go to the generator as downscaled references, prepared once for all variations
+        with span('prepare_references', images=len(project.get('images') or [])):
+            reference_urls = await prepare_reference_images(
+                storage, project.get('images') or [], TMP_DIR, os.environ.get('PUBLIC_BASE_URL')
+            )
         
         # Generate variations
-        for i in range(1, min(request.variation_count + 1, 4)):
-            prompt = build_advanced_image_prompt(project, variation=i)
-            if request.custom_instructions:
-                prompt += f"\n\nADDITIONAL INSTRUCTIONS: {request.custom_instructions}"
+        for i in range(1, variation_total + 1):
+            with span('variation', variation=i):
+                new_urls, new_variants = [], []
+                with span('prompt_build'):
+                    prompt = build_advanced_image_prompt(project, variation=i)
+                    if fan_out_platforms:
+                        prompt += fan_out_composition_note(fan_out_platforms)
+                    if request.custom_instructions:
+                        prompt += f"\n\nADDITIONAL INSTRUCTIONS: {request.custom_instructions}"
             
-            logger.info(f"Generating image variation {i} with Nano Banana Pro...")
+                logger.info(f"Generating image variation {i} with Nano Banana Pro...")
             
-            # Generate image with Nano Banana Pro
-            image_url = await generate_image_with_nano_banana(prompt, aspect_ratio)
+                # Generate image with Nano Banana Pro
+                async with generation_scheduler.slot(priority, project.get('user_id') or request.project_id):
+                    image_url = await generate_image_with_nano_banana(prompt, aspect_ratio, resolution, reference_urls)
             
-            if image_url:
-                # Download and save locally
-                local_url = await download_and_save_image(image_url, request.project_id, i)
-                if local_url:
-                    generated_urls.append(local_url)
-                    logger.info(f"Generated image {i}: {local_url}")
+                if image_url:
+                    # Download and save locally
+                    saved = await download_and_save_image(image_url, request.project_id, i)
+                    local_url = saved[0] if saved else None
+                    if saved and saved[1] is not None:
+                        # Re-generations often come back near-identical to an image the project already has
+                        matches = perceptual_index.search(saved[1], project_id=request.project_id, limit=1)
+                        if matches:
+                            duplicate = {"variation": i, "duplicate_of": matches[0]['url'], "distance": matches[0]['distance']}
+                            if request.collapse_duplicates:
+                                # The file is deleted, so the entry has no url to report
+                                duplicates.append({**duplicate, "collapsed": True})
+                                logger.info(f"Variation {i} is a near-duplicate of {matches[0]['url']}, dropping it")
+                                await storage.delete(asset_key('generated', local_url.rsplit('/', 1)[-1]))
+                                await record_variation(i, [], [])
+                                continue
+                            duplicates.append({**duplicate, "url": local_url, "collapsed": False})
+                        with span('mongo.add_phash'):
+                            await perceptual_index.add(db, saved[1], local_url, project)
+                    if local_url and fan_out_platforms:
+                        with span('derive_platform_sizes', platforms=len(fan_out_platforms)):
+                            sizes = await derive_platform_sizes(local_url.rsplit('/', 1)[-1], fan_out_platforms)
+                        variant = {"variation": i, "master": local_url, "sizes": sizes}
+                        platform_variants.append(variant)
+                        generated_urls.extend(sizes.values())
+                        new_urls, new_variants = list(sizes.values()), [variant]
+                        logger.info(f"Generated image {i}: {local_url} -> {len(sizes)} platform sizes")
+                    elif local_url:
+                        generated_urls.append(local_url)
+                        new_urls = [local_url]
+                        logger.info(f"Generated image {i}: {local_url}")
+                await record_variation(i, new_urls, new_variants)
         
         # Generate caption
-        strategy = get_strategy_by_id(project.get('psychological_strategy_id', 'hook'))
-        caption = generate_caption(project, strategy)
+        caption = build_caption(project)
         
         status = "completed" if generated_urls else "failed"
         
-        await db.projects.update_one(
-            {"id": request.project_id},
-            {
-                "$push": {"generated_images": {"$each": generated_urls}},
-                "$set": {
-                    "generated_captions": [caption],
-                    "status": status,
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }
-            }
-        )
+        with span('mongo.save_result', images=len(generated_urls)):
+            await project_writes.update(request.project_id, {"$set": {
+                "generated_captions": [caption],
+                "status": status,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }})
+            await project_writes.flush(request.project_id)
         
         return {
             "success": len(generated_urls) > 0,
             "images": generated_urls,
             "caption": caption,
-            "variations_count": len(generated_urls)
+            "variations_count": len(platform_variants) if fan_out_platforms else len(generated_urls),
+            "platform_variants": platform_variants,
+            "duplicates": duplicates,
         }
         
     except Exception as e:
         logger.error(f"Error generating content: {e}")
-        await db.projects.update_one(
-            {"id": request.project_id},
-            {"$set": {"status": "failed", "updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
+        await project_writes.update(request.project_id, {"$set": {"status": "failed", "updated_at": datetime.now(timezone.utc).isoformat()}})
+        await project_writes.flush(request.project_id)
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.post("/generate-video")
-async def generate_video(request: GenerateVideoRequest):
-    try:
-        project = await db.projects.find_one({"id": request.project_id}, {"_id": 0})
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        await db.projects.update_one(
-            {"id": request.project_id},
-            {"$set": {"status": "generating_video", "updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
-        
-        prompt = build_advanced_video_prompt(project)
-        if request.custom_instructions:
-            prompt += f"\n\nADDITIONAL: {request.custom_instructions}"
-        
-        # from emergentintegrations.llm.openai.video_generation import OpenAIVideoGeneration
-        
-        api_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not api_key:
-            raise HTTPException(status_code=500, detail="EMERGENT_LLM_KEY not configured")
-        
-        if True:
-            raise HTTPException(status_code=501, detail="Video generation is currently disabled due to missing dependencies.")
-
-        # video_gen = OpenAIVideoGeneration(api_key=api_key)
-        
-        # filename = f"{request.project_id}_{uuid.uuid4()}.mp4"
-        # output_path = str(GENERATED_DIR / filename)
-        
-        # # Sora 2 supported sizes
-        # size_map = {"portrait": "1024x1792", "square": "1024x1024", "landscape": "1280x720"}
-        # size = size_map.get(request.video_size, "1024x1792")
-        
-        # video_bytes = video_gen.text_to_video(
-        #     prompt=prompt,
-        #     model="sora-2",
-        #     size=size,
-        #     duration=min(max(request.duration, 4), 12),
-        #     max_wait_time=600
-        # )
-        
-        if video_bytes:
-            video_gen.save_video(video_bytes, output_path)
-            video_url = f"/api/generated/{filename}"
-            
-            await db.projects.update_one(
-                {"id": request.project_id},
-                {
-                    "$push": {"generated_videos": video_url},
-                    "$set": {"status": "completed", "updated_at": datetime.now(timezone.utc).isoformat()}
-                }
-            )
-            return {"success": True, "video_url": video_url}
-        else:
-            raise HTTPException(status_code=500, detail="Video generation failed")
-        
-    except Exception as e:
-        logger.error(f"Error generating video: {e}")
-        await db.projects.update_one(
-            {"id": request.project_id},
-            {"$set": {"status": "failed", "updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
-        raise HTTPException(status_code=500, detail=str(e))
+@api_router.post("/generate-video", status_code=202, dependencies=[rate_limited("generate-video")])
+async def generate_video(request: GenerateVideoRequest, http_request: Request):
+    """Queue a video render; poll the returned status_url until the job completes"""
+    if video_jobs is None:
+        raise HTTPException(status_code=503, detail="Video generation is not configured")
+    project = await db.projects.find_one({"id": request.project_id}, {"_id": 0})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    prompt = build_advanced_video_prompt(project)
+    if request.custom_instructions:
+        prompt += f"\n\nADDITIONAL: {request.custom_instructions}"
+    
+    flow = {"user_id": project['user_id']} if project.get('user_id') else {"project_id": request.project_id}
+    in_flight = await db.video_jobs.count_documents({**flow, "status": {"$in": list(ACTIVE_STATES)}})
+    priority = generation_priority(http_request, request.priority, in_flight)
+    job = await video_jobs.submit(project, prompt, request.video_size, min(max(request.duration, 4), 15), priority)
+    return {**public_job(job), "status_url": f"/api/video-jobs/{job['id']}"}
+
+@api_router.get("/video-jobs/{job_id}")
+async def get_video_job(job_id: str):
+    job = await db.video_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    return public_job(job)
+
+@api_router.get("/projects/{project_id}/video-jobs")
+async def get_project_video_jobs(project_id: str, limit: int = Query(20, ge=1, le=100)):
+    """The project's video jobs, newest first"""
+    cursor = db.video_jobs.find({"project_id": project_id}, {"_id": 0}).sort("created_at", -1).limit(limit)
+    return [public_job(job) for job in await cursor.to_list(limit)]
 
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(render_latest(), media_type=METRICS_CONTENT_TYPE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -832,7 +1059,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', 1024)),
+    offload_size=int(os.environ.get('COMPRESSION_OFFLOAD_BYTES', 256 * 1024)),
+    disabled_routes=[r for r in os.environ.get(
+        'COMPRESSION_DISABLED_ROUTES',
+        '/api/projects/{project_id}/export,/api/uploads/{filename},/api/generated/{filename}'
+    ).split(',') if r],
+)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilerMiddleware, profile_dir=PROFILE_DIR)
+app.add_middleware(FirstRequestTimer, report=startup_report)
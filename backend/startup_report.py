@@ -0,0 +1,135 @@
+"""Cold-start accounting: import times, lifespan phases, warm-up and first request.
+
+Between ``start_import_tracking()`` and ``stop_import_tracking()`` (around
+server.py's module-level imports) ``builtins.__import__`` is wrapped to charge
+each outermost import to its top-level package, so nested imports count towards whichever module pulled them in.
+Only stdlib is imported here, so the tracker can start before anything heavy.
+"""
+import builtins
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+MODULE_LOADED_AT = time.perf_counter()
+
+
+def process_age() -> Optional[float]:
+    """Seconds since the process started (Linux only)"""
+    try:
+        with open('/proc/self/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupReport:
+    def __init__(self):
+        # Offset of perf_counter's origin from process start, so every mark is relative to exec
+        age = process_age()
+        self._origin = MODULE_LOADED_AT - age if age is not None else MODULE_LOADED_AT
+        self.imports: Dict[str, float] = defaultdict(float)
+        self.phases: Dict[str, float] = {}
+        self.warmup: Dict[str, dict] = {}
+        self.marks: Dict[str, float] = {}
+        self._original_import = None
+        self._depth = 0
+
+    def _since_start(self) -> float:
+        return time.perf_counter() - self._origin
+
+    def mark(self, name: str):
+        self.marks.setdefault(name, self._since_start())
+
+    # ---- imports ----
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or self._depth or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        self._depth += 1
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.imports[name.partition('.')[0]] += time.perf_counter() - started
+
+    def start_import_tracking(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def stop_import_tracking(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+            self.mark('imports_done')
+
+    # ---- lifespan and warm-up ----
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    @contextmanager
+    def warm(self, name: str):
+        started = time.perf_counter()
+        entry = self.warmup[name] = {"status": "running"}
+        try:
+            yield
+            entry["status"] = "ok"
+        except Exception as e:
+            entry.update(status="error", error=str(e) or type(e).__name__)
+            raise
+        finally:
+            entry["ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def as_dict(self, top: int = 15) -> dict:
+        imports = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)
+        return {
+            "process_started_ms_ago": round(self._since_start() * 1000),
+            "marks_ms": {k: round(v * 1000, 1) for k, v in self.marks.items()},
+            "imports_total_ms": round(sum(self.imports.values()) * 1000, 1),
+            "imports_ms": {k: round(v * 1000, 1) for k, v in imports[:top]},
+            "lifespan_ms": {k: round(v * 1000, 1) for k, v in self.phases.items()},
+            "warmup": self.warmup,
+        }
+
+    def summary(self) -> str:
+        data = self.as_dict(top=5)
+        slowest = ', '.join(f"{k} {v:.0f}ms" for k, v in data["imports_ms"].items())
+        ready = data["marks_ms"].get("lifespan_ready", 0.0)
+        return (f"Startup: ready {ready:.0f}ms after process start; "
+                f"imports {data['imports_total_ms']:.0f}ms (slowest: {slowest})")
+
+
+class FirstRequestTimer:
+    """ASGI middleware recording when the first HTTP request arrived and finished"""
+
+    def __init__(self, app, report: StartupReport):
+        self.app = app
+        self.report = report
+        self.seen = False
+
+    async def __call__(self, scope, receive, send):
+        if self.seen or scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        self.seen = True
+        self.report.mark('first_request_received')
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.report.mark('first_request_done')
+
+
+startup_report = StartupReport()
@@ -0,0 +1,391 @@
+"""Asset storage backends.
+
+Assets are addressed by keys such as ``uploads/<name>`` or ``generated/<name>``.
+The local driver maps keys onto directories next to ``server.py``; the S3 driver
+stores them in a bucket (AWS or any S3-compatible service such as MinIO) and can
+hand out presigned URLs so clients download directly from the bucket.
+
+Select the driver with ``STORAGE_BACKEND=local|s3``.
+
+Files are sharded two levels deep by a hash of their name
+(``generated/ab/cd/<name>``) so no single directory grows unbounded; public URLs
+keep using the bare file name. Files from the older flat layout are moved once by
+whichever worker holds the migration lease in the ``migrations`` collection;
+once it records completion, later boots skip the listing altogether.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredObject:
+    key: str
+    size: int
+    mtime: float
+
+
+class StorageBackend(ABC):
+    """Interface shared by all drivers"""
+
+    @abstractmethod
+    async def put_file(self, key: str, src: Path, content_type: Optional[str] = None) -> bool:
+        """Move a finished local file under key; returns False if the key already existed"""
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def list(self, prefix: str) -> List[StoredObject]:
+        ...
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Path on this machine if the driver keeps files locally, else None"""
+        return None
+
+    async def url_for(self, key: str) -> Optional[str]:
+        """Direct (presigned or public) URL clients can be redirected to, if any"""
+        return None
+
+    @abstractmethod
+    def open_read(self, key: str) -> BinaryIO:
+        """Blocking binary reader; call from a worker thread"""
+        ...
+
+    @abstractmethod
+    def materialized(self, key: str, tmp_dir: Path):
+        """Async context manager yielding a local file with the object's content"""
+        ...
+
+    @abstractmethod
+    async def move(self, src_key: str, dest_key: str) -> None:
+        ...
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: Path):
+        self.root = root
+
+    def local_path(self, key: str) -> Path:
+        parts = Path(key).parts
+        if not parts or '..' in parts or Path(key).is_absolute():
+            raise ValueError(f"Invalid storage key: {key}")
+        return self.root / key
+
+    def _put(self, key: str, src: Path) -> bool:
+        dest = self.local_path(key)
+        if dest.exists():
+            src.unlink(missing_ok=True)
+            # A deduplicated upload is a fresh use of the blob: restart its GC grace period
+            os.utime(dest)
+            return False
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, dest)
+        return True
+
+    async def put_file(self, key: str, src: Path, content_type: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self._put, key, src)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            path = self.local_path(key)
+        except ValueError:
+            return False
+        return await asyncio.to_thread(path.is_file)
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            st = await asyncio.to_thread(os.stat, self.local_path(key))
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            return None
+        return StoredObject(key=key, size=st.st_size, mtime=st.st_mtime)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self.local_path(key).unlink, True)
+
+    def _list(self, prefix: str) -> List[StoredObject]:
+        base = self.root / prefix
+        if not base.is_dir():
+            return []
+        objects = []
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                path = Path(dirpath) / name
+                st = path.stat()
+                objects.append(StoredObject(key=path.relative_to(self.root).as_posix(), size=st.st_size, mtime=st.st_mtime))
+        return objects
+
+    async def list(self, prefix: str) -> List[StoredObject]:
+        return await asyncio.to_thread(self._list, prefix)
+
+    def open_read(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), 'rb')
+
+    def _move(self, src_key: str, dest_key: str):
+        dest = self.local_path(dest_key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.local_path(src_key), dest)
+
+    async def move(self, src_key: str, dest_key: str) -> None:
+        await asyncio.to_thread(self._move, src_key, dest_key)
+
+    @asynccontextmanager
+    async def materialized(self, key: str, tmp_dir: Path) -> AsyncIterator[Path]:
+        yield self.local_path(key)
+
+
+class S3Storage(StorageBackend):
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 presign_expires: int = 3600, public_base_url: Optional[str] = None):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 to be installed")
+
+        self.bucket = bucket
+        self.presign_expires = presign_expires
+        self.public_base_url = public_base_url.rstrip('/') if public_base_url else None
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            # Path-style addressing keeps MinIO and other S3-compatible services working
+            config=Config(s3={'addressing_style': 'path'}, signature_version='s3v4'),
+        )
+
+    def _head(self, key: str) -> Optional[StoredObject]:
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return StoredObject(key=key, size=head['ContentLength'], mtime=head['LastModified'].timestamp())
+
+    def _put(self, key: str, src: Path, content_type: Optional[str]) -> bool:
+        try:
+            extra = {'ContentType': content_type} if content_type else {}
+            if key.startswith(('uploads/', 'generated/')):
+                # Asset names are content addressed, so the objects never change
+                extra['CacheControl'] = 'public, max-age=31536000, immutable'
+            if self._head(key) is not None:
+                # Copying the object onto itself bumps LastModified, restarting its GC grace period
+                # for this deduplicated upload; REPLACE requires restating the metadata
+                self.client.copy_object(
+                    Bucket=self.bucket, Key=key, CopySource={'Bucket': self.bucket, 'Key': key},
+                    MetadataDirective='REPLACE', **extra,
+                )
+                return False
+            self.client.upload_file(str(src), self.bucket, key, ExtraArgs=extra)
+            return True
+        finally:
+            src.unlink(missing_ok=True)
+
+    async def put_file(self, key: str, src: Path, content_type: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self._put, key, src, content_type)
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        return await asyncio.to_thread(self._head, key)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    def _list(self, prefix: str) -> List[StoredObject]:
+        objects = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                objects.append(StoredObject(key=item['Key'], size=item['Size'], mtime=item['LastModified'].timestamp()))
+        return objects
+
+    async def list(self, prefix: str) -> List[StoredObject]:
+        return await asyncio.to_thread(self._list, prefix)
+
+    async def url_for(self, key: str) -> Optional[str]:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{key}"
+        return await asyncio.to_thread(
+            self.client.generate_presigned_url,
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=self.presign_expires,
+        )
+
+    def open_read(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def _move(self, src_key: str, dest_key: str):
+        self.client.copy_object(Bucket=self.bucket, Key=dest_key, CopySource={'Bucket': self.bucket, 'Key': src_key})
+        self.client.delete_object(Bucket=self.bucket, Key=src_key)
+
+    async def move(self, src_key: str, dest_key: str) -> None:
+        await asyncio.to_thread(self._move, src_key, dest_key)
+
+    @asynccontextmanager
+    async def materialized(self, key: str, tmp_dir: Path) -> AsyncIterator[Path]:
+        path = tmp_dir / f"{uuid.uuid4().hex}{Path(key).suffix}"
+        await asyncio.to_thread(self.client.download_file, self.bucket, key, str(path))
+        try:
+            yield path
+        finally:
+            await asyncio.to_thread(path.unlink, True)
+
+
+# ============== Sharded Layout ==============
+
+ASSET_KINDS = ('uploads', 'generated', 'references')
+
+# Cleared once migrate_flat_layout() has moved every legacy file into its shard
+legacy_layout_pending = True
+
+LAYOUT_MIGRATION_ID = 'sharded_layout'
+# The migrating worker renews its lease after every batch; others check back this often
+LAYOUT_MIGRATION_LEASE_SECONDS = 120
+
+
+def asset_key(kind: str, filename: str) -> str:
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return f"{kind}/{digest[:2]}/{digest[2:4]}/{filename}"
+
+
+def is_flat_key(key: str) -> bool:
+    return key.count('/') == 1
+
+
+async def resolve_asset_key(storage: StorageBackend, kind: str, filename: str) -> Optional[str]:
+    """Sharded key of an existing asset, falling back to the flat layout until migration finishes"""
+    key = asset_key(kind, filename)
+    if not legacy_layout_pending:
+        return key
+    if await storage.exists(key):
+        return key
+    legacy = f"{kind}/{filename}"
+    if await storage.exists(legacy):
+        return legacy
+    return None
+
+
+async def _move_flat_files(storage: StorageBackend, renew, batch_size: int, pause: float):
+    """(moved, failed) after moving every flat-layout file into its shard"""
+    moved = failed = 0
+    for kind in ASSET_KINDS:
+        objects = [o for o in await storage.list(f"{kind}/") if is_flat_key(o.key)]
+        for i, obj in enumerate(objects, 1):
+            filename = obj.key.split('/', 1)[1]
+            dest = asset_key(kind, filename)
+            try:
+                await storage.move(obj.key, dest)
+                moved += 1
+            except Exception as e:
+                # A worker that held an earlier lease may have moved it already
+                if await storage.exists(dest) and not await storage.exists(obj.key):
+                    continue
+                failed += 1
+                logger.error(f"Error migrating {obj.key}: {e}")
+            if i % batch_size == 0:
+                await renew()
+                await asyncio.sleep(pause)
+    return moved, failed
+
+
+async def migrate_flat_layout(db, storage: StorageBackend, batch_size: int = 200, pause: float = 0.05,
+                              lease_seconds: int = LAYOUT_MIGRATION_LEASE_SECONDS) -> int:
+    """Move files stored directly under uploads/ or generated/ into their shard directories
+
+    Runs until the migration is recorded as done: one worker at a time moves the
+    files under a lease, the others wait for it (taking over if its lease lapses).
+    """
+    global legacy_layout_pending
+    migrations = db.migrations
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def lease_until():
+        return datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+
+    async def renew():
+        await migrations.update_one({"_id": LAYOUT_MIGRATION_ID, "owner": owner}, {"$set": {"lease_until": lease_until()}})
+
+    while True:
+        try:
+            try:
+                await migrations.update_one(
+                    {"_id": LAYOUT_MIGRATION_ID}, {"$setOnInsert": {"done": False, "owner": None, "lease_until": None}},
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                pass
+            claimed = await migrations.find_one_and_update(
+                {"_id": LAYOUT_MIGRATION_ID, "done": False,
+                 "$or": [{"lease_until": None}, {"lease_until": {"$lt": datetime.now(timezone.utc)}}]},
+                {"$set": {"owner": owner, "lease_until": lease_until()}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if claimed is None:
+                state = await migrations.find_one({"_id": LAYOUT_MIGRATION_ID})
+                if state and state.get('done'):
+                    legacy_layout_pending = False
+                    return 0
+            else:
+                moved, failed = await _move_flat_files(storage, renew, batch_size, pause)
+                await migrations.update_one(
+                    {"_id": LAYOUT_MIGRATION_ID, "owner": owner},
+                    {"$set": {"done": failed == 0, "owner": None, "lease_until": None}},
+                )
+                if moved:
+                    logger.info(f"Migrated {moved} assets to the sharded layout")
+                if not failed:
+                    legacy_layout_pending = False
+                    return moved
+                logger.warning(f"{failed} assets could not be migrated, retrying in {lease_seconds}s")
+        except Exception as e:
+            logger.error(f"Sharded layout migration failed, retrying in {lease_seconds}s: {e}")
+        await asyncio.sleep(lease_seconds)
+
+
+def create_storage(root: Path) -> StorageBackend:
+    backend = os.environ.get('STORAGE_BACKEND', 'local').lower()
+    if backend == 's3':
+        storage = S3Storage(
+            bucket=os.environ['S3_BUCKET'],
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+            region=os.environ.get('S3_REGION'),
+            access_key=os.environ.get('S3_ACCESS_KEY_ID'),
+            secret_key=os.environ.get('S3_SECRET_ACCESS_KEY'),
+            presign_expires=int(os.environ.get('S3_PRESIGN_EXPIRES', 3600)),
+            public_base_url=os.environ.get('S3_PUBLIC_BASE_URL'),
+        )
+        logger.info(f"Using S3 storage bucket {storage.bucket}")
+        return storage
+    return LocalStorage(root)
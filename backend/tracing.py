@@ -0,0 +1,128 @@
+"""Per-run span traces of generation requests.
+
+A trace is a tree of timed spans (prompt build, kie.ai calls, download, Mongo
+writes, ...) recorded with ``span()`` blocks anywhere below an active ``Trace``.
+The active span travels in a context variable, so helpers do not need a trace
+argument and record nothing when called outside a trace. Finished traces are
+stored in the ``generation_traces`` collection, and every span duration also
+feeds the ``generation_stage_duration_seconds`` histogram for aggregation.
+"""
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from metrics import GENERATION_STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Long polls can produce a few hundred spans; anything beyond this is dropped
+MAX_SPANS = 1000
+
+_current: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'attrs', 'start', 'duration', 'status', 'children')
+
+    def __init__(self, trace: 'Trace', name: str, attrs: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = 'ok'
+        self.children: List['Span'] = []
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.duration = time.perf_counter() - self.start
+        if error is not None:
+            self.status = 'error'
+            self.attrs['error'] = str(error) or type(error).__name__
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "status": self.status,
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class Trace:
+    """Root of a span tree; use as a context manager around the traced work"""
+
+    def __init__(self, name: str, **attrs):
+        self.id = str(uuid.uuid4())
+        self.started_at = datetime.now(timezone.utc)
+        self.span_count = 0
+        self.root = Span(self, name, attrs)
+        self._token = None
+
+    def __enter__(self) -> 'Trace':
+        self.root.start = time.perf_counter()
+        self._token = _current.set(self.root)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.root.finish(exc)
+        return False
+
+    def to_document(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.root.name,
+            **{k: v for k, v in self.root.attrs.items() if k in ('project_id', 'kind')},
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round((self.root.duration or 0) * 1000, 2),
+            "status": self.root.status,
+            "span_count": self.span_count,
+            "root": self.root.to_dict(self.root.start),
+        }
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Record a child span of the active span; a no-op outside a trace"""
+    parent = _current.get()
+    if parent is None or parent.trace.span_count >= MAX_SPANS:
+        yield None
+        return
+
+    child = Span(parent.trace, name, attrs)
+    parent.children.append(child)
+    parent.trace.span_count += 1
+    token = _current.set(child)
+    error = None
+    try:
+        yield child
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        child.finish(error)
+        GENERATION_STAGE_DURATION.observe(child.duration, stage=name)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+async def save_trace(db, trace: Trace):
+    try:
+        await db.generation_traces.insert_one(trace.to_document())
+    except Exception as e:
+        logger.error(f"Could not store trace {trace.id}: {e}")
@@ -0,0 +1,150 @@
+"""Streaming, size-limited, content-addressed uploads.
+
+The multipart body is parsed as it streams in and the file part is copied to a
+temp file in fixed-size chunks while a SHA-256 is computed, with the file I/O
+and hashing done in a worker thread. The caller
+stores the finished file under its digest, so identical uploads share a blob.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from python_multipart import MultipartParser
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import parse_options_header
+
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Room for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# The stored content type comes from the extension, never from the client. SVG is not
+# accepted: it can carry script that runs when the file is opened from our origin.
+UPLOAD_CONTENT_TYPES = {
+    '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp',
+    '.gif': 'image/gif', '.avif': 'image/avif', '.mp4': 'video/mp4', '.mov': 'video/quicktime', '.webm': 'video/webm',
+}
+ALLOWED_EXTENSIONS = set(UPLOAD_CONTENT_TYPES)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+def upload_extension(filename: str) -> str:
+    ext = Path(filename or '').suffix.lower()
+    return ext if ext in ALLOWED_EXTENSIONS else '.jpg'
+
+
+def upload_content_type(filename: str) -> str:
+    return UPLOAD_CONTENT_TYPES[upload_extension(filename)]
+
+
+def write_chunk(f, digest, chunk: bytes):
+    """Hash and write one chunk (blocking; run in a worker thread)"""
+    digest.update(chunk)
+    f.write(chunk)
+
+
+class _FilePart:
+    """python-multipart callbacks that keep the data of one file field and skip everything else"""
+
+    def __init__(self, field: str):
+        self.field = field.encode()
+        self.filename: Optional[str] = None
+        self.chunks: List[bytes] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._active = False
+
+    def callbacks(self) -> dict:
+        return {
+            'on_part_begin': self._headers.clear,
+            'on_header_field': lambda data, start, end: self._header_field.extend(data[start:end]),
+            'on_header_value': lambda data, start, end: self._header_value.extend(data[start:end]),
+            'on_header_end': self._header_end,
+            'on_headers_finished': self._headers_finished,
+            'on_part_data': self._part_data,
+            'on_part_end': self._part_end,
+        }
+
+    def _header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        # Only the first part with this name is the upload
+        if options.get(b'name') == self.field and b'filename' in options and self.filename is None:
+            self.filename = options[b'filename'].decode('utf-8', 'replace')
+            self._active = True
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._active:
+            self.chunks.append(data[start:end])
+
+    def _part_end(self):
+        self._active = False
+
+
+async def receive_upload(request: Request, tmp_dir: Path, field: str = 'file',
+                         max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[Path, str, int, str]:
+    """Stream a multipart/form-data file field to a temp file; returns (temp path, sha256 hex, size, filename)
+
+    The body is parsed as it arrives instead of being spooled by the form parser
+    first, so the size limit bounds disk use and each upload is written once.
+    """
+    body_limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+    content_length = request.headers.get('content-length', '')
+    if content_length.isdigit() and int(content_length) > body_limit:
+        raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or not options.get(b'boundary'):
+        raise InvalidUpload("Expected a multipart/form-data body")
+
+    part = _FilePart(field)
+    parser = MultipartParser(options[b'boundary'], part.callbacks())
+    tmp_path = tmp_dir / f"{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    received = size = 0
+    pending = bytearray()
+    f = await asyncio.to_thread(open, tmp_path, 'wb')
+    try:
+        async for chunk in request.stream():
+            # Counted on the wire as well, for chunked bodies without a Content-Length
+            received += len(chunk)
+            if received > body_limit:
+                raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+            parser.write(chunk)
+            for data in part.chunks:
+                pending += data
+            size += sum(len(data) for data in part.chunks)
+            part.chunks.clear()
+            if size > max_bytes:
+                raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+            if len(pending) >= UPLOAD_CHUNK_SIZE:
+                await asyncio.to_thread(write_chunk, f, digest, bytes(pending))
+                pending.clear()
+        parser.finalize()
+        if part.filename is None:
+            raise InvalidUpload(f"No {field!r} file in the upload")
+        if pending:
+            await asyncio.to_thread(write_chunk, f, digest, bytes(pending))
+    except BaseException as e:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(tmp_path.unlink, True)
+        if isinstance(e, MultipartParseError):
+            raise InvalidUpload(f"Malformed multipart body: {e}") from e
+        raise
+    await asyncio.to_thread(f.close)
+    return tmp_path, digest.hexdigest(), size, part.filename
@@ -0,0 +1,286 @@
+"""Background video generation jobs.
+
+``POST /api/generate-video`` only records a job in ``video_jobs`` and returns;
+a task in this process then takes it through
+
+    queued -> rendering -> downloading -> completed | failed
+
+Each step is written to the job document first, so a job interrupted by a
+restart is picked up again by ``resume_pending()``. A render already
+submitted is polled rather than submitted again, and a download continues from
+its partial file. A process only works on a job while it holds the job's
+lease (``owner``/``lease_until``), claimed atomically and renewed while the job
+runs, so several workers or instances never run the same job twice.
+Submitting a render takes a generation scheduler slot; the render is then only
+polled and holds no slot. Downloads are streamed to disk and resumed with Range
+requests across attempts, then handed to storage like any other generated asset.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict
+
+import httpx
+from pymongo import ReturnDocument
+
+from downloads import DownloadInterrupted, stream_download
+from metrics import GENERATIONS_IN_FLIGHT
+from storage import asset_key
+from video_providers import VideoProvider, VideoRender
+
+logger = logging.getLogger(__name__)
+
+VIDEO_POLL_INTERVAL = float(os.environ.get('VIDEO_POLL_INTERVAL_SECONDS', 10))
+VIDEO_RENDER_TIMEOUT = float(os.environ.get('VIDEO_RENDER_TIMEOUT_SECONDS', 15 * 60))
+VIDEO_DOWNLOAD_ATTEMPTS = int(os.environ.get('VIDEO_DOWNLOAD_ATTEMPTS', 5))
+VIDEO_MAX_BYTES = int(os.environ.get('VIDEO_MAX_BYTES', 1024 * 1024 * 1024))
+# A job whose lease is not renewed within this time is taken over by another process
+VIDEO_LEASE_SECONDS = float(os.environ.get('VIDEO_LEASE_SECONDS', 60))
+
+ACTIVE_STATES = ('queued', 'rendering', 'downloading')
+VIDEO_EXTENSIONS = {'video/mp4': '.mp4', 'video/quicktime': '.mov', 'video/webm': '.webm'}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _lease_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=VIDEO_LEASE_SECONDS)
+
+
+class VideoJobRunner:
+    def __init__(self, db, storage, provider: VideoProvider, tmp_dir: Path, scheduler=None):
+        self.db = db
+        self.storage = storage
+        self.provider = provider
+        self.tmp_dir = tmp_dir
+        self.scheduler = scheduler
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, project: dict, prompt: str, video_size: str, duration: int,
+                     priority: str = 'interactive') -> dict:
+        job = {
+            "id": str(uuid.uuid4()),
+            "project_id": project['id'],
+            "user_id": project.get('user_id'),
+            "status": "queued",
+            "provider": self.provider.name,
+            "provider_task_id": None,
+            "prompt": prompt,
+            "video_size": video_size,
+            "duration": duration,
+            "priority": priority,
+            "result_url": None,
+            "video_url": None,
+            "bytes_downloaded": 0,
+            "download_attempts": 0,
+            "error": None,
+            "owner": self.owner,
+            "lease_until": _lease_expiry(),
+            "created_at": _now(),
+            "updated_at": _now(),
+        }
+        await self.db.video_jobs.insert_one(dict(job))
+        await self.db.projects.update_one(
+            {"id": project['id']},
+            {"$set": {"status": "generating_video", "updated_at": _now()}}
+        )
+        self.start(job['id'])
+        return job
+
+    def start(self, job_id: str):
+        if job_id not in self._tasks:
+            task = asyncio.create_task(self._run(job_id))
+            self._tasks[job_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def resume_pending(self):
+        """Start active jobs whose lease has expired (their process stopped or lost track of them)"""
+        query = {
+            "status": {"$in": list(ACTIVE_STATES)},
+            "$or": [{"lease_until": None}, {"lease_until": {"$lt": datetime.now(timezone.utc)}}],
+        }
+        try:
+            async for job in self.db.video_jobs.find(query, {"_id": 0, "id": 1}):
+                if job['id'] not in self._tasks:
+                    logger.info(f"Resuming video job {job['id']}")
+                    self.start(job['id'])
+        except Exception as e:
+            logger.error(f"Could not resume video jobs: {e}")
+
+    async def resume_loop(self):
+        """Keep picking up orphaned jobs, e.g. those of an instance stopped by a rolling deploy"""
+        while True:
+            await self.resume_pending()
+            await asyncio.sleep(VIDEO_LEASE_SECONDS)
+
+    async def shutdown(self):
+        """Stop working on jobs; they keep their state and resume on the next start"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Let another instance take them over without waiting for the leases to run out
+        try:
+            await self.db.video_jobs.update_many({"owner": self.owner}, {"$set": {"lease_until": None, "owner": None}})
+        except Exception as e:
+            logger.error(f"Could not release video job leases: {e}")
+
+    async def _claim(self, job_id: str):
+        """The job document if this process now holds its lease, else None"""
+        return await self.db.video_jobs.find_one_and_update(
+            {
+                "id": job_id,
+                "status": {"$in": list(ACTIVE_STATES)},
+                "$or": [
+                    {"owner": self.owner},
+                    {"lease_until": None},
+                    {"lease_until": {"$lt": datetime.now(timezone.utc)}},
+                ],
+            },
+            {"$set": {"owner": self.owner, "lease_until": _lease_expiry()}},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+
+    async def _renew_lease(self, job_id: str, task: asyncio.Task):
+        while True:
+            await asyncio.sleep(VIDEO_LEASE_SECONDS / 3)
+            try:
+                result = await self.db.video_jobs.update_one(
+                    {"id": job_id, "owner": self.owner}, {"$set": {"lease_until": _lease_expiry()}}
+                )
+            except Exception as e:
+                logger.warning(f"Could not renew lease of video job {job_id}: {e}")
+                continue
+            if result.matched_count == 0:
+                logger.warning(f"Video job {job_id} was taken over by another process, stopping")
+                task.cancel()
+                return
+
+    async def _update(self, job_id: str, **fields):
+        await self.db.video_jobs.update_one({"id": job_id}, {"$set": {**fields, "updated_at": _now()}})
+
+    async def _finish(self, job_id: str, **fields):
+        """Final state; releases the lease"""
+        await self._update(job_id, owner=None, lease_until=None, **fields)
+
+    def _part_path(self, job_id: str) -> Path:
+        return self.tmp_dir / f"video-{job_id}.part"
+
+    async def _run(self, job_id: str):
+        job = await self._claim(job_id)
+        if not job:
+            return
+        renewer = asyncio.create_task(self._renew_lease(job_id, asyncio.current_task()))
+        try:
+            await self._execute(job)
+        finally:
+            renewer.cancel()
+
+    async def _execute(self, job: dict):
+        job_id = job['id']
+        try:
+            with GENERATIONS_IN_FLIGHT.track_inprogress(kind='video'):
+                if job['status'] in ('queued', 'rendering'):
+                    job['result_url'] = await self._render(job)
+                    await self._update(job_id, status="downloading", result_url=job['result_url'])
+                video_url, size = await self._download(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Video job {job_id} failed: {e}")
+            await self._finish(job_id, status="failed", error=str(e) or type(e).__name__)
+            await self.db.projects.update_one(
+                {"id": job['project_id']},
+                {"$set": {"status": "failed", "updated_at": _now()}}
+            )
+            await asyncio.to_thread(self._part_path(job_id).unlink, True)
+            return
+
+        await self._finish(job_id, status="completed", video_url=video_url, bytes_downloaded=size)
+        await self.db.projects.update_one(
+            {"id": job['project_id']},
+            {
+                "$push": {"generated_videos": video_url},
+                "$set": {"status": "completed", "updated_at": _now()}
+            }
+        )
+        logger.info(f"Video job {job_id} completed: {video_url} ({size} bytes)")
+
+    async def _render(self, job: dict) -> str:
+        task_id = job.get('provider_task_id') or await self._submit(job)
+        return await self._poll(job, task_id)
+
+    async def _submit(self, job: dict) -> str:
+        render = VideoRender(job['prompt'], job['video_size'], job['duration'])
+        if self.scheduler is None:
+            task_id = await self.provider.submit(render)
+        else:
+            # Only the submission takes a slot: a render runs for minutes upstream and must not
+            # hold image generation's concurrency while it is polled
+            async with self.scheduler.slot(job.get('priority', 'interactive'), job.get('user_id') or job['project_id']):
+                task_id = await self.provider.submit(render)
+        job['provider_task_id'] = task_id
+        job['rendering_since'] = _now()
+        await self._update(job['id'], status="rendering", provider_task_id=task_id, rendering_since=job['rendering_since'])
+        return task_id
+
+    async def _poll(self, job: dict, task_id: str) -> str:
+        started = datetime.fromisoformat(job.get('rendering_since') or _now())
+        deadline = time.monotonic() + VIDEO_RENDER_TIMEOUT - (datetime.now(timezone.utc) - started).total_seconds()
+
+        while time.monotonic() < deadline:
+            try:
+                status = await self.provider.poll(task_id)
+            except (httpx.HTTPError, ValueError) as e:
+                # The render keeps running (and billing) upstream; only a reported failure ends the job
+                logger.warning(f"Polling video task {task_id} failed, retrying: {e}")
+                await asyncio.sleep(VIDEO_POLL_INTERVAL)
+                continue
+            if status.state == "succeeded":
+                return status.result_url
+            if status.state == "failed":
+                raise RuntimeError(status.error or "Render failed")
+            await asyncio.sleep(VIDEO_POLL_INTERVAL)
+        raise TimeoutError(f"Render did not finish within {VIDEO_RENDER_TIMEOUT:.0f}s")
+
+    async def _download(self, job: dict):
+        part = self._part_path(job['id'])
+        attempts = job.get('download_attempts', 0)
+        async with self.provider.download_client() as client:
+            while True:
+                attempts += 1
+                await self._update(job['id'], download_attempts=attempts)
+                try:
+                    result = await stream_download(
+                        client, job['result_url'], part,
+                        allowed_prefixes=('video/',), max_bytes=VIDEO_MAX_BYTES, keep_partial=True,
+                    )
+                    break
+                except DownloadInterrupted as e:
+                    size = (await asyncio.to_thread(part.stat)).st_size if part.exists() else 0
+                    await self._update(job['id'], bytes_downloaded=size)
+                    if attempts >= VIDEO_DOWNLOAD_ATTEMPTS:
+                        raise
+                    logger.info(f"Video job {job['id']} download interrupted at {size} bytes ({e}), resuming")
+                    await asyncio.sleep(min(60, 2 ** attempts))
+
+        ext = VIDEO_EXTENSIONS.get(result.content_type, '.mp4')
+        filename = f"{job['project_id']}_{job['id']}{ext}"
+        await self.storage.put_file(asset_key('generated', filename), result.path, result.content_type)
+        await asyncio.to_thread(result.path.unlink, True)
+        return f"/api/generated/{filename}", result.size
+
+
+def public_job(job: dict) -> dict:
+    """Job fields clients may see"""
+    return {k: job.get(k) for k in (
+        "id", "project_id", "status", "video_url", "bytes_downloaded", "error", "created_at", "updated_at",
+    )}
@@ -0,0 +1,184 @@
+"""Video generation backends used by the video job pipeline.
+
+A provider starts a render, reports its state when polled and hands out the
+HTTP client the finished file is downloaded with. ``KieVideoProvider`` talks to
+kie.ai's job API (the same createTask/recordInfo flow as image generation);
+``FakeVideoProvider`` renders nothing and serves a synthetic MP4 from an
+in-process transport, so the whole pipeline can run offline. It can also drop
+the first download part-way to exercise resume.
+"""
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import httpx
+
+from metrics import KIE_REQUEST_DURATION, KIE_TASKS, timed
+
+
+@dataclass
+class VideoRender:
+    prompt: str
+    video_size: str = "portrait"
+    duration: int = 8
+
+
+@dataclass
+class RenderStatus:
+    state: str  # "pending", "succeeded" or "failed"
+    result_url: Optional[str] = None
+    error: Optional[str] = None
+
+
+class VideoProvider(ABC):
+    name = "base"
+
+    @abstractmethod
+    async def submit(self, render: VideoRender) -> str:
+        """Start a render; returns the provider's task id"""
+        ...
+
+    @abstractmethod
+    async def poll(self, task_id: str) -> RenderStatus:
+        ...
+
+    def download_client(self) -> httpx.AsyncClient:
+        """Client for fetching the finished file from RenderStatus.result_url"""
+        return httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=120.0), follow_redirects=True)
+
+
+class KieVideoProvider(VideoProvider):
+    name = "kie"
+    CREATE_URL = "https://api.kie.ai/api/v1/jobs/createTask"
+    RECORD_URL = "https://api.kie.ai/api/v1/jobs/recordInfo"
+    ASPECT_RATIOS = {"portrait": "portrait", "landscape": "landscape", "square": "portrait"}
+
+    def __init__(self, api_key: str, model: str):
+        self.api_key = api_key
+        self.model = model
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    async def submit(self, render: VideoRender) -> str:
+        payload = {
+            "model": self.model,
+            "input": {
+                "prompt": render.prompt,
+                "aspect_ratio": self.ASPECT_RATIOS.get(render.video_size, "portrait"),
+                "n_frames": "10" if render.duration <= 10 else "15",
+            },
+        }
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            with timed(KIE_REQUEST_DURATION, operation='video_create'):
+                response = await client.post(self.CREATE_URL, json=payload, headers=self.headers)
+        result = response.json() if response.status_code == 200 else {}
+        task_id = (result.get("data") or {}).get("taskId") if result.get("code") == 200 else None
+        if not task_id:
+            KIE_TASKS.inc(outcome='rejected')
+            raise RuntimeError(f"Video task rejected: {result.get('msg') or response.text[:200]}")
+        return task_id
+
+    async def poll(self, task_id: str) -> RenderStatus:
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            with timed(KIE_REQUEST_DURATION, operation='video_poll'):
+                response = await client.get(self.RECORD_URL, params={"taskId": task_id}, headers=self.headers)
+        if response.status_code != 200 or response.json().get("code") != 200:
+            return RenderStatus("pending")
+        data = response.json().get("data") or {}
+        if data.get("state") == "success":
+            urls = json.loads(data.get("resultJson") or "{}").get("resultUrls") or []
+            if urls:
+                KIE_TASKS.inc(outcome='success')
+                return RenderStatus("succeeded", result_url=urls[0])
+            return RenderStatus("failed", error="Render finished without a result URL")
+        if data.get("state") in ("fail", "failed"):
+            KIE_TASKS.inc(outcome='failed')
+            return RenderStatus("failed", error=data.get("failMsg") or "Render failed")
+        return RenderStatus("pending")
+
+
+def fake_mp4(size: int) -> bytes:
+    """Deterministic bytes that sniff as MP4 (an ftyp box followed by filler)"""
+    header = b'\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2'
+    filler = bytes(range(256)) * (size // 256 + 1)
+    return (header + filler)[:size]
+
+
+class _DroppingStream(httpx.AsyncByteStream):
+    def __init__(self, body: bytes, drop_after: Optional[int]):
+        self.body = body
+        self.drop_after = drop_after
+
+    async def __aiter__(self):
+        chunk = 64 * 1024
+        limit = len(self.body) if self.drop_after is None else min(self.drop_after, len(self.body))
+        for start in range(0, limit, chunk):
+            yield self.body[start:min(start + chunk, limit)]
+        if limit < len(self.body):
+            raise httpx.ReadError("Connection dropped by fake provider")
+
+
+class FakeVideoProvider(VideoProvider):
+    name = "fake"
+
+    def __init__(self, render_seconds: float = 3.0, video_bytes: int = 8 * 1024 * 1024,
+                 drop_first_download_at: Optional[int] = None):
+        self.render_seconds = render_seconds
+        self.video_bytes = video_bytes
+        self.drop_first_download_at = drop_first_download_at
+        self.tasks: Dict[str, float] = {}
+        self.downloads = 0
+        self._body = fake_mp4(video_bytes)
+
+    async def submit(self, render: VideoRender) -> str:
+        task_id = uuid.uuid4().hex
+        self.tasks[task_id] = time.monotonic() + self.render_seconds
+        return task_id
+
+    async def poll(self, task_id: str) -> RenderStatus:
+        ready_at = self.tasks.get(task_id)
+        if ready_at is None:
+            return RenderStatus("failed", error="Unknown task")
+        if time.monotonic() < ready_at:
+            return RenderStatus("pending")
+        return RenderStatus("succeeded", result_url=f"https://fake-video.local/{task_id}.mp4")
+
+    def _serve(self, request: httpx.Request) -> httpx.Response:
+        self.downloads += 1
+        drop = self.drop_first_download_at if self.downloads == 1 else None
+        size = len(self._body)
+        range_header = request.headers.get('range', '')
+        if range_header.startswith('bytes='):
+            start = int(range_header[6:].split('-')[0])
+            if start >= size:
+                return httpx.Response(416, headers={"Content-Range": f"bytes */{size}"})
+            return httpx.Response(206, stream=_DroppingStream(self._body[start:], drop), headers={
+                "Content-Type": "video/mp4", "Content-Range": f"bytes {start}-{size - 1}/{size}",
+                "Content-Length": str(size - start),
+            })
+        return httpx.Response(200, stream=_DroppingStream(self._body, drop), headers={
+            "Content-Type": "video/mp4", "Content-Length": str(size), "Accept-Ranges": "bytes",
+        })
+
+    def download_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self._serve))
+
+
+def create_video_provider() -> Optional[VideoProvider]:
+    """Provider selected by VIDEO_PROVIDER, or None when it is not configured"""
+    backend = os.environ.get('VIDEO_PROVIDER', 'kie').lower()
+    if backend == 'fake':
+        return FakeVideoProvider(
+            render_seconds=float(os.environ.get('FAKE_VIDEO_RENDER_SECONDS', 3)),
+            video_bytes=int(os.environ.get('FAKE_VIDEO_BYTES', 8 * 1024 * 1024)),
+        )
+    api_key = os.environ.get('KIE_AI_API_KEY')
+    if backend == 'kie' and api_key:
+        return KieVideoProvider(api_key, os.environ.get('KIE_VIDEO_MODEL', 'sora-2-text-to-video'))
+    return None
@@ -0,0 +1,136 @@
+"""Write-behind batching of ``$set``/``$push`` updates keyed by document id.
+
+Updates queued with ``update()`` are merged per document (later ``$set``
+values win, ``$push`` items are appended in order) and written together after
+``window`` seconds as one unordered ``bulk_write`` of ``UpdateOne`` operations,
+so a burst of small writes from concurrent generations costs one round trip.
+Callers that need their writes on disk (a run finishing, shutdown) await
+``flush()``; writes of one document are never reordered. A batch whose write
+fails (the database unreachable) goes back into the queue and is retried. An
+operation the server rejects, or one that can no longer be merged in order with
+newer writes, is dropped and its error is raised by the next ``flush(key)``.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from metrics import COALESCED_UPDATES, COALESCER_FLUSHES
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_OPERATORS = ('$set', '$push')
+
+
+def _overlaps(field: str, fields) -> bool:
+    return any(field == other or field.startswith(other + '.') or other.startswith(field + '.') for other in fields)
+
+
+class _Pending:
+    __slots__ = ('set', 'push')
+
+    def __init__(self):
+        self.set: Dict[str, Any] = {}
+        self.push: Dict[str, List[Any]] = {}
+
+    def conflicts(self, update: dict) -> bool:
+        """True if merging update would change the meaning of either write"""
+        for field in update.get('$set', {}):
+            if _overlaps(field, self.push) or (field not in self.set and _overlaps(field, self.set)):
+                return True
+        return any(_overlaps(field, self.set) for field in update.get('$push', {}))
+
+    def merge(self, update: dict):
+        self.set.update(update.get('$set', {}))
+        for field, value in update.get('$push', {}).items():
+            items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+            self.push.setdefault(field, []).extend(items)
+
+    def to_update(self) -> dict:
+        update = {}
+        if self.set:
+            update['$set'] = self.set
+        if self.push:
+            update['$push'] = {field: {'$each': items} for field, items in self.push.items()}
+        return update
+
+
+class WriteCoalescer:
+    def __init__(self, collection, key_field: str = 'id', window: float = 0.2):
+        self.collection = collection
+        self.key_field = key_field
+        self.window = window
+        self._pending: Dict[str, _Pending] = {}
+        self._errors: Dict[str, Exception] = {}
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def update(self, key: str, update: dict):
+        """Queue an update of the document whose key_field is key"""
+        unsupported = set(update) - set(SUPPORTED_OPERATORS)
+        if unsupported or any(isinstance(v, dict) and set(v) - {'$each'} for v in update.get('$push', {}).values()):
+            raise ValueError(f"Only plain $set and $push updates can be coalesced, got {update}")
+        pending = self._pending.get(key)
+        if pending is not None and pending.conflicts(update):
+            await self.flush(key)
+        self._pending.setdefault(key, _Pending()).merge(update)
+        COALESCED_UPDATES.inc()
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Write-behind flush failed, will retry: {e}")
+            self._timer = asyncio.create_task(self._flush_later())
+
+    def _restore(self, batch: Dict[str, _Pending], error: Exception):
+        """Put a failed batch back in front of anything queued since"""
+        for key, pending in batch.items():
+            newer = self._pending.get(key)
+            if newer is not None:
+                if pending.conflicts(newer.to_update()):
+                    self._errors[key] = error
+                    continue
+                pending.merge(newer.to_update())
+            self._pending[key] = pending
+
+    async def flush(self, key: Optional[str] = None):
+        """Write pending updates now (all of them, or only key's)"""
+        async with self._lock:
+            if key is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {key: self._pending.pop(key)} if key in self._pending else {}
+            if batch:
+                keys = list(batch)
+                operations = [UpdateOne({self.key_field: k}, batch[k].to_update()) for k in keys]
+                COALESCER_FLUSHES.inc()
+                try:
+                    await self.collection.bulk_write(operations, ordered=False)
+                except BulkWriteError as e:
+                    # The other operations were applied, and the server rejected these ones
+                    # outright, so retrying them would not help
+                    for error in e.details.get('writeErrors', []):
+                        self._errors[keys[error['index']]] = e
+                    raise
+                except Exception as e:
+                    self._restore(batch, e)
+                    raise
+            if key is not None and key in self._errors:
+                raise self._errors.pop(key)
+
+    async def close(self):
+        """Flush everything still queued (at shutdown)"""
+        if self._timer is not None:
+            self._timer.cancel()
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Write-behind flush at shutdown failed, updates lost: {e}")
+        for key, error in self._errors.items():
+            logger.error(f"Write-behind updates of {key} were lost: {error}")
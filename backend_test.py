@@ -128,6 +128,29 @@ class NeuroAdAPITester:
             self.log_test("GET Marketing Tips", False, f"Error: {str(e)}")
             return False
 
+    def test_catalog_etag(self):
+        """Test catalog endpoints return ETag and honour If-None-Match"""
+        try:
+            response = requests.get(f"{self.base_url}/strategies?lang=ar", timeout=10)
+            etag = response.headers.get('ETag')
+            success = response.status_code == 200 and bool(etag)
+            details = f"Status: {response.status_code}, ETag: {'Present' if etag else 'Missing'}"
+            
+            if success:
+                strategies = response.json()
+                localized = all('name_en' not in s and 'name_ar' in s for s in strategies)
+                details += f", Localized: {localized}"
+                
+                revalidate = requests.get(f"{self.base_url}/strategies?lang=ar", headers={"If-None-Match": etag}, timeout=10)
+                details += f", Revalidate: {revalidate.status_code}"
+                success = localized and revalidate.status_code == 304
+            
+            self.log_test("GET Catalog ETag / 304", success, details)
+            return success
+        except Exception as e:
+            self.log_test("GET Catalog ETag / 304", False, f"Error: {str(e)}")
+            return False
+
     def test_scrape_website(self):
         """Test POST /scrape endpoint - Enhanced with brand analysis"""
         try:
@@ -375,6 +398,7 @@ class NeuroAdAPITester:
         self.test_get_strategies()
         self.test_get_platforms()
         self.test_get_marketing_tips()
+        self.test_catalog_etag()
         
         # Enhanced scraping test with brand analysis
         self.test_scrape_website()
@@ -509,7 +509,7 @@ export default function NewProjectPage() {
                 <div className="image-preview-grid">
                   {uploadedImages.map((url, index) => (
                     <div key={index} className="relative aspect-square rounded-xl overflow-hidden bg-muted">
-                      <img src={`${process.env.REACT_APP_BACKEND_URL}${url}`} alt={`Uploaded ${index + 1}`} className="w-full h-full object-cover" />
+                      <img src={`${process.env.REACT_APP_BACKEND_URL}${url}?w=320&format=auto`} alt={`Uploaded ${index + 1}`} className="w-full h-full object-cover" />
                       <button
                         onClick={() => removeImage(index)}
                         className="absolute top-2 end-2 p-1.5 rounded-full bg-destructive text-destructive-foreground"
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate, Link } from 'react-router-dom';
 import { useLanguage } from '../contexts/LanguageContext';
 import { Button } from '../components/ui/button';
@@ -27,6 +27,10 @@ import {
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
+// Video job polling: every 5 s, giving up after 20 minutes (the backend render timeout is 15)
+const VIDEO_POLL_INTERVAL_MS = 5000;
+const VIDEO_POLL_MAX_ATTEMPTS = 240;
+
 export default function ProjectDetailPage() {
   const { id } = useParams();
   const navigate = useNavigate();
@@ -45,6 +49,9 @@ export default function ProjectDetailPage() {
   const [marketingTips, setMarketingTips] = useState([]);
   const [copiedCaption, setCopiedCaption] = useState(false);
   const [showMockup, setShowMockup] = useState('instagram');
+  const unmountedRef = useRef(false);
+  
+  useEffect(() => () => { unmountedRef.current = true; }, []);
   
   useEffect(() => {
     const fetchData = async () => {
@@ -102,15 +109,35 @@ export default function ProjectDetailPage() {
         custom_instructions: customInstructions || null,
       });
       
-      if (response.data.success) {
-        const projectRes = await axios.get(`${API}/projects/${id}`);
-        setProject(projectRes.data);
-        toast.success(language === 'ar' ? 'تم توليد الفيديو بنجاح' : 'Video generated successfully');
+      // Rendering runs as a background job; poll it until it finishes
+      let job = response.data;
+      for (let attempt = 0; job.status !== 'completed' && job.status !== 'failed'; attempt++) {
+        if (attempt >= VIDEO_POLL_MAX_ATTEMPTS) {
+          throw new Error('Video generation timed out');
+        }
+        await new Promise((resolve) => setTimeout(resolve, VIDEO_POLL_INTERVAL_MS));
+        if (unmountedRef.current) {
+          return;
+        }
+        job = (await axios.get(`${process.env.REACT_APP_BACKEND_URL}${response.data.status_url}`)).data;
+      }
+      if (unmountedRef.current) {
+        return;
+      }
+      if (job.status !== 'completed') {
+        throw new Error(job.error || 'Video generation failed');
       }
+      const projectRes = await axios.get(`${API}/projects/${id}`);
+      setProject(projectRes.data);
+      toast.success(language === 'ar' ? 'تم توليد الفيديو بنجاح' : 'Video generated successfully');
     } catch (error) {
-      toast.error(language === 'ar' ? 'فشل توليد الفيديو' : 'Failed to generate video');
+      if (!unmountedRef.current) {
+        toast.error(language === 'ar' ? 'فشل توليد الفيديو' : 'Failed to generate video');
+      }
     } finally {
-      setIsGeneratingVideo(false);
+      if (!unmountedRef.current) {
+        setIsGeneratingVideo(false);
+      }
     }
   };
   
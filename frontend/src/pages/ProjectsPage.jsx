@@ -164,13 +164,13 @@ export default function ProjectsPage() {
                 <div className="aspect-video bg-muted relative">
                   {project.generated_images?.length > 0 ? (
                     <img
-                      src={`${process.env.REACT_APP_BACKEND_URL}${project.generated_images[0]}`}
+                      src={`${process.env.REACT_APP_BACKEND_URL}${project.generated_images[0]}?w=640&format=auto`}
                       alt={project.company_name}
                       className="w-full h-full object-cover"
                     />
                   ) : project.images?.length > 0 ? (
                     <img
-                      src={project.images[0].startsWith('http') ? project.images[0] : `${process.env.REACT_APP_BACKEND_URL}${project.images[0]}`}
+                      src={project.images[0].startsWith('http') ? project.images[0] : `${process.env.REACT_APP_BACKEND_URL}${project.images[0]}?w=640&format=auto`}
                       alt={project.company_name}
                       className="w-full h-full object-cover"
                     />